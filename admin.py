@@ -1,24 +1,10 @@
 import streamlit as st
-import firebase_admin
-from firebase_admin import credentials, db
 
-if not firebase_admin._apps:
-    cred = credentials.Certificate({
-        "type": st.secrets["firebase"]["type"],
-        "project_id": st.secrets["firebase"]["project_id"],
-        "private_key_id": st.secrets["firebase"]["private_key_id"],
-        "private_key": st.secrets["firebase"]["private_key"],
-        "client_email": st.secrets["firebase"]["client_email"],
-        "client_id": st.secrets["firebase"]["client_id"],
-        "auth_uri": st.secrets["firebase"]["auth_uri"],
-        "token_uri": st.secrets["firebase"]["token_uri"],
-        "auth_provider_x509_cert_url": st.secrets["firebase"]["auth_provider_x509_cert_url"],
-        "client_x509_cert_url": st.secrets["firebase"]["client_x509_cert_url"],
-        "universe_domain": st.secrets["firebase"]["universe_domain"]
-    })
-    firebase_admin.initialize_app(cred, {
-        'databaseURL': "https://cvv-smartexam-v2-default-rtdb.asia-southeast1.firebasedatabase.app"
-    })
+import catalog
+import credentials
+import question_cache
+from firebase_config import db
+
 # ✅ Streamlit page config
 st.set_page_config(page_title="CVV SmartExam - Admin Panel", page_icon="🛡", layout="centered")
 st.title("🛡 CVV SmartExam - Admin Panel")
@@ -32,13 +18,17 @@ if admin_pass == "nohs126":  # password
     st.header("👩‍🏫 All Registered Teachers")
     teachers = db.reference("teachers").get()
     if teachers:
+        if any(not credentials.is_hashed(d) for d in teachers.values()):
+            st.warning("🔓 Some teacher passwords are still stored in plain text.")
+            if st.button("🔐 Hash All Stored Passwords"):
+                st.success(f"✅ Rehashed {credentials.migrate_all()} passwords")
         for name, details in teachers.items():
             with st.expander(f"🧑‍🏫 {name}"):
-                st.write(f"Current Password: {details.get('password', 'Not set')}")
-                new_pass = st.text_input(f"Reset password for {name}", key=f"pass_{name}")
+                st.write("Password: 🔒 hashed" if credentials.is_hashed(details) else "Password: 🔓 plain text")
+                new_pass = st.text_input(f"Reset password for {name}", type="password", key=f"pass_{name}")
                 if st.button(f"Update Password for {name}", key=f"btn_{name}"):
                     if new_pass:
-                        db.reference(f"teachers/{name}/password").set(new_pass)
+                        credentials.set_password(name, new_pass)
                         st.success(f"✅ Password updated for {name}")
                     else:
                         st.warning("⚠ Please enter a new password before updating.")
@@ -53,12 +43,10 @@ if admin_pass == "nohs126":  # password
     first_time_pass = st.text_input("🔑 Set Initial Password", type="password")
     if st.button("Add Teacher"):
         if new_teacher and first_time_pass:
-            teacher_ref = db.reference(f"teachers/{new_teacher}")
-            if teacher_ref.get():
-                st.warning("⚠ This teacher already exists.")
-            else:
-                teacher_ref.set({"password": first_time_pass})
+            if credentials.create_teacher(new_teacher, first_time_pass):
                 st.success(f"✅ Teacher '{new_teacher}' added successfully!")
+            else:
+                st.warning("⚠ This teacher already exists.")
         else:
             st.warning("⚠ Please enter both name and password.")
 
@@ -69,39 +57,52 @@ if admin_pass == "nohs126":  # password
     teacher_names = list(teachers.keys()) if teachers else []
     teacher_to_remove = st.selectbox("Select teacher to remove", teacher_names)
     if st.button("Remove Selected Teacher"):
-        db.reference(f"teachers/{teacher_to_remove}").delete()
+        credentials.remove_teacher(teacher_to_remove)
         st.error(f"🚫 Teacher '{teacher_to_remove}' removed.")
 
     st.markdown("---")
 
-    # 🏫 View/Delete Batches & Subjects
+    # 🏫 View/Delete Batches & Subjects (each level read only once it is picked)
     st.header("🏫 Batches & Subjects")
-    batches = db.reference("batches").get()
-    if batches:
-        for batch_name, subjects in batches.items():
-            with st.expander(f"🎓 {batch_name}"):
-                for subject_name, subject_data in subjects.items():
-                    st.subheader(f"📚 {subject_name}")
+    batch_names = catalog.list_batches()
+    if batch_names:
+        batch_name = st.selectbox("🎓 Batch", batch_names, index=None, placeholder="Pick a batch")
+        if batch_name:
+            subjects = catalog.list_subjects(batch_name)
+            counts = catalog.question_counts(batch_name)
+            if any(s not in counts for s in subjects) and st.button("🔄 Recount Questions"):
+                counts = catalog.recount(batch_name)
+            for subject_name in subjects:
+                st.markdown(f"📚 {subject_name} — {counts.get(subject_name, '?')} questions")
 
-                    # Show questions
-                    questions = subject_data.get("questions", {})
-                    if questions:
-                        for qid, qdata in questions.items():
-                            st.markdown(f"- Q: {qdata.get('question', 'N/A')}")
-                            st.markdown(f"✅ Answer: {qdata.get('answer', 'N/A')}")
-                            if st.button("❌ Delete this question", key=f"{qid}{batch_name}{subject_name}"):
-                                db.reference(f"batches/{batch_name}/{subject_name}/questions/{qid}").delete()
-                                st.warning("❌ Question deleted. Please refresh to see updates.")
-                    else:
-                        st.write("No questions found in this subject.")
+            subject_name = st.selectbox("📚 Subject", subjects, index=None, placeholder="Pick a subject")
+            if subject_name:
+                questions = question_cache.get_questions(batch_name, subject_name)
+                search = st.text_input("🔎 Search questions").strip().lower()
+                matches = [(qid, q) for qid, q in questions.items()
+                           if not search or search in str(q.get('question', '')).lower()]
+                page = st.number_input("Page", min_value=1, max_value=max(1, -(-len(matches) // 20)), value=1)
+
+                # Show questions
+                if matches:
+                    for qid, qdata in matches[(page - 1) * 20:page * 20]:
+                        st.markdown(f"- Q: {qdata.get('question', 'N/A')}")
+                        st.markdown(f"✅ Answer: {qdata.get('answer', 'N/A')}")
+                        if st.button("❌ Delete this question", key=f"{qid}{batch_name}{subject_name}"):
+                            db.reference(f"batches/{batch_name}/{subject_name}/questions/{qid}").delete()
+                            question_cache.bump_version(batch_name, subject_name, added=-1)
+                            st.warning("❌ Question deleted. Please refresh to see updates.")
+                else:
+                    st.write("No questions found in this subject.")
 
-                    if st.button(f"🗑 Delete Subject '{subject_name}'", key=f"del_subject_{batch_name}_{subject_name}"):
-                        db.reference(f"batches/{batch_name}/{subject_name}").delete()
-                        st.warning(f"🗑 Subject '{subject_name}' deleted from batch '{batch_name}'.")
+                if st.button(f"🗑 Delete Subject '{subject_name}'", key=f"del_subject_{batch_name}_{subject_name}"):
+                    catalog.delete_subject(batch_name, subject_name)
+                    question_cache.invalidate(batch_name, subject_name)
+                    st.warning(f"🗑 Subject '{subject_name}' deleted from batch '{batch_name}'.")
 
-                if st.button(f"🗑 Delete Entire Batch '{batch_name}'", key=f"del_batch_{batch_name}"):
-                    db.reference(f"batches/{batch_name}").delete()
-                    st.error(f"🚫 Batch '{batch_name}' deleted completely.")
+            if st.button(f"🗑 Delete Entire Batch '{batch_name}'", key=f"del_batch_{batch_name}"):
+                catalog.delete_batch(batch_name)
+                st.error(f"🚫 Batch '{batch_name}' deleted completely.")
     else:
         st.info("ℹ No batches created yet.")
 
@@ -0,0 +1,182 @@
+import logging
+import threading
+import time
+
+import settings
+from firebase_config import db
+
+# ----------------- Answer Autosave -----------------
+# Drafts live at drafts/{batch}/{subject}/{name} as
+#   {"order": [qid, ...], "answers": {qid: option}, "updated": epoch_seconds,
+#    "paper": {version?, seed?, count?, ...},  (published or sampled papers)
+#    "attempt_id": "...",  (see offline.py)
+#    "student": display name, "subject": display name, "started": epoch_seconds}
+# Sessions hand only the answers that changed since their last hand-off to a
+# process-wide buffer. One background thread flushes the buffer every
+# `interval_seconds` as a single multi-path update for every student in the
+# process, so rapid clicks collapse into one write per interval.
+# If that write fails it is retried one student at a time, so one rejected
+# draft can't hold up the others; a student's changes are dropped after
+# max_retries failed flushes. A discarded (submitted) draft is remembered for
+# an hour so late changes from another tab don't bring it back.
+
+log = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "enabled": True,
+    "interval_seconds": 5,
+    "max_retries": 5,
+}
+DISCARDED_SECONDS = 3600
+
+
+def draft_path(batch: str, subject: str, name: str) -> str:
+    return f"drafts/{batch}/{subject}/{name}"
+
+
+def _ancestors(path: str):
+    parts = path.split("/")
+    return ["/".join(parts[:i]) for i in range(1, len(parts))]
+
+
+def _draft_of(path: str) -> str:
+    """The draft a buffered path belongs to (drafts/{b}/{s}/{n})."""
+    return "/".join(path.split("/")[:4])
+
+
+class AutosaveBuffer:
+    def __init__(self, interval_seconds=5, max_retries=5):
+        self.interval_seconds = interval_seconds
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._pending = {}    # path -> value (None deletes)
+        self._discarded = {}  # draft path -> when it was discarded
+        self._failures = {}   # draft path -> failed flushes in a row
+        self._thread = threading.Thread(target=self._run, daemon=True, name="autosave")
+        self._thread.start()
+
+    def put(self, batch, subject, name, delta: dict):
+        base = draft_path(batch, subject, name)
+        with self._lock:
+            if base in self._discarded:
+                return  # exam already submitted
+            for qid, answer in delta.items():
+                self._pending[f"{base}/answers/{qid}"] = answer
+            self._pending[f"{base}/updated"] = int(time.time())
+
+    def discard(self, batch, subject, name):
+        """Drop unsaved deltas and delete the draft on the next flush."""
+        base = draft_path(batch, subject, name)
+        with self._lock:
+            for path in [p for p in self._pending if p.startswith(base + "/")]:
+                del self._pending[path]
+            self._pending[base] = None
+            self._discarded[base] = time.time()
+
+    def restart(self, batch, subject, name):
+        """A new attempt begins at this draft: accept its changes again."""
+        with self._lock:
+            self._discarded.pop(draft_path(batch, subject, name), None)
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            cutoff = time.time() - DISCARDED_SECONDS
+            for base in [b for b, at in self._discarded.items() if at < cutoff]:
+                del self._discarded[base]
+        if not batch:
+            return
+        try:
+            db.reference().update(batch)
+        except Exception:
+            groups = {}
+            for path, value in batch.items():
+                groups.setdefault(_draft_of(path), {})[path] = value
+            if len(groups) == 1:
+                self._failed(*groups.popitem())
+                return
+            for base, updates in groups.items():
+                try:
+                    db.reference().update(updates)
+                except Exception:
+                    self._failed(base, updates)
+                else:
+                    self._failures.pop(base, None)
+        else:
+            for base in {_draft_of(path) for path in batch}:
+                self._failures.pop(base, None)
+
+    def _failed(self, base, updates):
+        """Put one student's failed changes back for the next tick, up to max_retries."""
+        failures = self._failures.get(base, 0) + 1
+        if failures > self.max_retries:
+            self._failures.pop(base, None)
+            log.error("autosave for %s dropped after %d failed flushes", base, failures,
+                      exc_info=True)
+            return
+        self._failures[base] = failures
+        with self._lock:
+            if base in self._discarded and updates.get(base, 0) is not None:
+                return  # the draft was discarded meanwhile
+            for path, value in updates.items():
+                if path in self._pending:
+                    continue  # something newer arrived meanwhile
+                if any(a in self._pending for a in _ancestors(path)):
+                    continue  # the draft was discarded meanwhile
+                self._pending[path] = value
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval_seconds)
+            self.flush()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def config() -> dict:
+    return settings.section("autosave", DEFAULTS)
+
+
+def get_buffer() -> AutosaveBuffer:
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                cfg = config()
+                _buffer = AutosaveBuffer(cfg["interval_seconds"], cfg["max_retries"])
+    return _buffer
+
+
+def load_draft(batch: str, subject: str, name: str):
+    return db.reference(draft_path(batch, subject, name)).get()
+
+
+def start_draft(batch: str, subject: str, name: str, order: list, paper=None, attempt_id=None,
+                student=None, subject_label=None, started=None):
+    """Record the shuffled order (and how a sampled paper was drawn) once, at the start.
+
+    `started` is the server's clock, which timed exams (exam_schedule.py) count from.
+    """
+    now = int(time.time())
+    get_buffer().restart(batch, subject, name)
+    db.reference(draft_path(batch, subject, name)).set({
+        "order": order,
+        "paper": paper,
+        "attempt_id": attempt_id,
+        "student": student,
+        "subject": subject_label,
+        "started": int(started or now),
+        "updated": now
+    })
+
+
+def save_delta(batch: str, subject: str, name: str, delta: dict):
+    """Queue changed answers {qid: option} for the next flush."""
+    if delta:
+        get_buffer().put(batch, subject, name, delta)
+
+
+def discard(batch: str, subject: str, name: str):
+    get_buffer().discard(batch, subject, name)
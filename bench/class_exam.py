@@ -0,0 +1,213 @@
+"""A whole class sits an exam at once, driven headlessly through main.py.
+
+Each simulated student is a Streamlit AppTest session against the in-memory
+backend (with injectable per-call latency): pick Student, enter a name,
+start, answer every question, submit. Reports rerun latency percentiles,
+RTDB calls per student and memory per session as JSON so runs can be
+compared across commits. Exams in progress live in exam_state's registry,
+not in session state, so a session's bytes are its session state plus its
+ExamSession; the Paper those share is reported once (shared_paper_bytes).
+
+    python bench/class_exam.py --students 50 --questions 20 --latency 0.05 --out bench.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+import exam_state  # noqa: E402
+import firebase_config  # noqa: E402
+from memory_backend import MemoryBackend  # noqa: E402
+
+MAIN = os.path.join(ROOT, "main.py")
+
+# AppTest swaps a process-global mock Runtime in and out around every run, so
+# two runs can't overlap. Students still interleave step by step, sharing the
+# backend, caches, autosave buffer and submission queue like real sessions.
+_RUN_LOCK = threading.Lock()
+
+
+def make_bank(n_questions):
+    return {f"q{i:04d}": {"question": f"Question {i}: what is {i} mod 4?",
+                          "options": ["0", "1", "2", "3"],
+                          "answer": str(i % 4)} for i in range(n_questions)}
+
+
+def deep_sizeof(obj, seen=None):
+    """Approximate bytes reachable from obj (objects counted once per call)."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(v, seen) for v in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    elif hasattr(type(obj), "__slots__"):
+        size += sum(deep_sizeof(getattr(obj, slot), seen) for slot in type(obj).__slots__
+                    if hasattr(obj, slot))
+    return size
+
+
+def exam_sessions(session_id):
+    """The ExamSessions exam_state holds for one browser session."""
+    with exam_state._exams_lock:
+        return [e for (sid, _), e in exam_state._exams.items() if sid == session_id]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0.0
+
+
+class Student:
+    def __init__(self, index, batch, subject, timeout):
+        self.name = f"Student {index:04d}"
+        self.batch = batch
+        self.subject = subject
+        self.timeout = timeout
+        self.reruns = []
+        self.session_bytes = 0
+        self.paper = None
+        self.at = AppTest.from_file(MAIN, default_timeout=timeout)
+
+    def _run(self, step):
+        with _RUN_LOCK:
+            t0 = time.perf_counter()
+            step.run()
+            self.reruns.append(time.perf_counter() - t0)
+        if self.at.exception:
+            raise RuntimeError(f"{self.name}: {self.at.exception[0].value}")
+
+    def _button(self, text):
+        return next(b for b in self.at.button if text in b.label)
+
+    def take_exam(self, start_barrier, submit_barrier):
+        try:
+            self._take_exam(start_barrier, submit_barrier)
+        except Exception:
+            # let the rest of the class through instead of leaving them waiting
+            start_barrier.abort()
+            submit_barrier.abort()
+            raise
+
+    def _take_exam(self, start_barrier, submit_barrier):
+        at = self.at
+        self._run(at)
+        self._run(at.selectbox[0].select("Student"))
+        self._run(at.text_input[0].input(self.name))
+        self._run(at.selectbox[1].select(self.batch))
+        self._run(at.selectbox[2].select(self.subject))
+        start_barrier.wait(self.timeout)
+        self._run(self._button("Start Exam").click())
+        while True:
+            for radio in list(at.radio):
+                if radio.value is None or random.random() < 0.8:
+                    self._run(radio.set_value(random.choice(radio.options)))
+            nxt = [b for b in at.button if b.label.startswith("Next") and not b.disabled]
+            if not nxt:
+                break
+            self._run(nxt[0].click())
+        exams = exam_sessions(at.session_state["_exam_session"])
+        self.paper = exams[0].paper if exams else None
+        # the shared Paper is counted once for the class, not per session
+        seen = {id(e.paper) for e in exams}
+        state = {k: at.session_state[k] for k in at.session_state.keys() if not k.startswith("$$")}
+        self.session_bytes = deep_sizeof(state, seen) + deep_sizeof(exams, seen)
+        submit_barrier.wait(self.timeout)
+        self._run(self._button("Submit").click())
+
+    def db_calls(self):
+        history = self.at.session_state["_db_calls"] if "_db_calls" in self.at.session_state else []
+        return sum(n for scope, n in history if scope == "student")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "-C", ROOT, "rev-parse", "--short", "HEAD"],
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=30)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per RTDB call")
+    parser.add_argument("--concurrency", type=int, default=0,
+                        help="students driven at once (default: all)")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="also write the JSON report here")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    warnings.filterwarnings("ignore")
+    backend = MemoryBackend({"batches": {"BENCH": {"Maths": {"questions": make_bank(args.questions)}}}},
+                            latency=args.latency)
+    firebase_config.set_backend(backend)
+
+    workers = args.concurrency or args.students
+    students = [Student(i, "BENCH", "Maths", args.timeout) for i in range(args.students)]
+    # everyone starts and submits together, as at the bell; with a smaller
+    # --concurrency the class is driven in waves without the barriers
+    parties = args.students if workers >= args.students else 1
+    start_barrier = threading.Barrier(parties)
+    submit_barrier = threading.Barrier(parties)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(s.take_exam, start_barrier, submit_barrier) for s in students]
+        errors = [repr(f.exception()) for f in futures if f.exception()]
+    wall = time.perf_counter() - t0
+
+    reruns = [r for s in students for r in s.reruns]
+    calls = [s.db_calls() for s in students]
+    sizes = [s.session_bytes for s in students if s.session_bytes]
+    shared = {id(s.paper): s.paper for s in students if s.paper is not None}
+    stored = backend.reference("results/BENCH/Maths").get(shallow=True) or {}
+
+    report = {
+        "commit": git_commit(),
+        "students": args.students,
+        "questions": args.questions,
+        "latency_s": args.latency,
+        "wall_s": round(wall, 3),
+        "reruns": len(reruns),
+        "rerun_ms": {
+            "p50": round(percentile(reruns, 50) * 1000, 1),
+            "p95": round(percentile(reruns, 95) * 1000, 1),
+            "p99": round(percentile(reruns, 99) * 1000, 1),
+        },
+        "db_calls_per_student": round(statistics.mean(calls), 1) if calls else 0,
+        "session_bytes": round(statistics.mean(sizes)) if sizes else 0,
+        "shared_paper_bytes": sum(deep_sizeof(p) for p in shared.values()),
+        "results_stored": len(stored),
+        "errors": errors[:5],
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    sys.exit(1 if errors or len(stored) != args.students else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Per-session memory of exams in progress: session_state dicts vs exam_state.
+
+Builds N half-answered exams both ways against the in-memory backend and
+reports the bytes each one adds (tracemalloc):
+  dicts       what student_panel kept in st.session_state per exam: its own
+              question dict, the order as a list of qids, and the answers
+              and autosaved answers as {qid: option text}
+  exam_state  a shared Paper plus an ExamSession of index arrays
+
+    python bench/session_memory.py --sessions 500 --questions 100
+"""
+import argparse
+import copy
+import json
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import exam_state  # noqa: E402
+import firebase_config  # noqa: E402
+import papers  # noqa: E402
+from memory_backend import MemoryBackend  # noqa: E402
+
+
+def make_bank(n_questions):
+    return {f"q{i}": {"question": f"Question {i}: " + "lorem ipsum dolor sit amet " * 6,
+                      "options": [f"Option {o} for question {i}" for o in "ABCD"],
+                      "answer": f"Option {'ABCD'[i % 4]} for question {i}"} for i in range(n_questions)}
+
+
+def measure(build, sessions):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = [build(i) for i in range(sessions)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    grown = sum(s.size_diff for s in after.compare_to(before, "filename"))
+    return kept, grown
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--questions", type=int, default=100)
+    args = parser.parse_args()
+
+    firebase_config.set_backend(MemoryBackend(
+        {"batches": {"B1": {"Maths": {"questions": make_bank(args.questions),
+                                      "meta": {"version": 1}}}}}))
+    questions = papers.load_questions("B1", "Maths")
+
+    def answered(order, i):
+        rng = random.Random(i)
+        return {qid: rng.choice(questions[qid]["options"]) for qid in order[:len(order) // 2]}
+
+    def dicts(i):
+        order = list(questions)
+        random.Random(i).shuffle(order)
+        answers = answered(order, i)
+        return {"qdata": copy.deepcopy(questions), "order": order,
+                "answers": answers, "saved": dict(answers)}
+
+    def arrays(i):
+        order = list(questions)
+        random.Random(i).shuffle(order)
+        exam = exam_state.ExamSession(exam_state.get_paper("B1", "Maths"), order)
+        exam.restore(answered(order, i), saved=True)
+        exam_state.put(f"session{i}", "student/B1/Maths", exam)
+        return exam
+
+    old, old_bytes = measure(dicts, args.sessions)
+    del old
+    new, new_bytes = measure(arrays, args.sessions)
+
+    swept = exam_state.sweep(0)
+    report = {
+        "sessions": args.sessions,
+        "questions": args.questions,
+        "dicts_bytes_per_session": old_bytes // args.sessions,
+        "exam_state_bytes_per_session": new_bytes // args.sessions,
+        "exam_state_total_bytes": new_bytes,
+        "swept": swept,
+        "left_after_sweep": exam_state.count(),
+    }
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if swept == args.sessions and new_bytes < old_bytes else 1)
+
+
+if __name__ == "__main__":
+    main()
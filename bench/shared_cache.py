@@ -0,0 +1,112 @@
+"""RTDB reads as Streamlit workers scale out, with and without the shared cache.
+
+Spreads a class of students (each lists the catalog, reads the subject's
+meta, the live question set and the published paper) and a few teachers
+(score stats plus the first results page) over 1..8 worker processes. Every
+worker has its own in-memory backend holding the same data and counts the
+RTDB reads it makes; with [shared_cache] on they all open one SQLite file.
+
+    python bench/shared_cache.py --students 400 --workers 1,2,4,8
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def make_data(n_questions):
+    import papers
+    bank = {f"q{i:04d}": {"question": f"Question {i}?",
+                          "options": ["A", "B", "C", "D"],
+                          "answer": "ABCD"[i % 4]} for i in range(n_questions)}
+    stripped = {qid: {k: v for k, v in q.items() if k != "answer"} for qid, q in bank.items()}
+    students = {f"s{i:04d}": {"score": i % 10, "total": 10, "at": 0} for i in range(60)}
+    return bank, {
+        "batches": {"B1": {"Maths": {"questions": bank,
+                                     "meta": {"version": 3, "published": {"version": 1}}}},
+                    "B2": {"Physics": {"questions": {"_placeholder_": True}}}},
+        "papers": {"B1": {"Maths": {"1": papers.encode(stripped, True)}}},
+        "paper_keys": {"B1": {"Maths": {"1": {qid: q["answer"] for qid, q in bank.items()}}}},
+        "scores": {"B1": {"Maths": {"students": students,
+                                    "stats": {"count": 60, "sum": 270, "hist": {"0": 6}}}}},
+    }
+
+
+def worker(config_path, n_questions, students, teachers, start_at, out):
+    os.environ["SMARTEXAM_CONFIG"] = config_path
+    import catalog
+    import db_metrics
+    import firebase_config
+    import papers
+    import question_cache
+    import scores
+    from memory_backend import MemoryBackend
+
+    bank, data = make_data(n_questions)
+    firebase_config.set_backend(MemoryBackend(data))
+    db_metrics.PROCESS.reset()
+    while time.time() < start_at:  # all workers start together, as behind a balancer
+        time.sleep(0.001)
+    ok = True
+    for _ in range(students):
+        catalog.list_batches()
+        catalog.list_subjects("B1")
+        question_cache.get_meta("B1", "Maths")
+        ok &= len(question_cache.get_questions("B1", "Maths")) == len(bank)
+        ok &= len(papers.get_bundle("B1", "Maths", papers.published_version("B1", "Maths"))) == len(bank)
+    for _ in range(teachers):
+        ok &= scores.get_stats("B1", "Maths")["count"] == 60
+        ok &= len(scores.get_page("B1", "Maths")[0]) == scores.PAGE_SIZE
+    reads = sum(r["calls"] for r in db_metrics.PROCESS.rows() if r["op"] == "get")
+    out.put((reads, ok))
+
+
+def run(workers, shared, args, tmp):
+    config_path = os.path.join(tmp, f"config_{workers}_{int(shared)}.toml")
+    with open(config_path, "w") as f:
+        f.write(f'[shared_cache]\nenabled = {str(shared).lower()}\n'
+                f'path = "{os.path.join(tmp, f"cache_{workers}.sqlite3")}"\n')
+    ctx = multiprocessing.get_context("spawn")
+    out = ctx.Queue()
+    start_at = time.time() + 2
+    procs = [ctx.Process(target=worker, args=(config_path, args.questions,
+                                              args.students // workers, args.teachers, start_at, out))
+             for _ in range(workers)]
+    for p in procs:
+        p.start()
+    results = [out.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return sum(r for r, _ in results), all(ok for _, ok in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=400)
+    parser.add_argument("--teachers", type=int, default=5, help="summary views per worker")
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--workers", default="1,2,4,8")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    rows, ok = [], True
+    for workers in [int(w) for w in args.workers.split(",")]:
+        alone, ok_alone = run(workers, False, args, tmp)
+        shared, ok_shared = run(workers, True, args, tmp)
+        ok &= ok_alone and ok_shared
+        rows.append({"workers": workers, "reads_per_process_cache": alone,
+                     "reads_shared_cache": shared,
+                     "reduction_pct": round(100 * (1 - shared / alone), 1) if alone else 0.0})
+    print(json.dumps({"students": args.students, "questions": args.questions,
+                      "runs": rows, "ok": ok}, indent=2))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""End-of-exam burst: N students submit at the same instant.
+
+Runs the write-behind queue against the in-memory backend with simulated
+RTDB latency and checks that every submission lands exactly once, including
+jobs replayed from the journal after a simulated restart.
+
+    python bench/submit_burst.py --students 1000 --latency 0.08
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import firebase_config  # noqa: E402
+import submit_queue  # noqa: E402
+from memory_backend import MemoryBackend  # noqa: E402
+
+
+def make_bank(n_questions):
+    return {f"q{i}": {"question": f"Question {i}?",
+                      "options": ["A", "B", "C", "D"],
+                      "answer": "ABCD"[i % 4]} for i in range(n_questions)}
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def burst(q, students, bank):
+    start = threading.Barrier(students)
+    enqueue_times = [0.0] * students
+
+    def student(i):
+        answers = {qid: "ABCD"[(i + n) % 4] for n, qid in enumerate(bank)}
+        start.wait()
+        t0 = time.perf_counter()
+        q.enqueue("B1", "Maths", f"student{i}", f"Student {i}", "Maths", answers)
+        enqueue_times[i] = time.perf_counter() - t0
+
+    threads = [threading.Thread(target=student, args=(i,)) for i in range(students)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    q.join()
+    return enqueue_times, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--questions", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.08, help="seconds per RTDB call")
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+
+    bank = make_bank(args.questions)
+    backend = MemoryBackend({"batches": {"B1": {"Maths": {"questions": bank}}}},
+                            latency=args.latency)
+    firebase_config.set_backend(backend)
+    journal = os.path.join(tempfile.mkdtemp(), "journal.jsonl")
+
+    q = submit_queue.SubmissionQueue(workers=args.workers, backoff_seconds=0.01, journal=journal)
+    enqueue_times, drain = burst(q, args.students, bank)
+    stored = backend.reference("results/B1/Maths").get(shallow=True) or {}
+
+    # restart: journal jobs without a worker, then let a fresh queue replay them
+    paused = submit_queue.SubmissionQueue(workers=0, journal=journal)
+    for i in range(50):
+        paused.enqueue("B1", "Maths", f"late{i}", f"Late {i}", "Maths", {"q0": "A"})
+    replayed = submit_queue.SubmissionQueue(workers=4, journal=journal)
+    replayed.join()
+    late = [k for k in backend.reference("results/B1/Maths").get(shallow=True) if k.startswith("late")]
+
+    report = {
+        "students": args.students,
+        "latency_s": args.latency,
+        "workers": args.workers,
+        "enqueue_p50_ms": round(statistics.median(enqueue_times) * 1000, 3),
+        "enqueue_p99_ms": round(percentile(enqueue_times, 99) * 1000, 3),
+        "drain_s": round(drain, 3),
+        "stored": len(stored),
+        "replayed_after_restart": len(late),
+    }
+    print(json.dumps(report, indent=2))
+    ok = len(stored) == args.students and len(late) == 50
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
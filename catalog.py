@@ -0,0 +1,64 @@
+import shared_cache
+from firebase_config import db
+
+# ----------------- Batch / Subject Catalog -----------------
+# Dropdowns only need names, so these read with shallow=True: RTDB returns
+# {key: true} for each child instead of the whole question bank underneath.
+# Listings are cached only in the host-wide [shared_cache], never per process,
+# so a write on one worker clears them for every worker on the host.
+
+CATALOG_TTL = 300  # seconds; writes below clear the cache straight away
+
+
+def list_batches() -> list:
+    """Names of all batches (keys only)."""
+    data = shared_cache.fetch("catalog/batches", lambda: db.reference("batches").get(shallow=True),
+                              ttl=CATALOG_TTL)
+    return sorted(data.keys()) if isinstance(data, dict) else []
+
+
+def list_subjects(batch: str) -> list:
+    """Names of the subjects in a batch (keys only)."""
+    data = shared_cache.fetch(f"catalog/subjects/{batch}",
+                              lambda: db.reference(f"batches/{batch}").get(shallow=True),
+                              ttl=CATALOG_TTL)
+    return sorted(data.keys()) if isinstance(data, dict) else []
+
+
+def invalidate():
+    """Drop cached listings after a batch or subject is created or deleted."""
+    shared_cache.drop("catalog")
+
+
+# ----------------- Counters -----------------
+# counts/{batch}/{subject}/questions is kept current by
+# question_cache.bump_version, so listing a batch with its question counts is
+# one small read instead of a download of every question bank in it.
+
+def question_counts(batch: str) -> dict:
+    """{subject: question count} for the subjects of a batch that have a counter."""
+    data = db.reference(f"counts/{batch}").get() or {}
+    return {s: (c or {}).get("questions", 0) for s, c in data.items() if isinstance(c, dict)}
+
+
+def recount(batch: str) -> dict:
+    """Rebuild a batch's counters from keys-only reads of each question bank."""
+    counts = {}
+    for subject in list_subjects(batch):
+        qids = db.reference(f"batches/{batch}/{subject}/questions").get(shallow=True) or {}
+        counts[subject] = {"questions": len([q for q in qids if q != "_placeholder_"])}
+    if counts:
+        db.reference(f"counts/{batch}").set(counts)
+    return {s: c["questions"] for s, c in counts.items()}
+
+
+def delete_subject(batch: str, subject: str):
+    db.reference().update({f"batches/{batch}/{subject}": None, f"counts/{batch}/{subject}": None,
+                           f"schedules/{batch}/{subject}": None, f"starts/{batch}/{subject}": None})
+    invalidate()
+
+
+def delete_batch(batch: str):
+    db.reference().update({f"batches/{batch}": None, f"counts/{batch}": None,
+                           f"schedules/{batch}": None, f"starts/{batch}": None})
+    invalidate()
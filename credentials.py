@@ -0,0 +1,265 @@
+"""Teacher credentials: salted scrypt hashes, signed session tokens, login throttling.
+
+teachers/{name} = {"password_hash": "scrypt$n$r$p$<salt>$<hash>"}
+
+Records from before hashing still hold {"password": "<plain text>"}; they keep
+working and are rehashed the first time that teacher logs in, or all at once
+with migrate_all() (the admin panel has a button, or run
+``python credentials.py migrate``).
+
+A successful login is turned into an HMAC-signed token kept in session
+state, so later reruns check the signature instead of reading RTDB. The
+token carries a fingerprint of the teacher's password hash; it is compared
+with the stored one (re-read at most every revalidate_seconds per process),
+so removing a teacher or resetting their password ends their sessions.
+"""
+import base64
+import hashlib
+import hmac
+import secrets
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+
+import settings
+from firebase_config import db
+
+DEFAULTS = {
+    "session_hours": 8,
+    "max_failures": 5,       # per teacher name and per browser session ...
+    "lockout_seconds": 300,  # ... within this window
+    "revalidate_seconds": 60,  # how stale a token's fingerprint check may be
+}
+
+SCRYPT_N, SCRYPT_R, SCRYPT_P = 2 ** 14, 8, 1  # ~50 ms and 16 MB per check
+SALT_BYTES = 16
+
+
+def config() -> dict:
+    return settings.section("auth", DEFAULTS)
+
+
+def teacher_path(name: str) -> str:
+    return f"teachers/{name}"
+
+
+# ----------------- Hashing -----------------
+def _b64(raw: bytes) -> str:
+    return base64.b64encode(raw).decode("ascii")
+
+
+def hash_password(password: str) -> str:
+    salt = secrets.token_bytes(SALT_BYTES)
+    digest = hashlib.scrypt(password.encode("utf-8"), salt=salt,
+                            n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, dklen=32)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+
+
+def check_password(password: str, stored: str) -> bool:
+    try:
+        scheme, n, r, p, salt, digest = stored.split("$")
+        if scheme != "scrypt":
+            return False
+        actual = hashlib.scrypt(password.encode("utf-8"), salt=base64.b64decode(salt),
+                                n=int(n), r=int(r), p=int(p), dklen=32)
+    except (ValueError, TypeError):
+        return False
+    return hmac.compare_digest(actual, base64.b64decode(digest))
+
+
+def is_hashed(record: dict) -> bool:
+    return bool(record) and "password_hash" in record and "password" not in record
+
+
+def set_password(name: str, password: str):
+    """Store a new hashed password (also drops any plain-text one)."""
+    db.reference(teacher_path(name)).update({"password_hash": hash_password(password), "password": None})
+    forget(name)
+
+
+def remove_teacher(name: str):
+    """Delete a teacher; their signed-in sessions end at the next check."""
+    db.reference(teacher_path(name)).delete()
+    forget(name)
+
+
+def create_teacher(name: str, password: str) -> bool:
+    """Add a teacher; False if the name is taken."""
+    ref = db.reference(teacher_path(name))
+    if ref.get():
+        return False
+    ref.set({"password_hash": hash_password(password)})
+    return True
+
+
+def migrate_all() -> int:
+    """Rehash every plain-text teachers/*/password in one multi-path update."""
+    teachers = db.reference("teachers").get() or {}
+    changes = {}
+    for name, record in teachers.items():
+        if isinstance(record, dict) and record.get("password") is not None:
+            changes[f"{teacher_path(name)}/password_hash"] = hash_password(str(record["password"]))
+            changes[f"{teacher_path(name)}/password"] = None
+    if changes:
+        db.reference().update(changes)
+    return len(changes) // 2
+
+
+# ----------------- Login throttling -----------------
+class RateLimiter:
+    """Failed attempts per key in a sliding window, kept in process memory."""
+
+    def __init__(self, max_failures: int, window_seconds: float):
+        self.max_failures = max_failures
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._failures = defaultdict(deque)
+
+    def _trim(self, key, now):
+        q = self._failures[key]
+        while q and now - q[0] > self.window_seconds:
+            q.popleft()
+        if not q:
+            del self._failures[key]
+        return q
+
+    def retry_after(self, key) -> float:
+        """Seconds until `key` may try again (0 when allowed)."""
+        now = time.monotonic()
+        with self._lock:
+            q = self._trim(key, now)
+            if len(q) < self.max_failures:
+                return 0.0
+            return self.window_seconds - (now - q[0])
+
+    def fail(self, key):
+        with self._lock:
+            self._failures[key].append(time.monotonic())
+
+    def reset(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def limiter() -> RateLimiter:
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            cfg = config()
+            _limiter = RateLimiter(cfg["max_failures"], cfg["lockout_seconds"])
+        return _limiter
+
+
+class LockedOut(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Too many failed logins. Try again in {int(retry_after) + 1} seconds.")
+        self.retry_after = retry_after
+
+
+def login(name: str, password: str, client: str = "") -> bool:
+    """Check a teacher's password, at most one RTDB read per allowed attempt.
+
+    Raises LockedOut (without touching RTDB) after too many failures for the
+    name or the client. Plain-text records are rehashed on success.
+    """
+    keys = [("name", name)] + ([("client", client)] if client else [])
+    wait = max(limiter().retry_after(k) for k in keys)
+    if wait:
+        raise LockedOut(wait)
+
+    record = db.reference(teacher_path(name)).get() or {}
+    if record.get("password_hash"):
+        ok = check_password(password, record["password_hash"])
+    elif record.get("password") is not None:
+        ok = hmac.compare_digest(str(record["password"]).encode("utf-8"), password.encode("utf-8"))
+        if ok:
+            set_password(name, password)
+    else:
+        hash_password(password)  # same cost as a real check, so unknown names don't stand out
+        ok = False
+
+    for k in keys:
+        if ok:
+            limiter().reset(k)
+        else:
+            limiter().fail(k)
+    if ok:
+        forget(name)  # the next fingerprint() reads the hash as stored now
+    return ok
+
+
+# ----------------- Session tokens -----------------
+_process_secret = secrets.token_bytes(32)
+
+
+def _secret() -> bytes:
+    # a shared secret lets tokens survive restarts and work across processes;
+    # without one, tokens only live as long as this process (as does session state)
+    try:
+        import streamlit as st
+        return st.secrets["auth"]["secret"].encode("utf-8")
+    except Exception:
+        return _process_secret
+
+
+def _sign(payload: str) -> str:
+    return hmac.new(_secret(), payload.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+_fingerprints = {}  # name -> (fingerprint or None, read at)
+_fingerprints_lock = threading.Lock()
+
+
+def fingerprint(name: str):
+    """Short digest of the teacher's stored password hash, or None if there is no such teacher."""
+    now = time.monotonic()
+    with _fingerprints_lock:
+        cached = _fingerprints.get(name)
+    if cached is not None and now - cached[1] < config()["revalidate_seconds"]:
+        return cached[0]
+    record = db.reference(teacher_path(name)).get() or {}
+    stored = record.get("password_hash") or record.get("password")
+    value = hashlib.sha256(str(stored).encode("utf-8")).hexdigest()[:16] if stored else None
+    with _fingerprints_lock:
+        _fingerprints[name] = (value, now)
+    return value
+
+
+def forget(name: str):
+    """Drop this process's cached fingerprint after changing a teacher's record."""
+    with _fingerprints_lock:
+        _fingerprints.pop(name, None)
+
+
+def issue_token(name: str) -> str:
+    expires = int(time.time() + config()["session_hours"] * 3600)
+    payload = f"{_b64(name.encode('utf-8'))}.{expires}.{fingerprint(name)}"
+    return f"{payload}.{_sign(payload)}"
+
+
+def check_token(token) -> str:
+    """The teacher name a token was issued to, or None if forged, expired, or
+    the teacher has since been removed or had their password reset."""
+    try:
+        name, expires, fp, signature = token.split(".")
+    except (AttributeError, ValueError):
+        return None
+    payload = f"{name}.{expires}.{fp}"
+    if not hmac.compare_digest(signature, _sign(payload)) or int(expires) < time.time():
+        return None
+    name = base64.b64decode(name).decode("utf-8")
+    current = fingerprint(name)
+    if current is None or not hmac.compare_digest(fp, current):
+        return None
+    return name
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["migrate"]:
+        sys.exit(__doc__)
+    print(f"rehashed {migrate_all()} plain-text passwords")
@@ -0,0 +1,227 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# ----------------- RTDB Call Profiler -----------------
+# firebase_config routes every reference call through record(). Each call is
+# attributed to the panel that was running on the calling thread (set with
+# scope()) and aggregated by (panel, op, path template) into latency and
+# payload-size histograms, both process-wide and for the Streamlit session
+# that made it. Paths are templated ("results/*/*/*") so student names don't
+# blow up the number of series. Payload sizes cost a JSON encode, so callers
+# may size only a sample of calls (nbytes=None for the rest); byte totals are
+# scaled up from the sampled calls.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BYTES_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+# path segments kept verbatim when templating; everything else becomes "*"
+_LITERAL_SEGMENTS = {"questions", "meta", "version", "display", "answers", "order", "updated"}
+
+
+def path_template(path: str) -> str:
+    parts = [p for p in str(path).split("/") if p]
+    if not parts:
+        return "/"
+    return "/".join([parts[0]] + [p if p in _LITERAL_SEGMENTS else "*" for p in parts[1:]])
+
+
+def payload_size(value) -> int:
+    if value is None:
+        return 0
+    try:
+        return len(json.dumps(value, separators=(",", ":"), default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+class _Series:
+    __slots__ = ("count", "seconds", "sized", "bytes", "latency", "sizes")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.sized = 0  # calls whose payload was measured
+        self.bytes = 0
+        self.latency = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sizes = [0] * (len(BYTES_BUCKETS) + 1)
+
+    def add(self, seconds, nbytes):
+        self.count += 1
+        self.seconds += seconds
+        self.latency[_bucket(LATENCY_BUCKETS, seconds)] += 1
+        if nbytes is not None:
+            self.sized += 1
+            self.bytes += nbytes
+            self.sizes[_bucket(BYTES_BUCKETS, nbytes)] += 1
+
+    def estimated_bytes(self) -> float:
+        return self.bytes * self.count / self.sized if self.sized else 0.0
+
+
+def _bucket(bounds, value):
+    for i, bound in enumerate(bounds):
+        if value <= bound:
+            return i
+    return len(bounds)
+
+
+class CallStats:
+    """Histograms keyed by (panel, op, path template). Thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def add(self, panel, op, template, seconds, nbytes):
+        with self._lock:
+            series = self._series.get((panel, op, template))
+            if series is None:
+                series = self._series[(panel, op, template)] = _Series()
+            series.add(seconds, nbytes)
+
+    def rows(self) -> list:
+        """One dict per series, busiest first."""
+        with self._lock:
+            items = list(self._series.items())
+        rows = []
+        for (panel, op, template), s in items:
+            rows.append({
+                "panel": panel, "op": op, "path": template, "calls": s.count,
+                "avg_ms": round(s.seconds / s.count * 1000, 1) if s.count else 0.0,
+                "p95_ms": round(_quantile(LATENCY_BUCKETS, s.latency, 0.95) * 1000, 1),
+                "total_kb": round(s.estimated_bytes() / 1024, 1),
+            })
+        return sorted(rows, key=lambda r: -r["calls"])
+
+    def snapshot(self):
+        with self._lock:
+            return [(k, s.count, s.seconds, s.sized, s.bytes, list(s.latency), list(s.sizes))
+                    for k, s in self._series.items()]
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+def _quantile(bounds, counts, q):
+    """Upper bound of the bucket holding the q-quantile (inf for the overflow)."""
+    total = sum(counts)
+    if not total:
+        return 0.0
+    seen = 0
+    for i, c in enumerate(counts):
+        seen += c
+        if seen >= q * total:
+            return bounds[i] if i < len(bounds) else float("inf")
+    return float("inf")
+
+
+PROCESS = CallStats()
+MAX_SESSIONS = 500  # per-session stats kept for the most recently active sessions
+_sessions = OrderedDict()
+_sessions_lock = threading.Lock()
+_context = threading.local()
+
+
+def session_stats(session_id: str, label: str = "") -> CallStats:
+    """Stats for one Streamlit session, kept in a bounded process-wide registry."""
+    with _sessions_lock:
+        entry = _sessions.get(session_id)
+        if entry is None:
+            entry = _sessions[session_id] = [label, CallStats()]
+        elif label:
+            entry[0] = label
+        _sessions.move_to_end(session_id)
+        while len(_sessions) > MAX_SESSIONS:
+            _sessions.popitem(last=False)
+        return entry[1]
+
+
+def sessions() -> list:
+    """(session_id, label, stats) for tracked sessions, most recent first."""
+    with _sessions_lock:
+        return [(sid, label, stats) for sid, (label, stats) in reversed(_sessions.items())]
+
+
+@contextmanager
+def scope(panel: str, session_stats=None):
+    """Attribute calls made on this thread to `panel` (and a session's stats).
+
+    Yields a function returning the number of calls made inside the block.
+    """
+    previous = (getattr(_context, "panel", None), getattr(_context, "session", None))
+    _context.panel, _context.session = panel, session_stats
+    start = call_count()
+    try:
+        yield lambda: call_count() - start
+    finally:
+        _context.panel, _context.session = previous
+
+
+def call_count() -> int:
+    """RTDB calls made so far on the current thread."""
+    return getattr(_context, "calls", 0)
+
+
+def record(op: str, path: str, seconds: float, nbytes=None):
+    _context.calls = call_count() + 1
+    panel = getattr(_context, "panel", None) or "background"
+    template = path_template(path)
+    PROCESS.add(panel, op, template, seconds, nbytes)
+    session = getattr(_context, "session", None)
+    if session is not None:
+        session.add(panel, op, template, seconds, nbytes)
+
+
+def render_prometheus(stats: CallStats = PROCESS) -> str:
+    """Prometheus text exposition of the call histograms."""
+    lines = [
+        "# HELP smartexam_rtdb_request_seconds Latency of Realtime Database calls.",
+        "# TYPE smartexam_rtdb_request_seconds histogram",
+    ]
+    size_lines = [
+        "# HELP smartexam_rtdb_payload_bytes JSON bytes sent or received per sampled call.",
+        "# TYPE smartexam_rtdb_payload_bytes histogram",
+    ]
+    for (panel, op, template), count, seconds, sized, nbytes, latency, sizes in stats.snapshot():
+        labels = f'panel="{panel}",op="{op}",path="{template}"'
+        cumulative = 0
+        for bound, c in zip(LATENCY_BUCKETS + ("+Inf",), latency):
+            cumulative += c
+            lines.append(f'smartexam_rtdb_request_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f"smartexam_rtdb_request_seconds_sum{{{labels}}} {seconds:.6f}")
+        lines.append(f"smartexam_rtdb_request_seconds_count{{{labels}}} {count}")
+        cumulative = 0
+        for bound, c in zip(BYTES_BUCKETS + ("+Inf",), sizes):
+            cumulative += c
+            size_lines.append(f'smartexam_rtdb_payload_bytes_bucket{{{labels},le="{bound}"}} {cumulative}')
+        size_lines.append(f"smartexam_rtdb_payload_bytes_sum{{{labels}}} {nbytes}")
+        size_lines.append(f"smartexam_rtdb_payload_bytes_count{{{labels}}} {sized}")
+    return "\n".join(lines + size_lines) + "\n"
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def start_file_exporter(path: str, interval_seconds: float = 15):
+    """Rewrite `path` with render_prometheus() every interval (node_exporter textfile style)."""
+    global _exporter
+    with _exporter_lock:
+        if _exporter is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval_seconds)
+                tmp = path + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(render_prometheus())
+                os.replace(tmp, path)
+
+        _exporter = threading.Thread(target=run, daemon=True, name="rtdb-metrics")
+        _exporter.start()
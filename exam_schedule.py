@@ -0,0 +1,298 @@
+import logging
+import threading
+import time
+import zlib
+from zoneinfo import ZoneInfo
+
+import autosave
+import grading
+import papers
+import question_cache
+import question_index
+import settings
+import submission
+from firebase_config import db
+
+# ----------------- Scheduled Exams -----------------
+# A subject may carry a schedule, stored in its meta node (so students read it
+# through question_cache's cached meta) and mirrored to a small index:
+#   batches/{b}/{s}/meta/schedule = {"opens": epoch, "closes": epoch,
+#                                    "duration_minutes": n, "stagger_seconds": n}
+#   schedules/{b}/{s}             = the same
+# 0 means "not set" for each field. Students are admitted from `opens` over a
+# stagger window, each at a fixed offset (a hash of their name), so the class
+# doesn't press Start in the same second. An exam ends at the earlier of
+# start + duration and `closes`. For exams with a duration the start is the
+# server time of the student's first Start, written once whether or not
+# autosave is on (and copied into the draft):
+#   starts/{b}/{s}/{name} = {"started": epoch}
+# so reloading the page never restarts the timer. A start from before the
+# current `opens` belongs to an earlier sitting and is replaced.
+# One thread per process reads the index every check_seconds. Shortly before
+# a subject opens it loads the paper, draw index and answer key into the
+# caches; while a subject is running it submits, from the autosaved answers,
+# every draft whose time ran out more than grace_seconds ago (sessions that
+# are still connected submit themselves at the deadline). A sweep reads only
+# drafts that have run out (drafts are queried by `started`, so the database
+# rules need ".indexOn": "started" on drafts/$batch/$subject), and the next
+# one waits until the earliest remaining draft can run out: with no draft in
+# progress that is a full duration away. After closing, once every draft is
+# in, the subject is not swept again.
+
+log = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "prewarm_minutes": 5,   # load the paper this long before opening
+    "stagger_seconds": 60,  # default admission window for new schedules
+    "grace_seconds": 30,    # after a deadline, before the server submits a draft itself
+    "check_seconds": 20,
+    "clock_seconds": 10,    # how often an open exam page checks the clock
+    "timezone": "UTC",      # zone schedules are entered and shown in
+}
+
+NOT_SCHEDULED, UPCOMING, OPEN, CLOSED = "not scheduled", "upcoming", "open", "closed"
+
+SCHEDULE_DEFAULTS = {
+    "opens": 0,
+    "closes": 0,
+    "duration_minutes": 0,
+    "stagger_seconds": 0,
+}
+
+
+def config() -> dict:
+    return settings.section("schedule", DEFAULTS)
+
+
+def timezone() -> ZoneInfo:
+    """The zone teachers enter and students read exam times in, whatever the server's."""
+    return ZoneInfo(config()["timezone"])
+
+
+def index_path(batch: str, subject: str) -> str:
+    return f"schedules/{batch}/{subject}"
+
+
+def start_path(batch: str, subject: str, name: str = None) -> str:
+    return f"starts/{batch}/{subject}" + (f"/{name}" if name else "")
+
+
+def get_schedule(batch: str, subject: str) -> dict:
+    values = dict(SCHEDULE_DEFAULTS)
+    values.update(question_cache.get_meta(batch, subject).get("schedule") or {})
+    return values
+
+
+def save_schedule(batch: str, subject: str, opens: int, closes: int,
+                  duration_minutes: int, stagger_seconds: int):
+    schedule = {
+        "opens": int(opens),
+        "closes": int(closes),
+        "duration_minutes": int(duration_minutes),
+        "stagger_seconds": int(stagger_seconds)
+    }
+    db.reference().update({
+        f"{question_cache.meta_path(batch, subject)}/schedule": schedule,
+        index_path(batch, subject): schedule
+    })
+    question_cache.invalidate(batch, subject)
+
+
+def clear_schedule(batch: str, subject: str):
+    db.reference().update({
+        f"{question_cache.meta_path(batch, subject)}/schedule": None,
+        index_path(batch, subject): None
+    })
+    question_cache.invalidate(batch, subject)
+
+
+def is_scheduled(schedule: dict) -> bool:
+    return bool(schedule.get("opens") or schedule.get("closes") or schedule.get("duration_minutes"))
+
+
+def state(schedule: dict, now=None) -> str:
+    now = time.time() if now is None else now
+    if not is_scheduled(schedule):
+        return NOT_SCHEDULED
+    if schedule.get("opens") and now < schedule["opens"]:
+        return UPCOMING
+    if schedule.get("closes") and now >= schedule["closes"]:
+        return CLOSED
+    return OPEN
+
+
+def admit_at(schedule: dict, name: str) -> float:
+    """When `name` may press Start: opens plus a fixed offset within the stagger window."""
+    if not schedule.get("opens"):
+        return 0
+    stagger = int(schedule.get("stagger_seconds") or 0)
+    offset = zlib.crc32(name.encode("utf-8")) % stagger if stagger > 0 else 0
+    return schedule["opens"] + offset
+
+
+def deadline(schedule: dict, started):
+    """When an exam started at `started` ends, or None if it never does."""
+    ends = []
+    if schedule.get("duration_minutes") and started:
+        ends.append(started + schedule["duration_minutes"] * 60)
+    if schedule.get("closes"):
+        ends.append(schedule["closes"])
+    return min(ends) if ends else None
+
+
+def draft_deadline(schedule: dict, draft: dict):
+    return deadline(schedule, (draft or {}).get("started"))
+
+
+def _current(record, schedule: dict):
+    started = record.get("started") if isinstance(record, dict) else None
+    return started if started and started >= (schedule.get("opens") or 0) else None
+
+
+def started_at(batch: str, subject: str, name: str, schedule: dict):
+    """When this student first pressed Start in the current sitting, or None."""
+    return _current(db.reference(start_path(batch, subject, name)).get(), schedule)
+
+
+def begin(batch: str, subject: str, name: str, schedule: dict, now=None) -> int:
+    """Record the start of a timed attempt, once. Returns the recorded start."""
+    now = int(time.time() if now is None else now)
+
+    def claim(current):
+        return current if _current(current, schedule) else {"started": now}
+
+    return db.reference(start_path(batch, subject, name)).transaction(claim)["started"]
+
+
+def clear_starts(batch: str, subject: str):
+    """Forget recorded starts (results reset, so students may sit the exam again)."""
+    db.reference(start_path(batch, subject)).delete()
+
+
+def submit_draft(batch: str, subject: str, name: str, draft: dict):
+    """Submit a timed-out attempt from its autosaved answers. Returns the stored
+    result (also when this attempt was already submitted), or None."""
+    order = draft.get("order") or []
+    answers = {qid: a for qid, a in (draft.get("answers") or {}).items() if qid in order}
+    result = submission.submit_exam(batch, subject, name, draft.get("student") or name,
+                                    draft.get("subject") or subject, answers, qids=order,
+                                    paper=draft.get("paper"), attempt_id=draft.get("attempt_id"))
+    if result is not None:
+        autosave.discard(batch, subject, name)
+    return result
+
+
+# ----------------- Background Scheduler -----------------
+def warm(batch: str, subject: str):
+    """Load what the first students to start will need into this process's caches."""
+    version = papers.published_version(batch, subject)
+    qids = list(papers.load_questions(batch, subject, version))
+    if question_cache.get_meta(batch, subject).get("sampling", {}).get("count"):
+        question_index.get_index(batch, subject, version)
+    grading.answer_key(batch, subject, version, qids)
+
+
+def _drafts(batch: str, subject: str):
+    return db.reference(f"drafts/{batch}/{subject}")
+
+
+def sweep_expired(batch: str, subject: str, schedule: dict, now=None) -> int:
+    """Submit every draft whose time ran out more than grace_seconds ago."""
+    now = time.time() if now is None else now
+    grace = config()["grace_seconds"]
+    if schedule.get("closes") and now > schedule["closes"] + grace:
+        drafts = _drafts(batch, subject).get() or {}  # closed: every draft has run out
+    elif schedule.get("duration_minutes"):
+        cutoff = now - schedule["duration_minutes"] * 60 - grace
+        drafts = _drafts(batch, subject).order_by_child("started").start_at(0).end_at(cutoff).get() or {}
+    else:
+        return 0
+    submitted = 0
+    for name, draft in drafts.items():
+        if not isinstance(draft, dict) or not draft.get("order"):
+            continue
+        ends = draft_deadline(schedule, draft)
+        if ends is None or now <= ends + grace:
+            continue
+        try:
+            result = submit_draft(batch, subject, name, draft)
+        except Exception:
+            log.warning("could not submit the expired draft of %s/%s/%s", batch, subject, name,
+                        exc_info=True)
+            continue
+        if result is not None:
+            submitted += 1
+        else:
+            autosave.discard(batch, subject, name)  # another attempt was submitted instead
+    return submitted
+
+
+def next_sweep(batch: str, subject: str, schedule: dict, now=None):
+    """When a draft left now could first be due for submission, or None if none can."""
+    now = time.time() if now is None else now
+    grace = config()["grace_seconds"]
+    closes = schedule.get("closes")
+    if closes and now > closes + grace:
+        return None  # the sweep just made took every draft (a failed one is logged)
+    due = []
+    if closes:
+        due.append(closes + grace)
+    if schedule.get("duration_minutes"):
+        earliest = _drafts(batch, subject).order_by_child("started").start_at(0).limit_to_first(1).get()
+        started = next(iter((earliest or {}).values()), {}).get("started")
+        # with no draft in progress, one started from now on runs out a full duration later
+        due.append((started or now) + schedule["duration_minutes"] * 60 + grace)
+    return min(due) if due else None
+
+
+class Scheduler:
+    def __init__(self, check_seconds: float):
+        self.check_seconds = check_seconds
+        self._warmed = set()  # (batch, subject, opens)
+        self._due = {}        # (batch, subject) -> (schedule, next sweep or None when done)
+        self._thread = threading.Thread(target=self._run, daemon=True, name="exam-scheduler")
+        self._thread.start()
+
+    def tick(self, now=None):
+        now = time.time() if now is None else now
+        cfg = config()
+        index = db.reference("schedules").get() or {}
+        for batch, subjects in index.items():
+            for subject, schedule in (subjects or {}).items():
+                if not isinstance(schedule, dict):
+                    continue
+                schedule = dict(SCHEDULE_DEFAULTS, **schedule)
+                opens = schedule["opens"]
+                if (opens and opens - cfg["prewarm_minutes"] * 60 <= now
+                        and (batch, subject, opens) not in self._warmed):
+                    self._warmed.add((batch, subject, opens))
+                    warm(batch, subject)
+                if not (schedule["duration_minutes"] or schedule["closes"]) or now < opens:
+                    continue  # nothing can have run out yet
+                known = self._due.get((batch, subject))
+                if known is not None and known[0] == schedule and (known[1] is None or now < known[1]):
+                    continue  # nothing can be due yet, or the exam is over and every draft is in
+                sweep_expired(batch, subject, schedule, now)
+                self._due[(batch, subject)] = (schedule, next_sweep(batch, subject, schedule, now))
+
+    def _run(self):
+        while True:
+            time.sleep(self.check_seconds)
+            try:
+                self.tick()
+            except Exception:
+                log.exception("exam scheduler tick failed; retrying in %s s", self.check_seconds)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start():
+    """Start this process's scheduler thread (once)."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = Scheduler(config()["check_seconds"])
+    return _scheduler
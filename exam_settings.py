@@ -0,0 +1,83 @@
+import question_cache
+import settings
+from firebase_config import db
+
+# ----------------- Per-Subject Exam Settings -----------------
+# Stored beside the version counter in batches/{b}/{s}/meta, so students pick
+# them up through question_cache's cached meta read at no extra cost.
+
+MODES = {
+    "all": "📜 All questions on one page",
+    "paged": "📄 A few questions per page",
+}
+
+DEFAULTS = {
+    "mode": "all",
+    "page_size": 10,
+}
+
+
+def display_settings(batch: str, subject: str) -> dict:
+    values = settings.section("exam", DEFAULTS)
+    values.update(question_cache.get_meta(batch, subject).get("display") or {})
+    return values
+
+
+def save_display_settings(batch: str, subject: str, mode: str, page_size: int):
+    db.reference(f"{question_cache.meta_path(batch, subject)}/display").set({
+        "mode": mode,
+        "page_size": int(page_size)
+    })
+    question_cache.invalidate(batch, subject)
+
+
+# Sampling: each student gets `count` questions drawn from the bank
+# (0 = the whole bank), optionally in proportion to a tag or difficulty.
+STRATIFY = {
+    "": "🎲 Plain random draw",
+    "tag": "🏷 Same mix of tags as the bank",
+    "difficulty": "📶 Same mix of difficulties as the bank",
+}
+
+SAMPLING_DEFAULTS = {
+    "count": 0,
+    "stratify": "",
+}
+
+
+def sampling_settings(batch: str, subject: str) -> dict:
+    values = dict(SAMPLING_DEFAULTS)
+    values.update(question_cache.get_meta(batch, subject).get("sampling") or {})
+    return values
+
+
+def save_sampling_settings(batch: str, subject: str, count: int, stratify: str):
+    db.reference(f"{question_cache.meta_path(batch, subject)}/sampling").set({
+        "count": int(count),
+        "stratify": stratify
+    })
+    question_cache.invalidate(batch, subject)
+
+
+# Marking: points for each correct, wrong and skipped question (grading.py).
+# A negative `wrong` is negative marking.
+MARKING_DEFAULTS = {
+    "correct": 1,
+    "wrong": 0,
+    "skipped": 0,
+}
+
+
+def marking_settings(batch: str, subject: str) -> dict:
+    values = dict(MARKING_DEFAULTS)
+    values.update(question_cache.get_meta(batch, subject).get("marking") or {})
+    return values
+
+
+def save_marking_settings(batch: str, subject: str, correct: float, wrong: float, skipped: float):
+    db.reference(f"{question_cache.meta_path(batch, subject)}/marking").set({
+        "correct": correct,
+        "wrong": wrong,
+        "skipped": skipped
+    })
+    question_cache.invalidate(batch, subject)
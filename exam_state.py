@@ -0,0 +1,215 @@
+import threading
+import time
+import weakref
+from array import array
+from collections import OrderedDict
+from types import MappingProxyType
+
+import papers
+import question_cache
+import settings
+
+# ----------------- In-Progress Exam State -----------------
+# The question payload lives once per process in a shared, read-only Paper per
+# source version (a published version, or the live bank at one meta version).
+# A student's exam holds only a reference to that Paper, the shuffled order as
+# an array of indices into Paper.qids, and the answers as one signed byte per
+# position (the chosen option's index, -1 when unanswered). Exams sit in a
+# process-wide registry keyed by (session id, student/batch/subject) rather
+# than in st.session_state, so a sweeper thread can evict the ones abandoned
+# mid-exam; a browser keeps only the exam it started last.
+
+DEFAULTS = {
+    "idle_minutes": 120,   # evict exams untouched this long (autosave drafts survive)
+    "sweep_seconds": 60,
+}
+
+UNANSWERED = -1
+
+
+def config() -> dict:
+    return settings.section("exam_state", DEFAULTS)
+
+
+# ----------------- Shared Papers -----------------
+class Paper:
+    """The questions of one source version, shared read-only by every exam on it.
+
+    Drawn papers only need a few questions each, so questions are loaded
+    into the shared map as positions are first asked for.
+    """
+
+    def __init__(self, batch, subject, version, qids):
+        self.batch, self.subject, self.version = batch, subject, version
+        self.qids = tuple(qids)
+        self.index = MappingProxyType({qid: i for i, qid in enumerate(self.qids)})
+        self._questions = {}
+        self._lock = threading.Lock()
+        self.questions = MappingProxyType(self._questions)
+
+    def load(self, positions):
+        missing = [self.qids[i] for i in positions if self.qids[i] not in self._questions]
+        if missing:
+            loaded = papers.load_questions(self.batch, self.subject, self.version, missing)
+            with self._lock:
+                self._questions.update(loaded)
+
+    def question(self, position: int) -> dict:
+        qid = self.qids[position]
+        if qid not in self._questions:
+            self.load([position])
+        return self._questions.get(qid)
+
+
+_papers = weakref.WeakValueDictionary()  # kept alive by the exams using them
+_papers_lock = threading.Lock()
+
+
+def get_paper(batch: str, subject: str, version=None, qids=None) -> Paper:
+    """The shared Paper for a published version, or for the live bank's current version.
+
+    `qids` (e.g. a drawn paper's index) names the questions without loading
+    them; by default the whole source is loaded. A Paper that lacks some of
+    the asked-for qids is replaced by one covering both (exams on the old one
+    keep it).
+    """
+    live = None if version is not None else question_cache.get_meta(batch, subject).get("version", 0)
+    key = (batch, subject, version, live)
+    questions = None
+    if qids is None:
+        questions = papers.load_questions(batch, subject, version)
+        qids = questions
+    with _papers_lock:
+        paper = _papers.get(key)
+        if paper is not None and all(q in paper.index for q in qids):
+            return paper
+        known = dict(paper.questions) if paper is not None else {}
+        paper = Paper(batch, subject, version, sorted(set(qids) | set(known)))
+        paper._questions.update(known)
+        if questions:
+            paper._questions.update(questions)
+        _papers[key] = paper
+        return paper
+
+
+# ----------------- Per-Student Exams -----------------
+class ExamSession:
+    __slots__ = ("paper", "order", "answers", "saved", "record", "attempt_id", "started", "touched")
+
+    def __init__(self, paper: Paper, qids: list, record=None, attempt_id=None, started=None):
+        self.paper = paper
+        paper.load([paper.index[q] for q in qids if q in paper.index])
+        # questions that couldn't be loaded (deleted since) are left out
+        self.order = array("H", [paper.index[q] for q in qids
+                                 if q in paper.index and q in paper.questions])
+        self.answers = array("b", [UNANSWERED]) * len(self.order)
+        self.saved = array("b", self.answers)
+        self.record = record  # how the paper was chosen, kept with the result
+        self.attempt_id = attempt_id
+        self.started = started or time.time()  # server clock; timed exams count from it
+        self.touched = time.monotonic()
+
+    def __len__(self):
+        return len(self.order)
+
+    def qid(self, pos: int) -> str:
+        return self.paper.qids[self.order[pos]]
+
+    def qids(self) -> list:
+        return [self.paper.qids[i] for i in self.order]
+
+    def question(self, pos: int) -> dict:
+        return self.paper.question(self.order[pos])
+
+    def answer_index(self, pos: int):
+        a = self.answers[pos]
+        return None if a == UNANSWERED else a
+
+    def answered(self) -> list:
+        return [a != UNANSWERED for a in self.answers]
+
+    def set_answer(self, pos: int, option):
+        options = self.question(pos)["options"]
+        self.answers[pos] = options.index(option) if option in options else UNANSWERED
+
+    def restore(self, answers: dict, saved: bool = False):
+        """Apply {qid: option} (from a draft or the browser); saved marks them as already stored."""
+        for pos in range(len(self.order)):
+            option = answers.get(self.qid(pos))
+            if option is not None and option in self.question(pos)["options"]:
+                self.set_answer(pos, option)
+                if saved:
+                    self.saved[pos] = self.answers[pos]
+
+    def _option(self, pos: int, a: int):
+        return self.question(pos)["options"][a]
+
+    def answers_dict(self) -> dict:
+        """{qid: option text} for grading and the browser copy."""
+        return {self.qid(p): self._option(p, a) for p, a in enumerate(self.answers) if a != UNANSWERED}
+
+    def unsaved(self) -> dict:
+        """Answers changed since the last call (for autosave), then marked as saved."""
+        delta = {self.qid(p): self._option(p, a)
+                 for p, (a, s) in enumerate(zip(self.answers, self.saved))
+                 if a != s and a != UNANSWERED}
+        self.saved = array("b", self.answers)
+        return delta
+
+
+_exams = OrderedDict()  # (session_id, exam_key) -> ExamSession, least recently used first
+_exams_lock = threading.Lock()
+_sweeper = None
+
+
+def get(session_id: str, exam_key: str):
+    with _exams_lock:
+        exam = _exams.get((session_id, exam_key))
+        if exam is not None:
+            exam.touched = time.monotonic()
+            _exams.move_to_end((session_id, exam_key))
+        return exam
+
+
+def put(session_id: str, exam_key: str, exam: ExamSession):
+    """Register a started exam; any other exam this session had is dropped."""
+    _start_sweeper()
+    with _exams_lock:
+        for key in [k for k in _exams if k[0] == session_id]:
+            del _exams[key]
+        _exams[(session_id, exam_key)] = exam
+
+
+def drop(session_id: str, exam_key: str):
+    with _exams_lock:
+        _exams.pop((session_id, exam_key), None)
+
+
+def count() -> int:
+    with _exams_lock:
+        return len(_exams)
+
+
+def sweep(idle_seconds: float) -> int:
+    """Evict exams untouched for idle_seconds. Returns how many went."""
+    cutoff = time.monotonic() - idle_seconds
+    with _exams_lock:
+        stale = [k for k, e in _exams.items() if e.touched < cutoff]
+        for key in stale:
+            del _exams[key]
+    return len(stale)
+
+
+def _sweep_forever():
+    while True:
+        cfg = config()
+        time.sleep(cfg["sweep_seconds"])
+        sweep(cfg["idle_minutes"] * 60)
+
+
+def _start_sweeper():
+    global _sweeper
+    with _exams_lock:
+        if _sweeper is None:
+            _sweeper = threading.Thread(target=_sweep_forever, daemon=True, name="exam-sweeper")
+            _sweeper.start()
@@ -1,17 +1,204 @@
 # firebase_config.py
+"""Shared data access for every panel.
 
-import firebase_admin
-from firebase_admin import credentials, firestore, db
+Pages do ``from firebase_config import db`` and keep calling
+``db.reference(path)`` exactly as they would with ``firebase_admin.db``.
+Nothing is imported or authenticated until the first reference is made, so a
+page draws its first widgets without paying for the service-account key.
 
-# Initialize Firebase only once
-if not firebase_admin._apps:
-    cred = credentials.Certificate("serviceAccountKey.json")
-    firebase_admin.initialize_app(cred, {
-        'databaseURL': "https://cvv-smartexam-default-rtdb.firebaseio.com"
-    })
+Backends only need a ``reference(path)`` method returning an object with the
+parts of the firebase_admin ``Reference`` API the app uses (get/set/update/
+push/delete/transaction/child and the order_by_*/limit_*/start_at/end_at
+queries). Set SMARTEXAM_BACKEND=memory to run against the in-memory
+stand-in in memory_backend.py, or install one with set_backend().
+"""
+import os
+import random
+import threading
+import time
 
-# Firestore client
-firestore_db = firestore.client()
+import db_metrics
+import settings
 
-# Realtime database reference
-realtime_db = db.reference()
\ No newline at end of file
+DATABASE_URL = "https://cvv-smartexam-v2-default-rtdb.asia-southeast1.firebasedatabase.app"
+HTTP_TIMEOUT = 30   # seconds per RTDB request (SDK default is 120)
+HTTP_POOL_SIZE = 64  # keep-alive connections shared by all sessions in a process
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+class FirebaseBackend:
+    """Realtime Database via firebase_admin, initialised on first use."""
+
+    def __init__(self):
+        self._db = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        import firebase_admin
+        import streamlit as st
+        from firebase_admin import credentials, db
+
+        if not firebase_admin._apps:
+            secrets = st.secrets["firebase"]
+            cred = credentials.Certificate({
+                "type": secrets["type"],
+                "project_id": secrets["project_id"],
+                "private_key_id": secrets["private_key_id"],
+                "private_key": secrets["private_key"].replace('\\n', '\n'),
+                "client_email": secrets["client_email"],
+                "client_id": secrets["client_id"],
+                "auth_uri": secrets["auth_uri"],
+                "token_uri": secrets["token_uri"],
+                "auth_provider_x509_cert_url": secrets["auth_provider_x509_cert_url"],
+                "client_x509_cert_url": secrets["client_x509_cert_url"],
+                "universe_domain": secrets["universe_domain"]
+            })
+            firebase_admin.initialize_app(cred, {
+                'databaseURL': DATABASE_URL,
+                'httpTimeout': HTTP_TIMEOUT
+            })
+        self._widen_connection_pool(db)
+        return db
+
+    @staticmethod
+    def _widen_connection_pool(db):
+        # The SDK caches one authorised requests session per app and reuses it
+        # for every reference, but mounts adapters with requests' default pool
+        # of 10 connections. Streamlit serves each session on its own thread,
+        # so widen the pool to stop sockets being dropped and re-opened.
+        import requests
+        from firebase_admin import _http_client
+
+        session = db.reference()._client.session
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE,
+            max_retries=_http_client.DEFAULT_RETRY_CONFIG)
+        session.mount("https://", adapter)
+
+    def reference(self, path="/"):
+        if self._db is None:
+            with self._lock:
+                if self._db is None:
+                    self._db = self._connect()
+        return self._db.reference(path)
+
+
+def _default_backend():
+    if os.environ.get("SMARTEXAM_BACKEND", "firebase").lower() == "memory":
+        from memory_backend import MemoryBackend
+        return MemoryBackend()
+    return FirebaseBackend()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _default_backend()
+    return _backend
+
+
+def set_backend(backend):
+    """Swap the data store (load tests, CI, local demos)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+# ----------------- Instrumentation -----------------
+# Every reference handed out by `db` is wrapped so each call that goes over
+# the wire is timed and attributed to the running panel in db_metrics. Sizing
+# a payload means encoding it to JSON again, so only [diagnostics]
+# payload_sample_rate of calls are sized (1 sizes all, 0 none).
+
+_IO_METHODS = {"get", "set", "update", "push", "delete", "transaction",
+               "set_if_unchanged", "get_if_changed"}
+_CHAIN_METHODS = {"order_by_key", "order_by_child", "order_by_value",
+                  "limit_to_first", "limit_to_last", "start_at", "end_at", "equal_to"}
+
+
+def call_count() -> int:
+    """RTDB calls made so far on the current thread."""
+    return db_metrics.call_count()
+
+
+_sample_rate = None
+
+
+def _sampled() -> bool:
+    global _sample_rate
+    if _sample_rate is None:
+        _sample_rate = float(settings.section("diagnostics", {"payload_sample_rate": 0.05})
+                             ["payload_sample_rate"])
+    return _sample_rate >= 1 or (_sample_rate > 0 and random.random() < _sample_rate)
+
+
+def _payload(op, args, result):
+    if op in ("get", "transaction"):
+        return db_metrics.payload_size(result[0] if isinstance(result, tuple) else result)
+    if op in ("set", "update", "push"):
+        return db_metrics.payload_size(args[0] if args else None)
+    if op == "set_if_unchanged":
+        return db_metrics.payload_size(args[1] if len(args) > 1 else None)
+    return 0
+
+
+class _Instrumented:
+    def __init__(self, target, path):
+        self._target = target
+        self._path = path
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name in _IO_METHODS:
+            def call(*args, **kwargs):
+                start = time.perf_counter()
+                result = attr(*args, **kwargs)
+                db_metrics.record(name, self._path, time.perf_counter() - start,
+                                  _payload(name, args, result) if _sampled() else None)
+                if name == "push":
+                    return _Instrumented(result, f"{self._path}/{result.key}")
+                return result
+            return call
+        if name == "child":
+            return lambda path: _Instrumented(attr(path), f"{self._path}/{path}")
+        if name in _CHAIN_METHODS:
+            return lambda *args, **kwargs: _Instrumented(attr(*args, **kwargs), self._path)
+        return attr
+
+
+class _Database:
+    def reference(self, path="/"):
+        return _Instrumented(get_backend().reference(path), path)
+
+
+db = _Database()
+
+
+def increment(n: int = 1) -> dict:
+    """Server-side increment, for set()/update() values: RTDB adds n to what is stored."""
+    return {".sv": {"increment": n}}
+
+
+def iter_children(path: str, chunk: int = 100):
+    """Yield (key, value) for every child of `path`, `chunk` children per read.
+
+    Pages with order_by_key/start_at/limit_to_first so large nodes (a subject's
+    results, a question bank) stream instead of arriving in one response.
+    """
+    query = db.reference(path).order_by_key()
+    after = None
+    while True:
+        if after is None:
+            page = query.limit_to_first(chunk).get() or {}
+        else:
+            # start_at is inclusive: ask for one more and drop the cursor
+            page = query.start_at(after).limit_to_first(chunk + 1).get() or {}
+            page.pop(after, None)
+        yield from page.items()
+        if len(page) < chunk:
+            return
+        after = next(reversed(page))
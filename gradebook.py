@@ -0,0 +1,195 @@
+"""Whole-batch gradebook export.
+
+One row per stored result in results/{batch}/*, subject by subject:
+
+    batch, subject, student, name, score, total, paper_version,
+    answered, correct, qids, marks
+
+``qids`` lists the questions in the order the student saw them and
+``marks`` has one character per question in that order: "1" correct, "0"
+wrong, "-" skipped. Results are read ``chunk`` at a time (see
+firebase_config.iter_children) and written as they arrive, so memory stays
+flat however large the batch. Compact and legacy records (result_codec)
+export alike.
+
+The teacher panel's download is different: st.download_button reads the
+whole file into server memory, so it is capped at [gradebook]
+max_download_mb. Larger batches are exported here:
+
+    python gradebook.py BATCH [--format csv|parquet] [--out FILE] [--subject NAME ...]
+"""
+import argparse
+import csv
+import io
+import sys
+import tempfile
+
+import result_codec
+import settings
+from firebase_config import db, iter_children
+
+COLUMNS = ["batch", "subject", "student", "name", "score", "total", "paper_version",
+           "answered", "correct", "qids", "marks"]
+FORMATS = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+EXPORT_CHUNK = 500    # results per read
+PARQUET_GROUP = 5000  # rows per Parquet row group
+
+DEFAULTS = {
+    "max_download_mb": 50,  # largest gradebook the teacher panel will build in memory
+}
+
+
+def config() -> dict:
+    return settings.section("gradebook", DEFAULTS)
+
+
+class ExportTooLarge(Exception):
+    pass
+
+
+def subjects(batch: str) -> list:
+    """Subjects of a batch that have results (keys only)."""
+    return sorted(db.reference(f"results/{batch}").get(shallow=True) or {})
+
+
+def _marks(record: dict) -> tuple:
+    if result_codec.is_compact(record):
+        qids = record.get("qids") or []
+        flags = result_codec.unpack_bits(record.get("correct"), len(qids))
+        marks = "".join("-" if ch == result_codec.SKIP else "1" if ok else "0"
+                        for ch, ok in zip(record.get("picks") or "", flags))
+        return qids, marks
+    details = record.get("details") or []
+    qids = [d.get("qid") or "?" for d in details]
+    marks = "".join("-" if not d.get("your_answer") else "1" if d.get("is_correct") else "0"
+                    for d in details)
+    return qids, marks
+
+
+def flatten(batch: str, subject: str, student: str, record: dict) -> dict:
+    qids, marks = _marks(record)
+    return {
+        "batch": batch,
+        "subject": subject,
+        "student": student,
+        "name": record.get("name") or student,
+        "score": float(record.get("score") or 0),
+        "total": float(record.get("total") or 0),
+        "paper_version": (record.get("paper") or {}).get("version"),
+        "answered": len(marks) - marks.count("-"),
+        "correct": marks.count("1"),
+        "qids": " ".join(qids),
+        "marks": marks,
+    }
+
+
+def iter_rows(batch: str, only=None, chunk: int = EXPORT_CHUNK):
+    """Yield one flattened row per result, subject by subject."""
+    for subject in only or subjects(batch):
+        for student, record in iter_children(f"results/{batch}/{subject}", chunk):
+            if isinstance(record, dict):
+                yield flatten(batch, subject, student, record)
+
+
+def write_csv(rows, out) -> int:
+    """Write rows to a text file as they come. Returns the row count."""
+    writer = csv.DictWriter(out, fieldnames=COLUMNS)
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def write_parquet(rows, out, group: int = PARQUET_GROUP) -> int:
+    """Write rows to a path or binary file, `group` rows per row group."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    schema = pa.schema([
+        ("batch", pa.string()), ("subject", pa.string()), ("student", pa.string()),
+        ("name", pa.string()), ("score", pa.float64()), ("total", pa.float64()),
+        ("paper_version", pa.int64()), ("answered", pa.int32()), ("correct", pa.int32()),
+        ("qids", pa.string()), ("marks", pa.string()),
+    ])
+    count = 0
+    with pq.ParquetWriter(out, schema) as writer:
+        buffer = []
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) == group:
+                writer.write_table(pa.Table.from_pylist(buffer, schema=schema))
+                count += len(buffer)
+                buffer = []
+        if buffer or not count:
+            writer.write_table(pa.Table.from_pylist(buffer, schema=schema))
+            count += len(buffer)
+    return count
+
+
+def export(batch: str, fmt: str, out, only=None) -> int:
+    """Stream a batch's results to `out` (a text file for csv, a path or binary file for parquet)."""
+    rows = iter_rows(batch, only)
+    if fmt == "parquet":
+        return write_parquet(rows, out)
+    return write_csv(rows, out)
+
+
+def _capped(rows, out, flush, max_bytes):
+    """Pass rows through, raising ExportTooLarge once `out` holds more than max_bytes."""
+    for n, row in enumerate(rows, 1):
+        yield row
+        if n % EXPORT_CHUNK == 0:
+            flush()
+            if out.tell() > max_bytes:
+                raise ExportTooLarge(f"gradebook is over the {max_bytes / 2 ** 20:g} MB limit")
+
+
+def spool(batch: str, fmt: str, only=None, max_bytes=None):
+    """The export in a temporary file, rewound for reading (for st.download_button).
+
+    The temporary file doesn't bound memory: the download button reads it
+    all into bytes. Raises ExportTooLarge past `max_bytes`.
+    """
+    out = tempfile.TemporaryFile()
+    text = None if fmt == "parquet" else io.TextIOWrapper(out, encoding="utf-8", newline="")
+    rows = iter_rows(batch, only)
+    if max_bytes:
+        rows = _capped(rows, out, text.flush if text else out.flush, max_bytes)
+    if text is None:
+        write_parquet(rows, out)
+    else:
+        write_csv(rows, text)
+        text.flush()
+        text.detach()
+    if max_bytes and out.tell() > max_bytes:
+        raise ExportTooLarge(f"gradebook is over the {max_bytes / 2 ** 20:g} MB limit")
+    out.seek(0)
+    return out
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Export a batch's results as one sheet.")
+    parser.add_argument("batch")
+    parser.add_argument("--format", choices=list(FORMATS), default="csv")
+    parser.add_argument("--out", help="file to write (default: stdout for csv)")
+    parser.add_argument("--subject", action="append", help="only these subjects (repeatable)")
+    args = parser.parse_args(argv)
+
+    if args.format == "parquet" and not args.out:
+        parser.error("--out is required for parquet")
+    if args.out is None:
+        count = export(args.batch, args.format, sys.stdout, args.subject)
+    elif args.format == "parquet":
+        count = export(args.batch, args.format, args.out, args.subject)
+    else:
+        with open(args.out, "w", encoding="utf-8", newline="") as f:
+            count = export(args.batch, args.format, f, args.subject)
+    print(f"{count} rows", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,249 @@
+import numpy as np
+
+import exam_settings
+import item_stats
+import papers
+import question_cache
+import result_codec
+import scores
+from firebase_config import db, increment, iter_children
+
+# ----------------- Grading -----------------
+# An answer key is compiled once into arrays indexed by question row:
+#   correct[q]    index of the right option (-1 if the question has no answer)
+#   credit[q, o]  fraction of full marks option o earns: 1 for the answer,
+#                 a question's optional "partial" list for near-misses, else 0
+# Answers become a matrix of chosen option indices, one row per student
+# (SKIPPED for no answer, ABSENT for a question not on that student's paper,
+# OTHER for text no longer among the options), so grading one submission and
+# regrading a whole subject are the same few array operations.
+# Marking rules (points per correct / wrong / skipped question) come from
+# batches/{b}/{s}/meta/marking; wrong < 0 is negative marking.
+
+SKIPPED, ABSENT = -1, -2
+REGRADE_CHUNK = 200  # results per read when regrading
+
+
+def _number(x):
+    """Whole scores stay ints (as stored before marking rules existed)."""
+    x = round(float(x), 2)
+    return int(x) if x == int(x) else x
+
+
+class AnswerKey:
+    def __init__(self, questions: dict, marking: dict):
+        self.qids = list(questions)
+        self.row = {qid: i for i, qid in enumerate(self.qids)}
+        self.questions = [questions[qid] for qid in self.qids]
+        self.options = [list(q.get("options") or []) for q in self.questions]
+        self.marking = {k: float(v) for k, v in marking.items()}
+        width = max((len(o) for o in self.options), default=0) + 1
+        self.other = width - 1  # a zero-credit column for unknown answers
+        self.correct = np.full(len(self.qids), -1, dtype=np.int16)
+        self.credit = np.zeros((len(self.qids), width), dtype=np.float32)
+        for i, q in enumerate(self.questions):
+            partial = q.get("partial")
+            if isinstance(partial, list):
+                for o, c in enumerate(partial[:len(self.options[i])]):
+                    self.credit[i, o] = float(c or 0)
+            if q.get("answer") in self.options[i]:
+                self.correct[i] = self.options[i].index(q["answer"])
+                self.credit[i, self.correct[i]] = 1.0
+        self._by_text = None
+
+    def find(self, detail: dict):
+        """Row of a stored detail's question, by qid or (older results) by text."""
+        qid = detail.get("qid")
+        if qid is not None:
+            return self.row.get(qid)
+        if self._by_text is None:
+            self._by_text = {q.get("question"): i for i, q in enumerate(self.questions)}
+        return self._by_text.get(detail.get("question"))
+
+    def option_index(self, row: int, chosen) -> int:
+        if not chosen:
+            return SKIPPED
+        options = self.options[row]
+        return options.index(chosen) if chosen in options else self.other
+
+    def pick(self, row: int, index) -> int:
+        """A stored option index (None = skipped) as a column of `credit`."""
+        if index is None:
+            return SKIPPED
+        return index if 0 <= index < len(self.options[row]) else self.other
+
+    def answer(self, row: int):
+        return self.questions[row].get("answer")
+
+
+def compile_key(questions: dict, marking=None) -> AnswerKey:
+    return AnswerKey(questions, marking or exam_settings.MARKING_DEFAULTS)
+
+
+def grade_matrix(key: AnswerKey, chosen):
+    """Scores, totals and the is-correct mask for a (students x questions) index matrix."""
+    chosen = np.asarray(chosen, dtype=np.int16)
+    on_paper = chosen != ABSENT
+    rows = np.arange(len(key.qids))
+    earned = key.credit[rows, np.clip(chosen, 0, None)]
+    m = key.marking
+    points = np.select(
+        [~on_paper, chosen == SKIPPED, earned > 0],
+        [0.0, m["skipped"], earned * m["correct"]],
+        default=m["wrong"])
+    scores = points.sum(axis=1)
+    totals = on_paper.sum(axis=1) * m["correct"]
+    return scores, totals, (chosen == key.correct) & (key.correct >= 0)
+
+
+def grade(key: AnswerKey, answers: dict, qids=None):
+    """Grade one submission {qid: chosen option}. Returns (score, total, details).
+
+    `qids` is the paper as shown to the student (default: the answered
+    questions); questions not in the key are left out.
+    """
+    qids = [qid for qid in (qids if qids is not None else answers) if qid in key.row]
+    chosen = np.full((1, len(key.qids)), ABSENT, dtype=np.int16)
+    for qid in qids:
+        chosen[0, key.row[qid]] = key.option_index(key.row[qid], answers.get(qid, ""))
+    score, total, correct = grade_matrix(key, chosen)
+    details = []
+    for qid in qids:
+        row = key.row[qid]
+        details.append({
+            "qid": qid,
+            "question": key.questions[row]["question"],
+            "your_answer": answers.get(qid, ""),
+            "correct_answer": key.answer(row),
+            "is_correct": bool(correct[0, row])
+        })
+    return _number(score[0]), _number(total[0]), details
+
+
+def answer_key(batch: str, subject: str, version=None, qids=None) -> AnswerKey:
+    """The compiled key for a published version or the live bank (optionally just `qids`)."""
+    if qids is None:
+        qids = list(papers.load_questions(batch, subject, version))
+    return compile_key(papers.load_graded(batch, subject, version, qids),
+                       exam_settings.marking_settings(batch, subject))
+
+
+# ----------------- Bulk Regrade -----------------
+def regrade(batch: str, subject: str, chunk: int = REGRADE_CHUNK) -> tuple:
+    """Regrade every stored result against its paper's answer key and the marking rules.
+
+    Results on the live bank use the live key. Results on a published version
+    use that version's key, first corrected (papers.correct_key) with any
+    answer fixed in the live bank on a question whose options are unchanged,
+    so the review rebuilt from the version agrees with the new score.
+    Results are streamed `chunk` at a time and graded a chunk per array pass;
+    each chunk's changed scores and correctness flags go in one multi-path
+    update, with the score summary and item counters moved by increments.
+    Returns (results_checked, results_changed).
+    """
+    marking = exam_settings.marking_settings(batch, subject)
+    live = question_cache.get_questions(batch, subject)
+    keys = {}
+
+    def key_for(version):
+        if version not in keys:
+            if version is None:
+                keys[version] = compile_key(live, marking)
+            else:
+                bundle = papers.get_bundle(batch, subject, version)
+                published = papers.get_answer_key(batch, subject, version)
+                fixes = {qid: live[qid]["answer"] for qid, q in bundle.items()
+                         if qid in live and live[qid].get("answer")
+                         and live[qid].get("options") == q.get("options")
+                         and live[qid]["answer"] != published.get(qid)}
+                if fixes:
+                    papers.correct_key(batch, subject, version, fixes)
+                keys[version] = compile_key(papers.load_graded(batch, subject, version, list(bundle)),
+                                            marking)
+        return keys[version]
+
+    results_path = f"results/{batch}/{subject}"
+    summary = scores.summary_path(batch, subject)
+    item_base = item_stats.stats_path(batch, subject)
+    checked = changed = 0
+
+    def run(page):
+        nonlocal checked, changed
+        changes, moves, flips = {}, {}, {}
+        groups = {}
+        for name, result in page:
+            groups.setdefault((result.get("paper") or {}).get("version"), []).append((name, result))
+        for version, group in groups.items():
+            key = key_for(version)
+            chosen = np.full((len(group), len(key.qids)), ABSENT, dtype=np.int16)
+            located = []
+            for i, (_, result) in enumerate(group):
+                if result_codec.is_compact(result):
+                    rows = [key.row.get(qid) for qid in result.get("qids") or []]
+                    for ch, row in zip(result["picks"], rows):
+                        if row is not None:
+                            chosen[i, row] = key.pick(row, result_codec.pick_index(ch))
+                else:
+                    rows = [key.find(d) for d in result.get("details") or []]
+                    for d, row in zip(result.get("details") or [], rows):
+                        if row is not None:
+                            chosen[i, row] = key.option_index(row, d.get("your_answer"))
+                located.append(rows)
+            new_scores, new_totals, correct = grade_matrix(key, chosen)
+            for i, (name, result) in enumerate(group):
+                checked += 1
+                if None in located[i]:
+                    continue  # a question gone from its key: can't regrade, keep it as stored
+                score, total = _number(new_scores[i]), _number(new_totals[i])
+                dirty = score != result.get("score") or total != result.get("total")
+                if result_codec.is_compact(result):
+                    flags = [bool(correct[i, row]) for row in located[i]]
+                    bits = result_codec.pack_bits(flags)
+                    if bits != result.get("correct"):
+                        old = result_codec.unpack_bits(result.get("correct"), len(flags))
+                        for qid, was, now in zip(result.get("qids") or [], old, flags):
+                            if was != now:
+                                flips[qid] = flips.get(qid, 0) + (1 if now else -1)
+                        changes[f"{results_path}/{name}/correct"] = bits
+                        dirty = True
+                for j, (d, row) in enumerate(zip(result.get("details") or [], located[i])):
+                    is_correct, answer = bool(correct[i, row]), key.answer(row)
+                    if d.get("is_correct") != is_correct or d.get("correct_answer") != answer:
+                        if bool(d.get("is_correct")) != is_correct:
+                            qid = key.qids[row]
+                            flips[qid] = flips.get(qid, 0) + (1 if is_correct else -1)
+                        changes[f"{results_path}/{name}/details/{j}/is_correct"] = is_correct
+                        changes[f"{results_path}/{name}/details/{j}/correct_answer"] = answer
+                        dirty = True
+                if dirty:
+                    old_score = result.get("score", 0)
+                    changes[f"{results_path}/{name}/score"] = score
+                    changes[f"{results_path}/{name}/total"] = total
+                    changes[f"{summary}/students/{name}/score"] = score
+                    changes[f"{summary}/students/{name}/total"] = total
+                    for path, n in (("stats/sum", score - old_score),
+                                    (f"stats/hist/{scores.bucket(old_score)}", -1),
+                                    (f"stats/hist/{scores.bucket(score)}", 1),
+                                    (f"stats/fine/{scores.fine_bucket(old_score)}", -1),
+                                    (f"stats/fine/{scores.fine_bucket(score)}", 1)):
+                        moves[path] = moves.get(path, 0) + n
+                    changed += 1
+        for path, n in moves.items():
+            if n:
+                changes[f"{summary}/{path}"] = increment(n)
+        for qid, n in flips.items():
+            if n:
+                changes[f"{item_base}/{qid}/correct"] = increment(n)
+        if changes:
+            db.reference().update(changes)
+
+    page = []
+    for name, result in iter_children(results_path, chunk):
+        page.append((name, result))
+        if len(page) == chunk:
+            run(page)
+            page = []
+    run(page)
+    if changed:
+        scores.invalidate(batch, subject)
+    return checked, changed
@@ -0,0 +1,113 @@
+import papers
+import question_cache
+import result_codec
+import submission
+from firebase_config import db, increment
+
+# ----------------- Item Statistics -----------------
+# Per-question counters, bumped by every submission:
+#   item_stats/{b}/{s}/{qid} = {"attempts": n, "correct": n,
+#                               "options": {"o0": n, "o1": n, ..., "skipped": n}}
+# Options are keyed by their position in the question ("o2"), since option
+# text may contain characters RTDB keys can't. The counters are RTDB
+# server-side increments sent as one multi-path update, so a whole class
+# submitting together never contends on a transaction, and reading the
+# analysis costs one read of O(questions) whatever the class size.
+
+SKIPPED = "skipped"
+OTHER = "other"  # answer no longer among the options (question edited since)
+
+
+def stats_path(batch: str, subject: str) -> str:
+    return f"item_stats/{batch}/{subject}"
+
+
+def option_key(question: dict, chosen: str) -> str:
+    if not chosen:
+        return SKIPPED
+    options = question.get("options") or []
+    return f"o{options.index(chosen)}" if chosen in options else OTHER
+
+
+def tally(questions: dict, details: list, counts: dict):
+    """Add one result's answers to counts[qid], matching older results by question text."""
+    by_text = None
+    for d in details or []:
+        qid = d.get("qid")
+        if qid is None:
+            # results stored before details carried the qid
+            if by_text is None:
+                by_text = {q["question"]: k for k, q in questions.items()}
+            qid = by_text.get(d.get("question"))
+        if qid not in questions:
+            continue
+        c = counts.setdefault(qid, {"attempts": 0, "correct": 0, "options": {}})
+        c["attempts"] += 1
+        c["correct"] += 1 if d.get("is_correct") else 0
+        key = option_key(questions[qid], d.get("your_answer"))
+        c["options"][key] = c["options"].get(key, 0) + 1
+
+
+def record(batch: str, subject: str, details: list, paper_version=None):
+    """Bump the counters for one submission in a single write."""
+    counts = {}
+    questions = papers.load_questions(batch, subject, paper_version,
+                                      [d["qid"] for d in details if d.get("qid")])
+    tally(questions, details, counts)
+    if not counts:
+        return
+    base = stats_path(batch, subject)
+    changes = {}
+    for qid, c in counts.items():
+        changes[f"{base}/{qid}/attempts"] = increment(c["attempts"])
+        if c["correct"]:
+            changes[f"{base}/{qid}/correct"] = increment(c["correct"])
+        for key, n in c["options"].items():
+            changes[f"{base}/{qid}/options/{key}"] = increment(n)
+    db.reference().update(changes)
+
+
+def clear(batch: str, subject: str):
+    db.reference(stats_path(batch, subject)).delete()
+
+
+def backfill(batch: str, subject: str, chunk: int = 50) -> int:
+    """Rebuild the counters from results/{b}/{s} in one pass over the results.
+
+    Results are read `chunk` at a time and the counters replaced in one write.
+    Submissions landing while this runs can be missed, so run it when no exam
+    is live. Returns the number of results counted.
+    """
+    counts = {}
+    n = 0
+    questions = question_cache.get_questions(batch, subject)
+    for _, result in submission.iter_results(batch, subject, chunk):
+        tally(questions, result_codec.details(batch, subject, result), counts)
+        n += 1
+    if counts:
+        db.reference(stats_path(batch, subject)).set(counts)
+    else:
+        clear(batch, subject)
+    return n
+
+
+def analysis(batch: str, subject: str) -> list:
+    """One row per current question, hardest (lowest % correct) first."""
+    counters = db.reference(stats_path(batch, subject)).get() or {}
+    rows = []
+    for qid, q in question_cache.get_questions(batch, subject).items():
+        c = counters.get(qid) or {}
+        attempts = c.get("attempts", 0)
+        options = c.get("options") or {}
+        wrong = [(n, q["options"][int(k[1:])]) for k, n in options.items()
+                 if k.startswith("o") and k[1:].isdigit() and int(k[1:]) < len(q["options"])
+                 and q["options"][int(k[1:])] != q["answer"]]
+        top_wrong = max(wrong) if wrong else None
+        rows.append({
+            "question": q["question"],
+            "attempts": attempts,
+            "correct_pct": round(100 * c.get("correct", 0) / attempts, 1) if attempts else None,
+            "skipped": options.get(SKIPPED, 0),
+            "top_distractor": f"{top_wrong[1]} ({top_wrong[0]})" if top_wrong else "",
+        })
+    return sorted(rows, key=lambda r: (r["correct_pct"] is None, r["correct_pct"] or 0))
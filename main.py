@@ -1,28 +1,36 @@
 import streamlit as st
 import streamlit.components.v1 as components
-import firebase_admin
-from firebase_admin import credentials, db
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import datetime
+import functools
+import math
 import random
 import re
-
-# ----------------- Firebase Setup -----------------
-if not firebase_admin._apps:
-    cred = credentials.Certificate({
-        "type": st.secrets["firebase"]["type"],
-        "project_id": st.secrets["firebase"]["project_id"],
-        "private_key_id": st.secrets["firebase"]["private_key_id"],
-        "private_key": st.secrets["firebase"]["private_key"].replace('\\n', '\n'),
-        "client_email": st.secrets["firebase"]["client_email"],
-        "client_id": st.secrets["firebase"]["client_id"],
-        "auth_uri": st.secrets["firebase"]["auth_uri"],
-        "token_uri": st.secrets["firebase"]["token_uri"],
-        "auth_provider_x509_cert_url": st.secrets["firebase"]["auth_provider_x509_cert_url"],
-        "client_x509_cert_url": st.secrets["firebase"]["client_x509_cert_url"],
-        "universe_domain": st.secrets["firebase"]["universe_domain"]
-    })
-    firebase_admin.initialize_app(cred, {
-        'databaseURL': 'https://cvv-smartexam-v2-default-rtdb.asia-southeast1.firebasedatabase.app'
-    })
+import time
+import uuid
+
+import autosave
+import catalog
+import credentials
+import exam_schedule
+import exam_settings
+import exam_state
+import gradebook
+import grading
+import db_metrics
+import item_stats
+import offline
+import papers
+import proctor
+import question_cache
+import question_index
+import question_io
+import result_codec
+import scores
+import settings
+import submission
+import submit_queue
+from firebase_config import db
 
 # ----------------- Streamlit Config -----------------
 st.set_page_config(page_title="CVV SmartExam Portal", page_icon="📘", layout="centered")
@@ -33,237 +41,909 @@ def safe_key(value: str) -> str:
     """Make Firebase-safe keys by replacing invalid characters."""
     return re.sub(r'[.#$\\[\\]/]', '_', value.strip())
 
+DIAGNOSTICS_DEFAULTS = {"show_db_calls": False, "prometheus_file": "", "export_interval_seconds": 15}
+
+def show_db_calls(scope, calls):
+    """Record (and optionally show) how many RTDB calls this rerun made."""
+    history = st.session_state.setdefault("_db_calls", [])
+    history.append((scope, calls))
+    del history[:-50]
+    if settings.section("diagnostics", DIAGNOSTICS_DEFAULTS)["show_db_calls"]:
+        st.caption(f"🔌 RTDB calls this rerun ({scope}): {calls}")
+
+def profiled(panel):
+    """Attribute RTDB calls made by a panel or fragment to it, per rerun and per session."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            ctx = get_script_run_ctx()
+            stats = db_metrics.session_stats(ctx.session_id if ctx else "bare", panel)
+            with db_metrics.scope(panel, stats) as calls:
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    show_db_calls(panel, calls())
+        return run
+    return wrap
+
+# ----------------- Student Result Views -----------------
+def show_result(result, batch, subject):
+    """Score banner plus the per-question review expander (rebuilt from the paper)."""
+    st.success(f"✅ Submitted! You scored {result['score']} out of {result['total']}.")
+    with st.expander("📊 View Your Answers"):
+        for i, r in enumerate(result_codec.details(batch, subject, result)):
+            st.markdown(f"Q{i+1}: {r['question']}")
+            st.markdown(f"- Your Answer: {r['your_answer'] or '—'}")
+            if not r['is_correct']:
+                st.markdown(f"- ❌ Correct Answer: {r['correct_answer']}")
+            else:
+                st.markdown("- ✅ Correct!")
+            st.markdown("---")
+
+@st.fragment(run_every=2)
+def wait_for_submission(ticket):
+    """Poll the write-behind queue; rerun the page once the write has landed."""
+    state = submit_queue.get_queue().status(ticket)["state"]
+    if state == submit_queue.QUEUED:
+        st.info("📨 Submission queued! Your score will appear here as soon as it is saved.")
+    elif state == submit_queue.FAILED:
+        # retried in the background with the answers as submitted
+        st.warning("📨 Still saving your submission. Please keep this page open.")
+    else:
+        st.rerun()
+
+def set_page(page_key, page):
+    st.session_state[page_key] = page
+
+def request_submit(submit_key):
+    # runs before the rerun, so the browser copy records the submit before the write is tried
+    st.session_state[submit_key] = True
+
+def clock(epoch, fmt="%d %b %H:%M:%S %Z"):
+    """Server epoch seconds as wall-clock time in the [schedule] timezone."""
+    return datetime.datetime.fromtimestamp(epoch, exam_schedule.timezone()).strftime(fmt)
+
+def countdown_html(label, seconds):
+    return f"""<div style="font-family:sans-serif">{label} <b id="t"></b></div>
+<script>
+const end = Date.now() + {int(seconds)} * 1000;
+function tick() {{
+  const s = Math.max(0, Math.round((end - Date.now()) / 1000));
+  const h = Math.floor(s / 3600), m = Math.floor(s % 3600 / 60);
+  document.getElementById("t").textContent =
+    (h ? h + ":" + String(m).padStart(2, "0") : m) + ":" + String(s % 60).padStart(2, "0");
+  if (s > 0) setTimeout(tick, 1000);
+}}
+tick();
+</script>"""
+
+@st.fragment(run_every=exam_schedule.config()["clock_seconds"])
+def exam_clock(label, until):
+    """Countdown to `until` (server time), ticking in the browser; reruns the page once it passes."""
+    left = until - time.time()
+    if left <= 0:
+        st.rerun()
+    components.html(countdown_html(label, left), height=30)
+
+def session_id():
+    """This browser session's key in the exam_state registry."""
+    return st.session_state.setdefault("_exam_session", uuid.uuid4().hex)
+
+def question_palette(answered, page_size, current_page):
+    """One-line answered/unanswered map of the whole paper."""
+    cells = []
+    for idx, done in enumerate(answered):
+        mark = "🟩" if done else "⬜"
+        label = f"**{idx+1}**" if idx // page_size == current_page else f"{idx+1}"
+        cells.append(f"{mark}{label}")
+    st.markdown(" ".join(cells))
+
+@st.fragment
+@profiled("student/exam")
+def exam_body(student_name, selected_subject, safe_name, safe_batch, safe_subject, result_etag):
+    """Questions, navigation and submit. Reruns on its own when a radio is clicked,
+    so answering skips the catalog, retake check and question load above it."""
+    ss_ticket_key = f"{safe_name}_{safe_batch}_{safe_subject}_ticket"
+    ss_submit_key = f"{safe_name}_{safe_batch}_{safe_subject}_submit"
+    exam_key = f"{safe_name}/{safe_batch}/{safe_subject}"
+    exam = exam_state.get(session_id(), exam_key)
+    if exam is None:
+        st.rerun()  # swept after sitting idle: the panel offers Resume from the draft
+    paper = exam.record
+    attempt_id = exam.attempt_id
+    use_autosave = autosave.config()["enabled"]
+    use_offline = offline.enabled()
+    # ⏰ timed exams end at the deadline counted from the server's start time;
+    # a rerun after it submits what was answered up to then
+    ends = exam_schedule.deadline(exam_schedule.get_schedule(safe_batch, safe_subject), exam.started)
+    timed_out = ends is not None and time.time() >= ends
+    if timed_out:
+        st.warning("⏰ Time's up! Submitting your answers…")
+    else:
+        if ends is not None:
+            exam_clock("⏳ Time left:", ends)
+        st.markdown("### 📋 Questions")
+
+        display = exam_settings.display_settings(safe_batch, safe_subject)
+        paged = display["mode"] == "paged"
+        if paged:
+            # only the current page's widgets are built on each rerun
+            page_size = max(1, display["page_size"])
+            pages = max(1, math.ceil(len(exam) / page_size))
+            ss_page_key = f"{safe_name}_{safe_batch}_{safe_subject}_page"
+            page = min(st.session_state.get(ss_page_key, 0), pages - 1)
+            shown = range(page * page_size, min((page + 1) * page_size, len(exam)))
+        else:
+            shown = range(len(exam))
+
+        for idx in shown:
+            qid = exam.qid(idx)
+            q = exam.question(idx)
+            question_label = f"Q{idx+1}: {q['question']}"
+            unique_key = f"{safe_name}_{safe_batch}_{safe_subject}_{qid}_{idx}"
+            # no preselected option: an untouched question stays unanswered (skipped)
+            choice = st.radio(question_label, q['options'], key=unique_key,
+                              index=exam.answer_index(idx))
+            if choice is not None:
+                exam.set_answer(idx, choice)
+
+        if paged:
+            col1, col2, col3 = st.columns([1, 2, 1])
+            with col1:
+                st.button("⬅ Prev", disabled=page == 0,
+                          on_click=set_page, args=(ss_page_key, page - 1))
+            with col2:
+                st.markdown(f"Page {page+1} of {pages}")
+            with col3:
+                st.button("Next ➡", disabled=page >= pages - 1,
+                          on_click=set_page, args=(ss_page_key, page + 1))
+            answered = exam.answered()
+            question_palette(answered, page_size, page)
+            unanswered = answered.count(False)
+            if unanswered:
+                st.caption(f"⚠ {unanswered} question(s) not answered yet.")
+
+        if use_autosave:
+            autosave.save_delta(safe_batch, safe_subject, safe_name, exam.unsaved())
+        if use_offline:
+            # 📴 keep a copy in the browser in case the connection drops from here on
+            offline.answer_buffer(safe_batch, safe_subject, safe_name, {
+                "attempt_id": attempt_id,
+                "answers": exam.answers_dict(),
+                "submit_requested": st.session_state.get(ss_submit_key, False)
+            })
+    answers = exam.answers_dict()
+    q_order = exam.qids()
+
+    if timed_out or st.button("🎯 Submit Answers", on_click=request_submit, args=(ss_submit_key,)):
+        if submit_queue.enabled():
+            st.session_state[ss_ticket_key] = submit_queue.get_queue().enqueue(
+                safe_batch, safe_subject, safe_name,
+                student_name, selected_subject, answers, qids=q_order, paper=paper,
+                attempt_id=attempt_id)
+            if use_autosave:
+                autosave.discard(safe_batch, safe_subject, safe_name)
+            exam_state.drop(session_id(), exam_key)
+            st.rerun()
+
+        try:
+            result = submission.submit_exam(safe_batch, safe_subject, safe_name,
+                                            student_name, selected_subject, answers,
+                                            etag=result_etag, qids=q_order, paper=paper,
+                                            attempt_id=attempt_id)
+        except Exception:
+            if not use_offline:
+                raise
+            st.warning("📴 We couldn't reach the server. Your answers are saved on this device "
+                       "and will be submitted when you reconnect — just reload this page.")
+            return
+        if result is None:
+            st.error("❌ Submission blocked. Already taken.")
+            return
+        if use_autosave:
+            autosave.discard(safe_batch, safe_subject, safe_name)
+        exam_state.drop(session_id(), exam_key)
+
+        show_result(result, safe_batch, safe_subject)
+        st.balloons()
+
 # ----------------- Student Panel -----------------
+@profiled("student")
 def student_panel():
     st.header("🎓 Student Panel")
     student_name = st.text_input("Enter your name").strip()
 
-    batch_data = db.reference("batches").get()
-    batch_options = list(batch_data.keys()) if batch_data else []
+    batch_options = catalog.list_batches()
     selected_batch = st.selectbox("Select your Batch", batch_options)
 
     if student_name and selected_batch:
         safe_batch = safe_key(selected_batch)
-        subject_data = db.reference(f"batches/{safe_batch}").get()
-        subject_options = list(subject_data.keys()) if subject_data else []
+        subject_options = catalog.list_subjects(safe_batch)
         selected_subject = st.selectbox("Choose Subject", subject_options)
 
         if selected_subject:
             safe_subject = safe_key(selected_subject)
             safe_name = safe_key(student_name)
 
+            # 📨 Submission waiting in the write-behind queue
+            ss_ticket_key = f"{safe_name}_{safe_batch}_{safe_subject}_ticket"
+            ticket = st.session_state.get(ss_ticket_key)
+            if ticket is None and submit_queue.enabled():
+                ticket = submit_queue.get_queue().pending_ticket(safe_batch, safe_subject, safe_name)
+            if ticket:
+                status = submit_queue.get_queue().status(ticket)
+                if status["state"] in (submit_queue.QUEUED, submit_queue.FAILED):
+                    wait_for_submission(ticket)
+                    st.stop()
+                elif status["state"] == submit_queue.STORED:
+                    show_result(status["result"], safe_batch, safe_subject)
+                    st.stop()
+                elif status["state"] == submit_queue.DEAD:
+                    # the answers are kept on the server for the teacher; starting again would replace them
+                    st.error("⚠ We couldn't save your answers. Please contact your teacher.")
+                    st.stop()
+                st.session_state.pop(ss_ticket_key, None)
+
             # 🚫 Prevent retake
-            result_ref = db.reference(f"results/{safe_batch}/{safe_subject}/{safe_name}")
-            if result_ref.get():
+            existing_result, result_etag = submission.check_existing(safe_batch, safe_subject, safe_name)
+
+            # 📴 What this browser kept of an attempt whose session was lost
+            local = None
+            exam_key = f"{safe_name}/{safe_batch}/{safe_subject}"
+            started = exam_state.get(session_id(), exam_key) is not None
+            replayed = st.session_state.get(f"offline_replayed_{exam_key}")
+            if offline.enabled() and not started:
+                local = offline.answer_buffer(safe_batch, safe_subject, safe_name,
+                                              offline.DONE if existing_result or replayed else None)
+            if replayed == offline.EXPIRED:
+                st.warning("⌛ Your saved submission arrived after the grace period, so it "
+                           "wasn't accepted. Please contact your teacher.")
+            elif replayed == offline.REJECTED:
+                st.warning("⚠ Your saved submission wasn't accepted because another attempt at "
+                           "this exam was already submitted. Please contact your teacher.")
+            if existing_result:
+                if local and local.get("attempt_id") == existing_result.get("attempt_id"):
+                    show_result(existing_result, safe_batch, safe_subject)  # reconnected after the submit landed
+                    st.stop()
                 st.error("❌ You have already submitted this exam. Retaking is not allowed.")
                 st.stop()
+            if local and local.get("submit_requested") and not replayed:
+                state, result = offline.replay(safe_batch, safe_subject, safe_name, student_name,
+                                               selected_subject, local.get("answers"), local["attempt_id"])
+                if result:
+                    show_result(result, safe_batch, safe_subject)
+                    st.stop()
+                # from the next run on, clear the browser copy and don't replay it again
+                st.session_state[f"offline_replayed_{exam_key}"] = state
+                st.rerun()
+            if local and local.get("done"):
+                local = None
 
             st.success(f"Welcome {student_name}! You're taking the {selected_subject} exam 🎯")
 
-            # Load questions
-            questions_ref = db.reference(f"batches/{safe_batch}/{safe_subject}/questions")
-            questions = questions_ref.get()
-            if questions:
-                questions = {k: v for k, v in questions.items() if k != "_placeholder_"}
+            use_autosave = autosave.config()["enabled"]
+            draft = autosave.load_draft(safe_batch, safe_subject, safe_name) if use_autosave and not started else None
+
+            # ⏰ Scheduled exams: closed before opening and after closing, and students
+            # are let in over the stagger window, so nothing is loaded before their turn
+            schedule = exam_schedule.get_schedule(safe_batch, safe_subject)
+            window = exam_schedule.state(schedule)
+            if window != exam_schedule.NOT_SCHEDULED and not started:
+                ends = exam_schedule.draft_deadline(schedule, draft) if draft and draft.get("order") else None
+                if ends is not None and time.time() >= ends:
+                    # time ran out while away: hand in what was autosaved
+                    result = exam_schedule.submit_draft(safe_batch, safe_subject, safe_name, draft)
+                    if result:
+                        st.warning("⏰ Your time ran out, so your saved answers were submitted.")
+                        show_result(result, safe_batch, safe_subject)
+                        st.stop()
+                if window == exam_schedule.CLOSED:
+                    st.warning(f"🔒 This exam closed at {clock(schedule['closes'])}.")
+                    st.stop()
+                admit = exam_schedule.admit_at(schedule, safe_name)
+                if not draft and time.time() < admit:
+                    st.info(f"🕒 The exam opens at {clock(schedule['opens'])}. "
+                            f"You can start at {clock(admit)}.")
+                    exam_clock("⏳ Starting in", admit)
+                    st.stop()
+                if schedule["duration_minutes"] and not draft:
+                    begun = exam_schedule.started_at(safe_batch, safe_subject, safe_name, schedule)
+                    if begun:
+                        # no autosave to resume from, but the timer kept running
+                        st.caption(f"⏱ Your time started at {clock(begun)} and ends at "
+                                   f"{clock(exam_schedule.deadline(schedule, begun))}.")
+                    else:
+                        st.caption(f"⏱ You'll have {schedule['duration_minutes']} minute(s) once you start.")
+
+            # Load questions: the published paper if there is one (immutable,
+            # cached for good), else the live bank's version-stamped cache.
+            # Exams on the same version share one read-only Paper (exam_state);
+            # sampled papers only need the index here and fetch K questions at start
+            published = papers.published_version(safe_batch, safe_subject)
+            sampling = exam_settings.sampling_settings(safe_batch, safe_subject)
+            if sampling["count"]:
+                index = question_index.get_index(safe_batch, safe_subject, published)
+                available = bool(index["qids"])
+            else:
+                available = bool(papers.load_questions(safe_batch, safe_subject, published))
 
-            if questions:
+            if available:
                 st.markdown("---")
 
-                # Session state keys
-                ss_started_key = f"{safe_name}_{safe_batch}_{safe_subject}_started"
-                ss_qdata_key = f"{safe_name}_{safe_batch}_{safe_subject}_qdata"
-                ss_order_key = f"{safe_name}_{safe_batch}_{safe_subject}_order"
-                ss_answers_key = f"{safe_name}_{safe_batch}_{safe_subject}_answers"
-
                 # Start exam
-                if not st.session_state.get(ss_started_key, False):
-                    if st.button("Start Exam 🎬"):
-                        q_keys = list(questions.keys())
-                        random.shuffle(q_keys)  # shuffle once
-                        st.session_state[ss_order_key] = q_keys
-                        st.session_state[ss_qdata_key] = questions
-                        st.session_state[ss_started_key] = True
-                        st.session_state[ss_answers_key] = {}
+                if not started:
+                    if draft and draft.get("order"):
+                        st.info("💾 We saved your progress. Pick up where you left off.")
+                        if st.button("Resume Exam 🔄"):
+                            if draft.get("paper"):
+                                # a drawn or published paper stays exactly as it was
+                                shared = exam_state.get_paper(safe_batch, safe_subject,
+                                                              draft["paper"].get("version"), draft["order"])
+                                q_keys = draft["order"]
+                            else:
+                                # keep the original shuffle; add any questions created since
+                                shared = exam_state.get_paper(safe_batch, safe_subject)
+                                q_keys = [qid for qid in draft["order"] if qid in shared.index]
+                                kept = set(q_keys)
+                                q_keys += [qid for qid in shared.qids if qid not in kept]
+                            began = draft.get("started")
+                            if not began and schedule["duration_minutes"]:
+                                began = exam_schedule.begin(safe_batch, safe_subject, safe_name, schedule)
+                            exam = exam_state.ExamSession(shared, q_keys, draft.get("paper"),
+                                                          draft.get("attempt_id") or offline.new_attempt_id(),
+                                                          began)
+                            exam.restore(draft.get("answers") or {}, saved=True)
+                            if local and local.get("attempt_id") == draft.get("attempt_id"):
+                                # answers picked after the last autosave flush, kept by the browser
+                                exam.restore(local.get("answers") or {})
+                            exam_state.put(session_id(), exam_key, exam)
+                            st.rerun()
+                    elif st.button("Start Exam 🎬"):
+                        paper = {"version": published} if published else None
+                        if sampling["count"]:
+                            paper = dict(paper or {},
+                                         seed=question_index.new_seed(),
+                                         count=sampling["count"],
+                                         stratify=sampling["stratify"],
+                                         index_version=index["version"])
+                            q_keys = question_index.draw(index, paper["count"], paper["seed"],
+                                                         paper["stratify"])
+                            shared = exam_state.get_paper(safe_batch, safe_subject, published, index["qids"])
+                        else:
+                            shared = exam_state.get_paper(safe_batch, safe_subject, published)
+                            q_keys = list(shared.qids)
+                            random.shuffle(q_keys)  # shuffle once
+                        attempt_id = (local or {}).get("attempt_id") or offline.new_attempt_id()
+                        # ⏱ a timed exam counts from the first Start, even across reloads
+                        began = (exam_schedule.begin(safe_batch, safe_subject, safe_name, schedule)
+                                 if schedule["duration_minutes"] else None)
+                        exam = exam_state.ExamSession(shared, q_keys, paper, attempt_id, began)
+                        exam_state.put(session_id(), exam_key, exam)
+                        if use_autosave:
+                            autosave.start_draft(safe_batch, safe_subject, safe_name, exam.qids(), paper,
+                                                 attempt_id, student_name, selected_subject, exam.started)
                         try:
                             st.rerun()
                         except:
                             st.rerun()
                 else:
-                    st.markdown("### 📋 Questions")
-                    answers = st.session_state.get(ss_answers_key, {})
-                    q_order = st.session_state.get(ss_order_key, list(questions.keys()))
-                    qdata = st.session_state.get(ss_qdata_key, questions)
-
-                    for idx, qid in enumerate(q_order):
-                        q = qdata[qid]
-                        question_label = f"Q{idx+1}: {q['question']}"
-                        unique_key = f"{safe_name}_{safe_batch}_{safe_subject}_{qid}_{idx}"
-                        answers[qid] = st.radio(question_label, q['options'],
-                                                key=unique_key,
-                                                index=q['options'].index(answers[qid]) if qid in answers else 0)
-
-                    st.session_state[ss_answers_key] = answers
-
-                    if st.button("🎯 Submit Answers"):
-                        if result_ref.get():
-                            st.error("❌ Submission blocked. Already taken.")
-                            st.stop()
-
-                        score = 0
-                        total = len(answers)
-                        result_summary = {}
-
-                        for qid in answers:
-                            correct = qdata[qid]['answer']
-                            chosen = answers[qid]
-                            is_correct = chosen == correct
-
-                            result_summary[qid] = {
-                                "question": qdata[qid]['question'],
-                                "your_answer": chosen,
-                                "correct_answer": correct,
-                                "is_correct": is_correct
-                            }
-
-                            if is_correct:
-                                score += 1
-
-                        # Save to Firebase
-                        result_ref.set({
-                            "name": student_name,
-                            "subject": selected_subject,
-                            "score": score,
-                            "total": total,
-                            "details": list(result_summary.values())
-                        })
-
-                        st.success(f"✅ Submitted! You scored {score} out of {total}.")
-                        st.balloons()
-
-                        with st.expander("📊 View Your Answers"):
-                            for i, r in enumerate(result_summary.values()):
-                                st.markdown(f"Q{i+1}: {r['question']}")
-                                st.markdown(f"- Your Answer: {r['your_answer']}")
-                                if not r['is_correct']:
-                                    st.markdown(f"- ❌ Correct Answer: {r['correct_answer']}")
-                                else:
-                                    st.markdown("- ✅ Correct!")
-                                st.markdown("---")
+                    exam_body(student_name, selected_subject, safe_name,
+                              safe_batch, safe_subject, result_etag)
             else:
                 st.warning("🚫 No questions found for this subject.")
 
 # ----------------- Teacher Panel -----------------
+def schedule_editor(batch, subject):
+    """Open/close times, time allowed and the stagger window of a subject's exam."""
+    schedule = exam_schedule.get_schedule(batch, subject)
+    scheduled = exam_schedule.is_scheduled(schedule)
+    if not st.checkbox("Open and close this exam at set times", value=scheduled,
+                       key=f"schedule_on_{batch}_{subject}"):
+        st.caption("Not scheduled: students can start whenever the subject has questions.")
+        if scheduled and st.button("🗑 Remove Schedule"):
+            exam_schedule.clear_schedule(batch, subject)
+            st.success("✅ Schedule removed.")
+        return
+    default_open = schedule["opens"] or (time.time() // 3600 + 1) * 3600
+    tz = exam_schedule.timezone()
+    st.caption(f"🌐 Times are in {tz.key}.")
+    opens_at = datetime.datetime.fromtimestamp(default_open, tz)
+    closes_at = datetime.datetime.fromtimestamp(schedule["closes"] or default_open + 3 * 3600, tz)
+    col1, col2 = st.columns(2)
+    open_day = col1.date_input("Opens on", value=opens_at.date(), key=f"schedule_open_day_{batch}_{subject}")
+    open_time = col2.time_input("at", value=opens_at.time(), key=f"schedule_open_time_{batch}_{subject}")
+    col1, col2 = st.columns(2)
+    close_day = col1.date_input("Closes on", value=closes_at.date(), key=f"schedule_close_day_{batch}_{subject}")
+    close_time = col2.time_input("at", value=closes_at.time(), key=f"schedule_close_time_{batch}_{subject}")
+    col1, col2 = st.columns(2)
+    duration = col1.number_input("Minutes per student (0 = until it closes)", min_value=0,
+                                 value=int(schedule["duration_minutes"]))
+    stagger = col2.number_input("Let students in over (seconds)", min_value=0,
+                                value=int(schedule["stagger_seconds"] if scheduled
+                                          else exam_schedule.config()["stagger_seconds"]),
+                                help="Each student gets a start time within this window after "
+                                     "opening, so the class doesn't start in the same second")
+    window = exam_schedule.state(schedule)
+    if scheduled:
+        st.caption(f"Now {window}.")
+    if st.button("💾 Save Schedule"):
+        opens = datetime.datetime.combine(open_day, open_time, tz).timestamp()
+        closes = datetime.datetime.combine(close_day, close_time, tz).timestamp()
+        if closes <= opens:
+            st.error("❌ The exam has to close after it opens.")
+        else:
+            exam_schedule.save_schedule(batch, subject, opens, closes, duration, stagger)
+            st.success(f"✅ Scheduled: {clock(opens)} – {clock(closes)}.")
+
+@st.fragment
+@profiled("teacher/questions")
+def question_manager(batch, subject, is_new_subject):
+    """Add / edit / delete questions without rerunning the login and batch pickers."""
+    st.markdown("### ➕ Add Question")
+    question = st.text_area("Enter Question").strip()
+    options = [st.text_input(f"Option {i+1}", key=f"opt_{i}") for i in range(4)]
+    correct = st.selectbox("Select Correct Answer", options)
+    col1, col2 = st.columns(2)
+    tag = col1.text_input("Tag (optional)", key="new_tag").strip()
+    difficulty = col2.selectbox("Difficulty (optional)", ["", "easy", "medium", "hard"], key="new_difficulty")
+
+    if st.button("Add Question"):
+        if question and all(options) and correct:
+            q_ref = db.reference(f"batches/{batch}/{subject}/questions").push()
+            q_ref.set({
+                "question": question,
+                "options": options,
+                "answer": correct,
+                "tag": tag or None,
+                "difficulty": difficulty or None
+            })
+            question_cache.bump_version(batch, subject, added=1)
+            if is_new_subject:
+                catalog.invalidate()
+            st.success("✅ Question added!")
+        else:
+            st.error("❌ Please fill all fields before adding.")
+
+    st.markdown("### 📥 Bulk Import / 📤 Export")
+    st.caption("CSV columns: question, option1 … option6, answer (the correct option's text), "
+               "optional tag and difficulty. JSON: a list of {question, options, answer, tag, difficulty}.")
+    upload = st.file_uploader("Question file", type=["csv", "json"], key=f"import_{batch}_{subject}")
+    if upload is not None and st.button("📥 Import Questions", key=f"import_btn_{batch}_{subject}"):
+        try:
+            rows = question_io.parse(upload.name, upload.getvalue())
+        except ValueError as e:
+            st.error(f"❌ Could not read {upload.name}: {e}")
+        else:
+            count, errors = question_io.import_questions(batch, subject, rows)
+            if count and is_new_subject:
+                catalog.invalidate()
+            if count:
+                st.success(f"✅ Imported {count} questions!")
+            if errors:
+                st.warning(f"⚠ {len(errors)} rows skipped:")
+                st.dataframe([{"Row": n, "Problem": msg} for n, msg in errors],
+                             width="stretch", hide_index=True)
+    fmt = st.radio("Export as", ["csv", "json"], horizontal=True, key=f"export_fmt_{batch}_{subject}")
+    exporter = question_io.export_json if fmt == "json" else question_io.export_csv
+    st.download_button("📤 Export Questions", key=f"export_{batch}_{subject}",
+                       data=lambda: "".join(exporter(batch, subject)),
+                       file_name=f"{batch}_{subject}.{fmt}",
+                       mime="application/json" if fmt == "json" else "text/csv")
+
+    st.markdown("### 👁 View & Manage Questions")
+    if st.button("🔁 Refresh Page"):
+        js = "window.location.reload();"
+        components.html(f"<script>{js}</script>", height=0)
+
+    q_data = question_cache.get_questions(batch, subject)
+
+    if q_data:
+        for qid, qinfo in q_data.items():
+            with st.expander(qinfo['question']):
+                st.write("#### Options:")
+                for i, opt in enumerate(qinfo['options']):
+                    st.write(f"- {opt}")
+                st.markdown(f"✅ Correct Answer: {qinfo['answer']}")
+
+                col1, col2 = st.columns(2)
+                with col1:
+                    if st.button(f"🗑 Delete", key=f"del_{qid}"):
+                        db.reference(f"batches/{batch}/{subject}/questions/{qid}").delete()
+                        question_cache.bump_version(batch, subject, added=-1)
+                        st.warning("❌ Deleted! Press refresh to update.")
+                with col2:
+                    if st.button(f"✏ Edit", key=f"edit_{qid}"):
+                        new_q = st.text_area("Edit Question", value=qinfo['question'], key=f"q_{qid}")
+                        new_opts = [st.text_input(f"Edit Option {i+1}", value=o, key=f"o_{qid}_{i}") for i, o in enumerate(qinfo['options'])]
+                        new_correct = st.selectbox("Choose New Correct", new_opts, index=new_opts.index(qinfo['answer']), key=f"c_{qid}")
+
+                        if st.button("💾 Save Changes", key=f"save_{qid}"):
+                            # update, not set: keeps the question's tag and difficulty
+                            db.reference(f"batches/{batch}/{subject}/questions/{qid}").update({
+                                "question": new_q,
+                                "options": new_opts,
+                                "answer": new_correct
+                            })
+                            question_cache.bump_version(batch, subject)
+                            st.success("✅ Question updated! Press refresh to view.")
+
+@st.fragment
+@profiled("teacher/results")
+def results_view(batch, subject):
+    """Score summary a page at a time; a student's answers load only on request."""
+    st.markdown("### 📊 View Student Results")
+    stats = scores.get_stats(batch, subject)
+    if not stats:
+        if db.reference(f"results/{batch}/{subject}").get(shallow=True):
+            st.warning("Results were stored before the score summary existed.")
+            st.button("🔄 Build Score Summary", key=f"rebuild_{batch}_{subject}",
+                      on_click=scores.rebuild, args=(batch, subject))
+        else:
+            st.info("No student results yet.")
+        return
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Students", stats["count"])
+    col2.metric("Mean", f"{stats['mean']:.1f}")
+    col3.metric("Median", f"{'≈' if stats['median_approx'] else ''}{stats['median']:g}")
+    st.bar_chart({"Students": {str(k): n for k, n in sorted(stats["hist"].items())}},
+                 x_label="Score", y_label="Students")
+    if stats["stale"] or stats["median_approx"]:
+        st.caption("⚠ Some submissions aren't in this summary yet." if stats["stale"]
+                   else "Median is approximate (summary built before fractional marks).")
+        st.button("🔄 Rebuild Score Summary", key=f"rebuild_{batch}_{subject}",
+                  on_click=scores.rebuild, args=(batch, subject))
+
+    cursors_key = f"results_cursors_{batch}_{subject}"
+    cursors = st.session_state.setdefault(cursors_key, [None])
+    rows, next_cursor = scores.get_page(batch, subject, after=cursors[-1])
+    for student, r in rows:
+        st.markdown(f"👤 {student} — Score: {r['score']} / {r['total']}")
+        if st.toggle("Show answers", key=f"details_{batch}_{subject}_{student}"):
+            for i, d in enumerate(scores.get_details(batch, subject, student)):
+                mark = "✅" if d["is_correct"] else f"❌ (correct: {d['correct_answer']})"
+                st.markdown(f"- Q{i+1}: {d['question']} — {d['your_answer'] or '—'} {mark}")
+
+    prev_col, page_col, next_col = st.columns([1, 2, 1])
+    prev_col.button("◀ Prev", key=f"results_prev_{batch}_{subject}", disabled=len(cursors) == 1,
+                    on_click=cursors.pop)
+    page_col.caption(f"Page {len(cursors)} of {math.ceil(stats['count'] / scores.PAGE_SIZE)}")
+    next_col.button("Next ▶", key=f"results_next_{batch}_{subject}", disabled=next_cursor is None,
+                    on_click=cursors.append, args=(next_cursor,))
+
+    if st.button("♻ Regrade All Results", key=f"regrade_{batch}_{subject}",
+                 help="After fixing an answer or changing the marking"):
+        checked, changed = grading.regrade(batch, subject)
+        st.success(f"✅ Regraded {checked} results; {changed} changed.")
+
+    if st.button("🔁 Reset Results for this Subject", key=f"reset_{batch}_{subject}"):
+        db.reference(f"results/{batch}/{subject}").delete()
+        scores.clear(batch, subject)
+        item_stats.clear(batch, subject)
+        exam_schedule.clear_starts(batch, subject)
+        st.session_state[cursors_key] = [None]
+        st.success("✅ Results cleared!")
+
+def gradebook_export(batch):
+    """Every subject's results in the batch as one sheet, built when asked for."""
+    st.markdown("### 📥 Gradebook Export")
+    fmt = st.radio("Format", list(gradebook.FORMATS), format_func=str.upper, horizontal=True,
+                   key=f"gradebook_format_{batch}")
+    limit_mb = gradebook.config()["max_download_mb"]
+    command = f"python gradebook.py {batch} --format {fmt} --out FILE"
+    ready_key = f"gradebook_ready_{batch}"
+    if st.button(f"🛠 Prepare {batch} Gradebook", key=f"gradebook_prepare_{batch}"):
+        st.session_state.pop(ready_key, None)
+        try:
+            with st.spinner("Building the gradebook..."):
+                with gradebook.spool(batch, fmt, max_bytes=limit_mb * 2 ** 20) as f:
+                    st.session_state[ready_key] = (fmt, f.read())
+        except gradebook.ExportTooLarge:
+            st.error(f"❌ This gradebook is over the {limit_mb} MB download limit. "
+                     f"Run `{command}` on the server instead.")
+        except RuntimeError as e:  # parquet without pyarrow
+            st.error(f"❌ {e}")
+    ready = st.session_state.get(ready_key)
+    if ready and ready[0] == fmt:
+        st.download_button(f"📥 Download {batch} Gradebook", data=ready[1],
+                           file_name=f"{batch}_gradebook.{fmt}", mime=gradebook.FORMATS[fmt],
+                           on_click="ignore", key=f"gradebook_{batch}")
+    # the download is held in server memory, so big batches go through the command line
+    st.caption(f"Downloads are built in server memory and stop at {limit_mb} MB. "
+               f"For larger batches run `{command}`.")
+
+@st.fragment(run_every=proctor.config()["refresh_seconds"])
+@profiled("teacher/monitor")
+def proctor_dashboard(batch, subject):
+    """Started / in progress / submitted, redrawn from the shared listener's mirror (no RTDB reads)."""
+    sub_key = f"_monitor_{batch}_{subject}"
+    sub = st.session_state.get(sub_key)
+    if sub is None or sub.closed:
+        sub = st.session_state[sub_key] = proctor.subscribe(batch, subject)
+    feed = st.session_state.setdefault(f"{sub_key}_feed", [])
+    feed[:0] = [u for u in reversed(sub.drain()) if u["kind"] == "student"]
+    del feed[proctor.config()["feed_size"]:]
+
+    summary = sub.summary()
+    if not summary["ready"]:
+        st.info("📡 Connecting to live updates...")
+        return
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Started", summary["started"])
+    col2.metric("In Progress", len(summary["in_progress"]))
+    col3.metric("Submitted", summary["submitted"])
+    if summary["hist"]:
+        st.bar_chart({"Students": {str(k): n for k, n in sorted(summary["hist"].items())}},
+                     x_label="Score", y_label="Students")
+    if summary["in_progress"]:
+        now = time.time()
+        st.dataframe([{"Student": r["name"],
+                       "Answered": f"{r['answered']} / {r['total']}",
+                       "Last saved": f"{int(now - r['updated'])} s ago" if r["updated"] else "—"}
+                      for r in summary["in_progress"]],
+                     width="stretch", hide_index=True)
+    for u in feed:
+        when = clock(u["at"], "%H:%M:%S")
+        if u["status"] == proctor.SUBMITTED:
+            st.caption(f"{when} ✅ {u['name']} submitted — {u['score']} / {u['total']}")
+        elif u["status"] == proctor.STARTED:
+            st.caption(f"{when} ✍ {u['name']} answered {u['answered']} / {u['total']}")
+        else:
+            st.caption(f"{when} 🗑 {u['name']} cleared")
+
+def live_monitor(batch, subject):
+    st.markdown("### 📡 Live Monitor")
+    sub_key = f"_monitor_{batch}_{subject}"
+    if st.toggle("Watch this exam live", key=f"live_{batch}_{subject}"):
+        proctor_dashboard(batch, subject)
+    elif sub_key in st.session_state:
+        st.session_state.pop(sub_key).close()
+        st.session_state.pop(f"{sub_key}_feed", None)
+
+@st.fragment
+@profiled("teacher/items")
+def item_analysis(batch, subject):
+    """Per-question difficulty and most popular wrong answer, from the item counters."""
+    st.markdown("### 🧪 Question Analysis")
+    rows = item_stats.analysis(batch, subject)
+    if any(r["attempts"] for r in rows):
+        st.dataframe(rows, width="stretch", hide_index=True, column_config={
+            "question": "Question", "attempts": "Attempts", "correct_pct": "% Correct",
+            "skipped": "Skipped", "top_distractor": "Most Chosen Wrong Answer",
+        })
+    else:
+        st.info("No answers counted yet.")
+    st.button("🔄 Recount From Stored Results", key=f"backfill_{batch}_{subject}",
+              on_click=item_stats.backfill, args=(batch, subject),
+              help="Rebuilds the counters from every stored result. Run it when no exam is live.")
+
+def teacher_login():
+    """Check the password once per session; later reruns only verify the signed token."""
+    teacher_name = credentials.check_token(st.session_state.get("teacher_token"))
+    if teacher_name:
+        return teacher_name
+    with st.form("teacher_login"):
+        name = st.text_input("Enter your name").strip()
+        password = st.text_input("Enter your password", type="password")
+        submitted = st.form_submit_button("🔑 Login")
+    if submitted and name and password:
+        ctx = get_script_run_ctx()
+        try:
+            ok = credentials.login(name, password, client=ctx.session_id if ctx else "")
+        except credentials.LockedOut as e:
+            st.error(f"🔒 {e}")
+            return None
+        if ok:
+            st.session_state["teacher_token"] = credentials.issue_token(name)
+            st.rerun()
+        st.error("Invalid name or password ❌")
+    return None
+
+@profiled("teacher")
 def teacher_panel():
     st.header("👩‍🏫 Teacher Panel")
-    teacher_name = st.text_input("Enter your name").strip()
-    teacher_pass = st.text_input("Enter your password", type="password")
-
-    if teacher_name and teacher_pass:
-        ref = db.reference(f"teachers/{teacher_name}")
-        data = ref.get()
-
-        if data and data.get("password") == teacher_pass:
-            st.success(f"Welcome, {teacher_name}! 🌟")
-            st.subheader("🏫 Manage Batches & Subjects")
-
-            batch_data = db.reference("batches").get()
-            batch_options = list(batch_data.keys()) if batch_data else []
-            selected_batch = st.selectbox("Select Batch or Create New", ["➕ Create New"] + batch_options)
-
-            new_batch = ""
-            if selected_batch == "➕ Create New":
-                new_batch = st.text_input("Enter new batch name").strip()
-                if st.button("Create Batch") and new_batch:
-                    db.reference(f"batches/{safe_key(new_batch)}").set({})
-                    st.success(f"✅ Batch '{new_batch}' created!")
+    teacher_name = teacher_login()
+
+    if teacher_name:
+        if st.button("🚪 Log Out"):
+            st.session_state.pop("teacher_token", None)
+            st.rerun()
+        st.success(f"Welcome, {teacher_name}! 🌟")
+        st.subheader("🏫 Manage Batches & Subjects")
+
+        batch_options = catalog.list_batches()
+        selected_batch = st.selectbox("Select Batch or Create New", ["➕ Create New"] + batch_options)
+
+        new_batch = ""
+        if selected_batch == "➕ Create New":
+            new_batch = st.text_input("Enter new batch name").strip()
+            if st.button("Create Batch") and new_batch:
+                db.reference(f"batches/{safe_key(new_batch)}").set({})
+                catalog.invalidate()
+                st.success(f"✅ Batch '{new_batch}' created!")
+        else:
+            new_batch = selected_batch
+
+        if new_batch:
+            subject_options = catalog.list_subjects(safe_key(new_batch))
+            selected_subject = st.selectbox("Select Subject or Create New", ["➕ Create New"] + subject_options)
+
+            new_subject = ""
+            if selected_subject == "➕ Create New":
+                new_subject = st.text_input("Enter new subject name").strip()
+                if st.button("Create Subject") and new_subject:
+                    db.reference(f"batches/{safe_key(new_batch)}/{safe_key(new_subject)}/questions").set({})
+                    catalog.invalidate()
+                    st.success(f"✅ Subject '{new_subject}' created!")
             else:
-                new_batch = selected_batch
-
-            if new_batch:
-                subject_data = db.reference(f"batches/{safe_key(new_batch)}").get()
-                subject_options = list(subject_data.keys()) if subject_data else []
-                selected_subject = st.selectbox("Select Subject or Create New", ["➕ Create New"] + subject_options)
-
-                new_subject = ""
-                if selected_subject == "➕ Create New":
-                    new_subject = st.text_input("Enter new subject name").strip()
-                    if st.button("Create Subject") and new_subject:
-                        db.reference(f"batches/{safe_key(new_batch)}/{safe_key(new_subject)}/questions").set({})
-                        st.success(f"✅ Subject '{new_subject}' created!")
+                new_subject = selected_subject
+
+            if new_subject:
+                st.markdown("### ⚙ Exam Layout")
+                display = exam_settings.display_settings(safe_key(new_batch), safe_key(new_subject))
+                mode_keys = list(exam_settings.MODES)
+                mode = st.radio("How should students see the paper?", mode_keys,
+                                index=mode_keys.index(display["mode"]) if display["mode"] in mode_keys else 0,
+                                format_func=exam_settings.MODES.get)
+                page_size = st.number_input("Questions per page", min_value=1, max_value=50,
+                                            value=int(display["page_size"]),
+                                            disabled=mode != "paged")
+                sampling = exam_settings.sampling_settings(safe_key(new_batch), safe_key(new_subject))
+                draw_count = st.number_input("Questions drawn per student (0 = every question)",
+                                             min_value=0, value=int(sampling["count"]))
+                stratify_keys = list(exam_settings.STRATIFY)
+                stratify = st.selectbox("Drawing", stratify_keys,
+                                        index=stratify_keys.index(sampling["stratify"])
+                                        if sampling["stratify"] in stratify_keys else 0,
+                                        format_func=exam_settings.STRATIFY.get,
+                                        disabled=draw_count == 0)
+                marking = exam_settings.marking_settings(safe_key(new_batch), safe_key(new_subject))
+                col1, col2, col3 = st.columns(3)
+                mark_correct = col1.number_input("Marks per correct answer", min_value=0.0, step=0.25,
+                                                 value=float(marking["correct"]))
+                mark_wrong = col2.number_input("Marks per wrong answer", max_value=0.0, step=0.25,
+                                               value=float(marking["wrong"]),
+                                               help="Below zero for negative marking")
+                mark_skipped = col3.number_input("Marks per skipped question", step=0.25,
+                                                 value=float(marking["skipped"]))
+                if st.button("💾 Save Layout"):
+                    exam_settings.save_display_settings(safe_key(new_batch), safe_key(new_subject),
+                                                        mode, page_size)
+                    exam_settings.save_sampling_settings(safe_key(new_batch), safe_key(new_subject),
+                                                         draw_count, stratify)
+                    exam_settings.save_marking_settings(safe_key(new_batch), safe_key(new_subject),
+                                                        mark_correct, mark_wrong, mark_skipped)
+                    st.success("✅ Exam layout saved!")
+
+                st.markdown("### ⏰ Schedule")
+                schedule_editor(safe_key(new_batch), safe_key(new_subject))
+
+                st.markdown("### 📦 Published Paper")
+                current = papers.published(safe_key(new_batch), safe_key(new_subject))
+                if current:
+                    st.caption(f"Students get paper v{current['version']} "
+                               f"(published {clock(current['at'], '%d %b %H:%M')}).")
+                    live = question_cache.get_meta(safe_key(new_batch), safe_key(new_subject)).get("version", 0)
+                    if live != current.get("source_version"):
+                        st.warning("✏ Questions changed since this paper was published. "
+                                   "Publish again to hand the changes to students.")
                 else:
-                    new_subject = selected_subject
-
-                if new_subject:
-                    st.markdown("### ➕ Add Question")
-                    question = st.text_area("Enter Question").strip()
-                    options = [st.text_input(f"Option {i+1}", key=f"opt_{i}") for i in range(4)]
-                    correct = st.selectbox("Select Correct Answer", options)
-
-                    if st.button("Add Question"):
-                        if question and all(options) and correct:
-                            q_ref = db.reference(f"batches/{safe_key(new_batch)}/{safe_key(new_subject)}/questions").push()
-                            q_ref.set({
-                                "question": question,
-                                "options": options,
-                                "answer": correct
-                            })
-                            st.success("✅ Question added!")
-                        else:
-                            st.error("❌ Please fill all fields before adding.")
-
-                    st.markdown("### 👁 View & Manage Questions")
-                    if st.button("🔁 Refresh Page"):
-                        js = "window.location.reload();"
-                        components.html(f"<script>{js}</script>", height=0)
-
-                    q_data = db.reference(f"batches/{safe_key(new_batch)}/{safe_key(new_subject)}/questions").get()
-
-                    if q_data:
-                        for qid, qinfo in q_data.items():
-                            if qid == "_placeholder_":
-                                continue
-                            with st.expander(qinfo['question']):
-                                st.write("#### Options:")
-                                for i, opt in enumerate(qinfo['options']):
-                                    st.write(f"- {opt}")
-                                st.markdown(f"✅ Correct Answer: {qinfo['answer']}")
-
-                                col1, col2 = st.columns(2)
-                                with col1:
-                                    if st.button(f"🗑 Delete", key=f"del_{qid}"):
-                                        db.reference(f"batches/{safe_key(new_batch)}/{safe_key(new_subject)}/questions/{qid}").delete()
-                                        st.warning("❌ Deleted! Press refresh to update.")
-                                with col2:
-                                    if st.button(f"✏ Edit", key=f"edit_{qid}"):
-                                        new_q = st.text_area("Edit Question", value=qinfo['question'], key=f"q_{qid}")
-                                        new_opts = [st.text_input(f"Edit Option {i+1}", value=o, key=f"o_{qid}_{i}") for i, o in enumerate(qinfo['options'])]
-                                        new_correct = st.selectbox("Choose New Correct", new_opts, index=new_opts.index(qinfo['answer']), key=f"c_{qid}")
-
-                                        if st.button("💾 Save Changes", key=f"save_{qid}"):
-                                            db.reference(f"batches/{safe_key(new_batch)}/{safe_key(new_subject)}/questions/{qid}").set({
-                                                "question": new_q,
-                                                "options": new_opts,
-                                                "answer": new_correct
-                                            })
-                                            st.success("✅ Question updated! Press refresh to view.")
-
-                    st.markdown("### 📊 View Student Results")
-                    result_ref = db.reference(f"results/{safe_key(new_batch)}/{safe_key(new_subject)}")
-                    result_data = result_ref.get()
-
-                    if result_data:
-                        for student, r in result_data.items():
-                            st.markdown(f"👤 {student} — Score: {r['score']} / {r['total']}")
+                    st.caption("Nothing published: students read the live question bank.")
+                col1, col2 = st.columns(2)
+                if col1.button("📦 Publish Current Questions"):
+                    try:
+                        version = papers.publish(safe_key(new_batch), safe_key(new_subject))
+                    except ValueError as e:
+                        st.error(f"❌ {e}")
                     else:
-                        st.info("No student results yet.")
+                        st.success(f"✅ Published paper v{version}! Exams started from now on use it.")
+                if current and col2.button("↩ Back to Live Questions"):
+                    papers.unpublish(safe_key(new_batch), safe_key(new_subject))
+                    st.success("✅ New exams will use the live question bank.")
 
-                    if st.button("🔁 Reset Results for this Subject"):
-                        result_ref.delete()
-                        st.success("✅ Results cleared!")
-        else:
-            st.error("Invalid name or password ❌")
+                question_manager(safe_key(new_batch), safe_key(new_subject),
+                                 new_subject not in subject_options)
+
+                live_monitor(safe_key(new_batch), safe_key(new_subject))
+                results_view(safe_key(new_batch), safe_key(new_subject))
+                item_analysis(safe_key(new_batch), safe_key(new_subject))
+                gradebook_export(safe_key(new_batch))
 
 # ----------------- Admin Panel -----------------
+BROWSER_PAGE_SIZE = 20
+
+def delete_question(batch, subject, qid):
+    db.reference(f"batches/{batch}/{subject}/questions/{qid}").delete()
+    question_cache.bump_version(batch, subject, added=-1)
+
+@st.fragment
+@profiled("admin/batches")
+def batch_browser():
+    """Batch → subject → a page of questions, each level read only once it is picked."""
+    st.subheader("🏫 Manage Batches")
+    batches = catalog.list_batches()
+    if not batches:
+        st.info("ℹ No batches created yet.")
+        return
+
+    batch_name = st.selectbox("🎓 Batch", batches, index=None, placeholder="Pick a batch", key="browse_batch")
+    if not batch_name:
+        st.caption(f"{len(batches)} batches")
+        return
+
+    subjects = catalog.list_subjects(batch_name)
+    counts = catalog.question_counts(batch_name)
+    if any(s not in counts for s in subjects):
+        st.caption("Some subjects have no question counter yet.")
+        st.button("🔄 Recount Questions", key=f"recount_{batch_name}",
+                  on_click=catalog.recount, args=(batch_name,))
+    st.dataframe([{"Subject": s, "Questions": counts.get(s)} for s in subjects],
+                 width="stretch", hide_index=True)
+    if st.button(f"🗑 Delete Entire Batch {batch_name}", key=f"del_batch_{batch_name}"):
+        catalog.delete_batch(batch_name)
+        st.error(f"Deleted batch '{batch_name}'")
+        return
+
+    subject_name = st.selectbox("📚 Subject", subjects, index=None, placeholder="Pick a subject",
+                                key=f"browse_subject_{batch_name}")
+    if not subject_name:
+        return
+
+    questions = question_cache.get_questions(batch_name, subject_name)
+    search = st.text_input("🔎 Search questions", key=f"browse_search_{batch_name}_{subject_name}").strip().lower()
+    matches = [(qid, q) for qid, q in questions.items()
+               if isinstance(q, dict) and (not search or search in str(q.get("question", "")).lower())]
+    pages = max(1, math.ceil(len(matches) / BROWSER_PAGE_SIZE))
+    page_key = f"browse_page_{batch_name}_{subject_name}"
+    page = min(st.session_state.get(page_key, 0), pages - 1)
+    st.caption(f"{len(matches)} of {len(questions)} questions")
+
+    for qid, qdata in matches[page * BROWSER_PAGE_SIZE:(page + 1) * BROWSER_PAGE_SIZE]:
+        if 'question' in qdata and 'answer' in qdata:
+            st.markdown(f"- Q: {qdata['question']}")
+            st.markdown(f"✅ A: {qdata['answer']}")
+            st.button("❌ Delete Question", key=f"{qid}{batch_name}{subject_name}",
+                      on_click=delete_question, args=(batch_name, subject_name, qid))
+        else:
+            st.markdown(f"- ⚠ Skipped corrupted data (ID: {qid})")
+
+    col1, col2, col3 = st.columns([1, 2, 1])
+    col1.button("⬅ Prev", key=f"{page_key}_prev", disabled=page == 0,
+                on_click=set_page, args=(page_key, page - 1))
+    col2.markdown(f"Page {page+1} of {pages}")
+    col3.button("Next ➡", key=f"{page_key}_next", disabled=page >= pages - 1,
+                on_click=set_page, args=(page_key, page + 1))
+
+    if st.button(f"🗑 Delete Subject {subject_name}", key=f"del_sub_{batch_name}_{subject_name}"):
+        catalog.delete_subject(batch_name, subject_name)
+        question_cache.invalidate(batch_name, subject_name)
+        st.warning(f"Deleted subject '{subject_name}'")
+
+def diagnostics_view():
+    """RTDB call histograms for sizing the deployment."""
+    st.markdown("#### 🌐 This server process")
+    st.dataframe(db_metrics.PROCESS.rows(), width="stretch")
+    cache = question_cache.stats()
+    st.caption(f"Question cache: {cache['hits']} hits, {cache['misses']} misses, {cache['size']} subjects held")
+
+    st.markdown("#### 👤 Per session")
+    tracked = db_metrics.sessions()
+    if tracked:
+        labels = {sid: f"{sid[:8]} · last in {label}" for sid, label, _ in tracked}
+        picked = st.selectbox("Session", list(labels), format_func=labels.get)
+        st.dataframe(dict((sid, stats) for sid, _, stats in tracked)[picked].rows(),
+                     width="stretch")
+    history = st.session_state.get("_db_calls", [])
+    if history:
+        st.caption("Your last reruns: " + ", ".join(f"{scope} {n}" for scope, n in history[-10:]))
+
+    st.markdown("#### 📄 Prometheus")
+    text = db_metrics.render_prometheus()
+    st.download_button("⬇ Download metrics", text, file_name="smartexam_rtdb.prom", mime="text/plain")
+    with st.expander("Show raw text"):
+        st.code(text, language="text")
+
+@profiled("admin")
 def admin_panel():
     st.header("🛡 Admin Panel")
     admin_pass = st.text_input("Enter Admin Password", type="password")
@@ -272,69 +952,65 @@ def admin_panel():
 
     if admin_pass == real_admin_pass:
         st.success("Welcome, Admin 👑💙")
-        st.subheader("👩‍🏫 Manage Teachers")
-
-        teachers = db.reference("teachers").get()
-        if teachers:
-            for name, details in teachers.items():
-                with st.expander(f"🧑‍🏫 {name}"):
-                    st.write(f"Password: {details.get('password', 'N/A')}")
-                    new_pass = st.text_input(f"Reset password for {name}", key=f"pass_{name}")
-                    if st.button(f"Update Password", key=f"btn_{name}"):
-                        db.reference(f"teachers/{name}/password").set(new_pass)
-                        st.success("✅ Password updated!")
+        # hidden unless the page is opened with ?diagnostics=1
+        if st.query_params.get("diagnostics") == "1":
+            manage_tab, diagnostics_tab = st.tabs(["🛠 Manage", "📈 Diagnostics"])
+            with diagnostics_tab:
+                diagnostics_view()
         else:
-            st.info("No teachers found.")
-
-        st.subheader("➕ Add New Teacher")
-        new_teacher = st.text_input("New Teacher Name")
-        first_time_pass = st.text_input("Set Initial Password", type="password")
-        if st.button("Add Teacher"):
-            if new_teacher and first_time_pass:
-                ref = db.reference(f"teachers/{new_teacher}")
-                if not ref.get():
-                    ref.set({"password": first_time_pass})
-                    st.success("✅ Teacher added!")
-                else:
-                    st.warning("Teacher already exists.")
-
-        st.subheader("❌ Remove Teacher")
-        teacher_names = list(teachers.keys()) if teachers else []
-        teacher_to_remove = st.selectbox("Select teacher", teacher_names)
-        if st.button("Remove Teacher"):
-            db.reference(f"teachers/{teacher_to_remove}").delete()
-            st.error("🚫 Teacher removed!")
-
-        st.subheader("🏫 Manage Batches")
-        batches = db.reference("batches").get()
-        if batches:
-            for batch_name, subjects in batches.items():
-                with st.expander(f"🎓 {batch_name}"):
-                    for subject_name, subject_data in subjects.items():
-                        st.markdown(f"#### 📚 {subject_name}")
-                        questions = subject_data.get("questions", {})
-                        if questions:
-                            for qid, qdata in questions.items():
-                                if isinstance(qdata, dict) and 'question' in qdata and 'answer' in qdata:
-                                    st.markdown(f"- Q: {qdata['question']}")
-                                    st.markdown(f"✅ A: {qdata['answer']}")
-                                    if st.button("❌ Delete Question", key=f"{qid}{batch_name}{subject_name}"):
-                                        db.reference(f"batches/{batch_name}/{subject_name}/questions/{qid}").delete()
-                                        st.warning("Deleted. Refresh to update.")
-                                else:
-                                    st.markdown(f"- ⚠ Skipped corrupted or placeholder data (ID: {qid})")
-
-                        if st.button(f"🗑 Delete Subject {subject_name}", key=f"del_sub_{subject_name}"):
-                            db.reference(f"batches/{batch_name}/{subject_name}").delete()
-                            st.warning(f"Deleted subject '{subject_name}'")
-
-                    if st.button(f"🗑 Delete Entire Batch {batch_name}", key=f"del_batch_{batch_name}"):
-                        db.reference(f"batches/{batch_name}").delete()
-                        st.error(f"Deleted batch '{batch_name}'")
+            manage_tab = st.container()
+
+        with manage_tab:
+            st.subheader("👩‍🏫 Manage Teachers")
+
+            teachers = db.reference("teachers").get()
+            if teachers:
+                plain = [name for name, details in teachers.items() if not credentials.is_hashed(details)]
+                if plain:
+                    st.warning(f"🔓 {len(plain)} teacher password(s) are still stored in plain text.")
+                    if st.button("🔐 Hash All Stored Passwords"):
+                        st.success(f"✅ Rehashed {credentials.migrate_all()} passwords!")
+                for name, details in teachers.items():
+                    with st.expander(f"🧑‍🏫 {name}"):
+                        st.write("Password: 🔒 hashed" if name not in plain else "Password: 🔓 plain text")
+                        new_pass = st.text_input(f"Reset password for {name}", type="password", key=f"pass_{name}")
+                        if st.button(f"Update Password", key=f"btn_{name}"):
+                            if new_pass:
+                                credentials.set_password(name, new_pass)
+                                st.success("✅ Password updated!")
+                            else:
+                                st.warning("Enter a new password first.")
+            else:
+                st.info("No teachers found.")
+
+            st.subheader("➕ Add New Teacher")
+            new_teacher = st.text_input("New Teacher Name")
+            first_time_pass = st.text_input("Set Initial Password", type="password")
+            if st.button("Add Teacher"):
+                if new_teacher and first_time_pass:
+                    if credentials.create_teacher(new_teacher, first_time_pass):
+                        st.success("✅ Teacher added!")
+                    else:
+                        st.warning("Teacher already exists.")
+
+            st.subheader("❌ Remove Teacher")
+            teacher_names = list(teachers.keys()) if teachers else []
+            teacher_to_remove = st.selectbox("Select teacher", teacher_names)
+            if st.button("Remove Teacher"):
+                credentials.remove_teacher(teacher_to_remove)
+                st.error("🚫 Teacher removed!")
+
+            batch_browser()
     elif admin_pass:
         st.error("Wrong password, cutie ❌")
 
 # ----------------- Role Switcher -----------------
+diagnostics = settings.section("diagnostics", DIAGNOSTICS_DEFAULTS)
+if diagnostics["prometheus_file"]:
+    db_metrics.start_file_exporter(diagnostics["prometheus_file"], diagnostics["export_interval_seconds"])
+
+exam_schedule.start()  # pre-warms papers and submits timed-out drafts
+
 role = st.selectbox("Who are you?", ["Select Role", "Student", "Teacher", "Admin"])
 if role == "Student":
     student_panel()
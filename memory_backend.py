@@ -0,0 +1,337 @@
+# memory_backend.py
+"""In-process stand-in for the Realtime Database (load tests, CI, demos).
+
+Mirrors the subset of firebase_admin.db.Reference the app relies on, with
+RTDB's quirks: writing None or {} removes a node, empty parents disappear,
+update() accepts multi-path keys, {".sv": {"increment": n}} adds to the stored
+number, and reads hand back copies. listen() delivers "put" events on a
+background thread per listener, like the SDK's streaming listener.
+"""
+import copy
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from push_ids import PushIdGenerator
+
+
+def _split(path):
+    return [p for p in str(path).split("/") if p]
+
+
+def _clean(value):
+    """Deep copy, dropping None/empty children the way RTDB stores data."""
+    if isinstance(value, dict):
+        out = {}
+        for k, v in value.items():
+            v = _clean(v)
+            if v is not None:
+                out[str(k)] = v
+        return out or None
+    if isinstance(value, (list, tuple)):
+        return _clean({str(i): v for i, v in enumerate(value)})
+    return value
+
+
+def _export(value):
+    """Copy for callers, turning {"0":..,"1":..} back into lists like RTDB."""
+    if isinstance(value, dict):
+        out = {k: _export(v) for k, v in value.items()}
+        if out and all(k.isdigit() for k in out):
+            idx = sorted(int(k) for k in out)
+            if idx == list(range(len(idx))):
+                return [out[str(i)] for i in idx]
+        return out
+    return value
+
+
+def _sort_key(index):
+    if index is None:
+        return (0, 0)
+    if isinstance(index, bool):
+        return (1, index)
+    if isinstance(index, (int, float)):
+        return (2, index)
+    if isinstance(index, str):
+        return (3, index)
+    return (4, 0)
+
+
+def _key_order(key):
+    # RTDB sorts integer-like keys numerically ahead of string keys
+    return (0, int(key), "") if key.isdigit() else (1, 0, key)
+
+
+class MemoryBackend:
+    def __init__(self, data=None, latency=0.0):
+        self._root = _clean(data) or {}
+        self.latency = latency  # seconds added to every call, to mimic a network hop
+        self._lock = threading.RLock()
+        self._push_id = PushIdGenerator()
+        self._listeners = []
+
+    def reference(self, path="/"):
+        return MemoryReference(self, _split(path))
+
+    def _round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    # -- tree helpers (call with the lock held) --
+    def _read(self, parts):
+        node = self._root
+        for p in parts:
+            if not isinstance(node, dict) or p not in node:
+                return None
+            node = node[p]
+        return node
+
+    def _resolve(self, parts, value):
+        """Replace server values with what RTDB would store."""
+        if isinstance(value, dict):
+            if ".sv" in value:
+                current = self._read(parts)
+                current = current if isinstance(current, (int, float)) else 0
+                return current + value[".sv"]["increment"]
+            return {k: self._resolve(parts + [str(k)], v) for k, v in value.items()}
+        return value
+
+    def _write(self, parts, value):
+        value = _clean(self._resolve(parts, value))
+        if not parts:
+            self._root = value or {}
+            return
+        trail = [self._root]
+        node = self._root
+        for p in parts[:-1]:
+            child = node.get(p)
+            if not isinstance(child, dict):
+                if value is None:
+                    return
+                child = node[p] = {}
+            node = child
+            trail.append(node)
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = value
+        # prune parents left empty, like RTDB
+        for depth in range(len(parts) - 1, 0, -1):
+            if trail[depth]:
+                break
+            trail[depth - 1].pop(parts[depth - 1], None)
+        self._notify(parts)
+
+    def _notify(self, parts):
+        for listener in self._listeners:
+            n = len(listener.parts)
+            if parts[:n] == listener.parts:
+                # written at or below the listener: an event for just that path
+                listener.put("/" + "/".join(parts[n:]), self._read(parts))
+            elif listener.parts[:len(parts)] == parts:
+                # written above it: the listener's whole node may have changed
+                listener.put("/", self._read(listener.parts))
+
+
+class MemoryReference:
+    def __init__(self, backend, parts):
+        self._backend = backend
+        self._parts = parts
+
+    @property
+    def key(self):
+        return self._parts[-1] if self._parts else None
+
+    @property
+    def path(self):
+        return "/" + "/".join(self._parts)
+
+    @property
+    def parent(self):
+        return MemoryReference(self._backend, self._parts[:-1]) if self._parts else None
+
+    def child(self, path):
+        return MemoryReference(self._backend, self._parts + _split(path))
+
+    def get(self, etag=False, shallow=False):
+        self._backend._round_trip()
+        with self._backend._lock:
+            value = self._backend._read(self._parts)
+            if shallow and isinstance(value, dict):
+                return {k: True for k in value}
+            value = _export(copy.deepcopy(value))
+        if etag:
+            return value, _etag(value)
+        return value
+
+    def set(self, value):
+        if value is None:
+            raise ValueError("Value must not be None.")
+        self._backend._round_trip()
+        with self._backend._lock:
+            self._backend._write(self._parts, value)
+
+    def set_if_unchanged(self, expected_etag, value):
+        if value is None:
+            raise ValueError("Value must not be none.")
+        self._backend._round_trip()
+        with self._backend._lock:
+            current = _export(copy.deepcopy(self._backend._read(self._parts)))
+            if _etag(current) != expected_etag:
+                return False, current, _etag(current)
+            self._backend._write(self._parts, value)
+            return True, value, _etag(_export(_clean(value)))
+
+    def update(self, value):
+        if not value or not isinstance(value, dict):
+            raise ValueError("Value argument must be a non-empty dictionary.")
+        self._backend._round_trip()
+        with self._backend._lock:
+            for k, v in value.items():
+                self._backend._write(self._parts + _split(k), v)
+
+    def push(self, value=""):
+        if value is None:
+            raise ValueError("Value must not be None.")
+        self._backend._round_trip()
+        with self._backend._lock:
+            key = self._backend._push_id()
+            if value != "":
+                self._backend._write(self._parts + [key], value)
+        return self.child(key)
+
+    def delete(self):
+        self._backend._round_trip()
+        with self._backend._lock:
+            self._backend._write(self._parts, None)
+
+    def transaction(self, transaction_update):
+        if not callable(transaction_update):
+            raise ValueError("transaction_update must be a function.")
+        # the SDK does a GET with ETag, then a conditional PUT
+        self._backend._round_trip()
+        self._backend._round_trip()
+        with self._backend._lock:
+            current = _export(copy.deepcopy(self._backend._read(self._parts)))
+            new_value = transaction_update(current)
+            self._backend._write(self._parts, new_value)
+            return new_value
+
+    def listen(self, callback):
+        with self._backend._lock:
+            listener = _Listener(self._backend, self._parts, callback)
+            listener.put("/", self._backend._read(self._parts))
+            self._backend._listeners.append(listener)
+        return listener
+
+    def order_by_key(self):
+        return MemoryQuery(self, "$key")
+
+    def order_by_value(self):
+        return MemoryQuery(self, "$value")
+
+    def order_by_child(self, path):
+        return MemoryQuery(self, path)
+
+
+class MemoryQuery:
+    def __init__(self, ref, order_by):
+        self._ref = ref
+        self._order_by = order_by
+        self._start = self._end = None
+        self._first = self._last = None
+
+    def start_at(self, start):
+        self._start = start
+        return self
+
+    def end_at(self, end):
+        self._end = end
+        return self
+
+    def equal_to(self, value):
+        self._start = self._end = value
+        return self
+
+    def limit_to_first(self, limit):
+        self._first = limit
+        return self
+
+    def limit_to_last(self, limit):
+        self._last = limit
+        return self
+
+    def _index(self, key, value):
+        if self._order_by == "$key":
+            return key
+        if self._order_by == "$value":
+            return value
+        for p in _split(self._order_by):
+            value = value.get(p) if isinstance(value, dict) else None
+        return value
+
+    def get(self):
+        self._ref._backend._round_trip()
+        with self._ref._backend._lock:
+            data = self._ref._backend._read(self._ref._parts)
+            if not isinstance(data, dict):
+                return _export(copy.deepcopy(data))
+            if self._order_by == "$key":
+                rows = sorted(data.items(), key=lambda kv: _key_order(kv[0]))
+            else:
+                rows = sorted(data.items(), key=lambda kv: (
+                    _sort_key(self._index(kv[0], kv[1])), _key_order(kv[0])))
+            if self._start is not None:
+                rows = [kv for kv in rows
+                        if _sort_key(self._index(*kv)) >= _sort_key(self._start)]
+            if self._end is not None:
+                rows = [kv for kv in rows
+                        if _sort_key(self._index(*kv)) <= _sort_key(self._end)]
+            if self._first is not None:
+                rows = rows[:self._first]
+            if self._last is not None:
+                rows = rows[-self._last:] if self._last else []
+            return OrderedDict((k, _export(copy.deepcopy(v))) for k, v in rows)
+
+
+class Event:
+    def __init__(self, event_type, path, data):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+
+class _Listener:
+    """A listen() registration: events are queued and handed to the callback in order."""
+
+    def __init__(self, backend, parts, callback):
+        self._backend = backend
+        self.parts = parts
+        self._callback = callback
+        self._events = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="memory-listener")
+        self._thread.start()
+
+    def put(self, path, data):
+        self._events.put(Event("put", path, _export(copy.deepcopy(data))))
+
+    def _run(self):
+        while True:
+            event = self._events.get()
+            if event is None:
+                return
+            try:
+                self._callback(event)
+            except Exception:
+                pass
+
+    def close(self):
+        with self._backend._lock:
+            if self in self._backend._listeners:
+                self._backend._listeners.remove(self)
+        self._events.put(None)
+
+
+def _etag(value):
+    return str(hash(repr(value)))
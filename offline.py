@@ -0,0 +1,100 @@
+import os
+import time
+import uuid
+
+import streamlit.components.v1 as components
+
+import autosave
+import exam_schedule
+import settings
+import submission
+
+# ----------------- Offline-Tolerant Submission -----------------
+# With [offline] enabled, every exam attempt gets an attempt ID (made in the
+# browser) and a copy in the browser's localStorage, kept by a zero-height
+# component (offline_component/index.html):
+#   {"attempt_id": "...", "answers": {qid: option}, "submit_requested": bool}
+# Results store the attempt_id, so a submission is idempotent: the same
+# attempt arriving twice (a retry after a dropped reply, a reconnect, the
+# write-behind queue replaying its journal) finds its own result and returns
+# it instead of being refused or written again.
+# When the Wi-Fi drops, the Streamlit session and its state are gone. On
+# reconnect the page asks the component what it kept: answers restore the
+# exam, and a submit the student pressed before the connection went is
+# replayed, accepted while within grace_minutes of the attempt's last
+# autosave (drafts/.../updated). The paper and order come from the server
+# draft, never from the browser, so replays need [autosave] enabled.
+
+DEFAULTS = {
+    "enabled": False,
+    "grace_minutes": 15,
+}
+
+STORED, DUPLICATE, EXPIRED, REJECTED = "stored", "duplicate", "expired", "rejected"
+DONE = {"done": True}  # component state that clears the browser copy
+
+_answer_buffer = components.declare_component(
+    "answer_buffer", path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "offline_component"))
+
+
+def config() -> dict:
+    return settings.section("offline", DEFAULTS)
+
+
+def enabled() -> bool:
+    return bool(config()["enabled"])
+
+
+def storage_key(batch: str, subject: str, name: str) -> str:
+    return f"{batch}/{subject}/{name}"
+
+
+def new_attempt_id() -> str:
+    """Server-side fallback while the browser hasn't answered yet."""
+    return uuid.uuid4().hex
+
+
+def answer_buffer(batch: str, subject: str, name: str, state=None):
+    """Mirror `state` into the browser, or (state None) read back what it kept.
+
+    Returns the browser's {attempt_id, answers, submit_requested}, or None
+    until the component has loaded. Call it once per rerun.
+    """
+    storage = storage_key(batch, subject, name)
+    return _answer_buffer(storage=storage, state=state, default=None, key=f"offline_{storage}")
+
+
+def replay(batch: str, subject: str, name: str, student_name: str,
+           subject_label: str, answers: dict, attempt_id: str) -> tuple:
+    """Accept a submission kept in the browser while the connection was down.
+
+    Returns (state, record): DUPLICATE with the stored result when this
+    attempt already landed, STORED when it lands now, EXPIRED when the grace
+    window has passed or there is no draft to check it against, and REJECTED
+    when a different attempt was submitted.
+    """
+    existing = submission.result_ref(batch, subject, name).get()
+    if existing:
+        if existing.get("attempt_id") == attempt_id:
+            return DUPLICATE, existing
+        return REJECTED, None
+
+    draft = autosave.load_draft(batch, subject, name) or {}
+    if not draft.get("order") or draft.get("attempt_id") not in (None, attempt_id):
+        return EXPIRED, None
+    if time.time() - draft.get("updated", 0) > config()["grace_minutes"] * 60:
+        return EXPIRED, None
+    ends = exam_schedule.draft_deadline(exam_schedule.get_schedule(batch, subject), draft)
+    if ends is not None and time.time() > ends + exam_schedule.config()["grace_seconds"]:
+        # a timed exam: answers kept after the time ran out don't count
+        record = exam_schedule.submit_draft(batch, subject, name, draft)
+        return (STORED, record) if record else (REJECTED, None)
+
+    order = draft["order"]
+    answers = {qid: a for qid, a in (answers or {}).items() if qid in order}
+    record = submission.submit_exam(batch, subject, name, student_name, subject_label, answers,
+                                    qids=order, paper=draft.get("paper"), attempt_id=attempt_id)
+    if record is None:
+        return REJECTED, None
+    autosave.discard(batch, subject, name)
+    return STORED, record
@@ -0,0 +1,184 @@
+import base64
+import json
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import question_cache
+import settings
+import shared_cache
+from firebase_config import db, increment
+
+# ----------------- Published Papers -----------------
+# Publishing freezes a subject's questions into one immutable blob:
+#   papers/{b}/{s}/{version}     = {"format": "zlib+base64" | "json", "data": "...",
+#                                   "count": n, "published_at": epoch_seconds}
+#   paper_keys/{b}/{s}/{version} = {qid: correct option}
+#   batches/{b}/{s}/meta/published = {"version": v, "source_version": meta version,
+#                                     "at": epoch_seconds}
+# The blob holds {qid: {question, options, tag?, difficulty?}} with the
+# answers stripped, so what students download never carries the key. A
+# version is never rewritten, so both halves are cached in process memory
+# (and in the host's shared cache, when on) for good and teachers can keep editing the live bank mid-exam. Students
+# who started on a version finish (and are graded) on it; results record it
+# under paper/version.
+# The one exception is a wrong answer fixed by a regrade (correct_key): the
+# key is patched in place and meta/key_fixes bumped, and cached keys are
+# stamped with that counter, so every worker reloads them within META_TTL.
+
+DEFAULTS = {
+    "compress": True,
+}
+MAX_PAPERS = 128  # LRU bound on cached bundles and answer keys
+
+
+def paper_path(batch: str, subject: str, version: int) -> str:
+    return f"papers/{batch}/{subject}/{version}"
+
+
+def key_path(batch: str, subject: str, version: int) -> str:
+    return f"paper_keys/{batch}/{subject}/{version}"
+
+
+def published_path(batch: str, subject: str) -> str:
+    return f"{question_cache.meta_path(batch, subject)}/published"
+
+
+def encode(questions: dict, compress: bool) -> dict:
+    text = json.dumps(questions, separators=(",", ":"), ensure_ascii=False, sort_keys=True)
+    if compress:
+        data = base64.b64encode(zlib.compress(text.encode("utf-8"), 9)).decode("ascii")
+        return {"format": "zlib+base64", "data": data}
+    return {"format": "json", "data": text}
+
+
+def decode(blob: dict) -> dict:
+    data = blob["data"]
+    if blob.get("format") == "zlib+base64":
+        data = zlib.decompress(base64.b64decode(data)).decode("utf-8")
+    return json.loads(data)
+
+
+def publish(batch: str, subject: str) -> int:
+    """Freeze the current questions as the next paper version and point students at it."""
+    meta = db.reference(question_cache.meta_path(batch, subject)).get() or {}
+    questions = db.reference(f"batches/{batch}/{subject}/questions").get() or {}
+    questions = {k: v for k, v in questions.items() if k != "_placeholder_" and isinstance(v, dict)}
+    if not questions:
+        raise ValueError("There are no questions to publish.")
+    bundle = {qid: {k: v for k, v in q.items() if k != "answer"} for qid, q in questions.items()}
+    answers = {qid: q.get("answer") for qid, q in questions.items()}
+
+    version = db.reference(f"{question_cache.meta_path(batch, subject)}/paper_counter").transaction(
+        lambda v: (v or 0) + 1)
+    now = int(time.time())
+    blob = encode(bundle, settings.section("papers", DEFAULTS)["compress"])
+    blob.update(count=len(bundle), published_at=now)
+    db.reference().update({
+        paper_path(batch, subject, version): blob,
+        key_path(batch, subject, version): answers,
+        published_path(batch, subject): {
+            "version": version,
+            "source_version": meta.get("version", 0),
+            "at": now
+        }
+    })
+    question_cache.invalidate(batch, subject)
+    return version
+
+
+def unpublish(batch: str, subject: str):
+    """Send new exams back to the live question bank (published versions are kept)."""
+    db.reference(published_path(batch, subject)).delete()
+    question_cache.invalidate(batch, subject)
+
+
+def published(batch: str, subject: str) -> dict:
+    """meta/published for the subject, or {} when students read the live bank."""
+    return question_cache.get_meta(batch, subject).get("published") or {}
+
+
+def published_version(batch: str, subject: str):
+    return published(batch, subject).get("version")
+
+
+class _Forever:
+    """LRU of values that never change once written (keyed by version)."""
+
+    def __init__(self, load, max_entries=MAX_PAPERS):
+        self._load = load
+        self._max = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, *key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        value = self._load(*key)
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self._max:
+                self._entries.popitem(last=False)
+        return value
+
+
+def _load_bundle(batch, subject, version):
+    def load():
+        blob = db.reference(paper_path(batch, subject, version)).get()
+        return decode(blob) if blob else {}
+    return shared_cache.fetch(paper_path(batch, subject, version), load)
+
+
+def _load_key(batch, subject, version, fixes):
+    path = key_path(batch, subject, version)
+    return shared_cache.fetch(path, lambda: db.reference(path).get() or {}, version=fixes)
+
+
+_bundles = _Forever(_load_bundle)
+_keys = _Forever(_load_key)
+
+
+def get_bundle(batch: str, subject: str, version: int) -> dict:
+    """{qid: question without answer} for a published version. Read-only."""
+    return _bundles.get(batch, subject, int(version))
+
+
+def get_answer_key(batch: str, subject: str, version: int) -> dict:
+    fixes = question_cache.get_meta(batch, subject).get("key_fixes", 0)
+    return _keys.get(batch, subject, int(version), fixes)
+
+
+def correct_key(batch: str, subject: str, version: int, answers: dict):
+    """Patch {qid: correct option} into a published version's key."""
+    changes = {f"{key_path(batch, subject, version)}/{qid}": a for qid, a in answers.items()}
+    changes[f"{question_cache.meta_path(batch, subject)}/key_fixes"] = increment(1)
+    db.reference().update(changes)
+    question_cache.invalidate(batch, subject)
+
+
+def load_questions(batch: str, subject: str, version=None, qids=None) -> dict:
+    """Questions from a published version, or the live bank when version is None.
+
+    With qids, only those questions (in that order). Published bundles have no
+    answers; live questions do. Read-only.
+    """
+    if version is None:
+        if qids is None:
+            return question_cache.get_questions(batch, subject)
+        return question_cache.get_subset(batch, subject, qids)
+    bundle = get_bundle(batch, subject, version)
+    if qids is None:
+        return bundle
+    return {qid: bundle[qid] for qid in qids if qid in bundle}
+
+
+def load_graded(batch: str, subject: str, version, qids) -> dict:
+    """Like load_questions(qids=...) but with each question's answer."""
+    if version is None:
+        return question_cache.get_subset(batch, subject, qids)
+    key = get_answer_key(batch, subject, version)
+    return {qid: dict(q, answer=key.get(qid))
+            for qid, q in load_questions(batch, subject, version, qids).items()}
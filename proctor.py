@@ -0,0 +1,207 @@
+import threading
+import time
+import weakref
+from collections import Counter, deque
+
+import settings
+from firebase_config import db
+
+# ----------------- Live Proctor Monitor -----------------
+# One Monitor per (batch, subject) per process holds two RTDB listeners:
+#   drafts/{b}/{s}           who has started and how far they are (autosave.py)
+#   scores/{b}/{s}/students  who has submitted and their score (scores.py)
+# The listeners keep an in-memory mirror of both nodes up to date from the
+# change events RTDB streams, and each change is fanned out as a small
+# per-student update to every teacher session watching that subject. Teacher
+# sessions only read the mirror and their own update queue, so a room of
+# proctors costs two listeners, not a read per session per refresh.
+# A monitor closes its listeners once no session is subscribed any more.
+
+DEFAULTS = {
+    "refresh_seconds": 2,  # how often a teacher's dashboard redraws from memory
+    "feed_size": 20,       # recent updates kept per teacher session
+}
+
+STARTED, SUBMITTED, GONE = "in progress", "submitted", "gone"
+
+
+def config() -> dict:
+    return settings.section("proctor", DEFAULTS)
+
+
+def _split(path):
+    return [p for p in (path or "").split("/") if p]
+
+
+def _apply(tree: dict, segs: list, data) -> dict:
+    """Write `data` at `segs` inside a mirrored node; returns the (new) root."""
+    if not segs:
+        return data if isinstance(data, dict) else {}
+    node = tree
+    for s in segs[:-1]:
+        child = node.get(s)
+        if not isinstance(child, dict):
+            child = node[s] = {}
+        node = child
+    if data is None:
+        node.pop(segs[-1], None)
+    else:
+        node[segs[-1]] = data
+    return tree
+
+
+class Subscription:
+    """One teacher session's view: recent updates plus the shared summary."""
+
+    def __init__(self, monitor, feed_size):
+        self._monitor = monitor
+        self._updates = deque(maxlen=feed_size)
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def push(self, updates: list):
+        with self._lock:
+            self._updates.extend(updates)
+
+    def drain(self) -> list:
+        """Updates published since the last drain, oldest first."""
+        with self._lock:
+            updates = list(self._updates)
+            self._updates.clear()
+        return updates
+
+    def summary(self) -> dict:
+        return self._monitor.summary()
+
+    def close(self):
+        self.closed = True
+        self._monitor.unsubscribe(self)
+
+
+class Monitor:
+    def __init__(self, batch: str, subject: str):
+        self.batch, self.subject = batch, subject
+        self._lock = threading.Lock()
+        self._drafts = {}
+        self._scores = {}
+        self._ready = set()
+        self._last = {}  # name -> last published state, so repeats aren't re-sent
+        self._subscribers = weakref.WeakSet()  # sessions that end are dropped by GC
+        self._registrations = []
+
+    def start(self):
+        self._registrations = [
+            db.reference(f"drafts/{self.batch}/{self.subject}").listen(
+                lambda e: self._on_event("drafts", e)),
+            db.reference(f"scores/{self.batch}/{self.subject}/students").listen(
+                lambda e: self._on_event("scores", e)),
+        ]
+
+    # -- listener side (RTDB's background threads) --
+    def _on_event(self, source: str, event):
+        segs = _split(event.path)
+        if event.event_type == "patch":
+            changes = [(segs + _split(k), v) for k, v in (event.data or {}).items()]
+        else:
+            changes = [(segs, event.data)]
+        with self._lock:
+            tree = self._drafts if source == "drafts" else self._scores
+            for path, data in changes:
+                tree = _apply(tree, path, data)
+            if source == "drafts":
+                self._drafts = tree
+            else:
+                self._scores = tree
+            first = source not in self._ready
+            self._ready.add(source)
+            names = {p[0] for p, _ in changes if p}
+            updates = [u for u in map(self._student, sorted(names)) if u]
+            if first or any(not p for p, _ in changes):
+                updates.append({"kind": "snapshot", "source": source})
+        self._publish(updates)
+
+    def _student(self, name: str) -> dict:
+        update = {"kind": "student", "name": name, "at": time.time()}
+        score = self._scores.get(name)
+        draft = self._drafts.get(name)
+        if isinstance(score, dict):
+            update.update(status=SUBMITTED, score=score.get("score"), total=score.get("total"))
+        elif isinstance(draft, dict):
+            update.update(status=STARTED, answered=len(draft.get("answers") or {}),
+                          total=len(draft.get("order") or []))
+        else:
+            update.update(status=GONE)
+        state = tuple(v for k, v in update.items() if k != "at")
+        if self._last.get(name) == state:
+            return None
+        self._last[name] = state
+        return update
+
+    def _publish(self, updates: list):
+        subscribers = list(self._subscribers)
+        if not subscribers:
+            self._close_if_idle()
+            return
+        for sub in subscribers:
+            sub.push(updates)
+
+    # -- session side --
+    def subscribe(self, feed_size: int) -> Subscription:
+        sub = Subscription(self, feed_size)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        self._subscribers.discard(sub)
+        self._close_if_idle()
+
+    def _close_if_idle(self):
+        with _monitors_lock:
+            if len(self._subscribers) or _monitors.get((self.batch, self.subject)) is not self:
+                return
+            del _monitors[(self.batch, self.subject)]
+        # not on the listener's own thread: closing a registration joins it
+        threading.Thread(target=self.close, daemon=True, name="proctor-close").start()
+
+    def summary(self) -> dict:
+        """{"ready", "started", "submitted", "in_progress": [rows], "hist": {score: n}}."""
+        with self._lock:
+            scores = {n: s for n, s in self._scores.items() if isinstance(s, dict)}
+            drafts = {n: d for n, d in self._drafts.items() if isinstance(d, dict)}
+            in_progress = [{"name": n,
+                            "answered": len(d.get("answers") or {}),
+                            "total": len(d.get("order") or []),
+                            "updated": d.get("updated", 0)}
+                           for n, d in sorted(drafts.items()) if n not in scores]
+            return {
+                "ready": len(self._ready) == 2,
+                "started": len(set(drafts) | set(scores)),
+                "submitted": len(scores),
+                "in_progress": in_progress,
+                "hist": dict(Counter(s.get("score", 0) for s in scores.values())),
+            }
+
+    def close(self):
+        for registration in self._registrations:
+            try:
+                registration.close()
+            except Exception:
+                pass
+        self._registrations = []
+
+
+_monitors = {}  # (batch, subject) -> Monitor
+_monitors_lock = threading.Lock()
+
+
+def subscribe(batch: str, subject: str) -> Subscription:
+    """Watch a subject; starts its listeners if no session in this process is watching yet."""
+    with _monitors_lock:
+        monitor = _monitors.get((batch, subject))
+        is_new = monitor is None
+        if is_new:
+            monitor = _monitors[(batch, subject)] = Monitor(batch, subject)
+        sub = monitor.subscribe(config()["feed_size"])
+    if is_new:
+        monitor.start()
+    return sub
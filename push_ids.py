@@ -0,0 +1,42 @@
+import random
+import threading
+import time
+
+# ----------------- Push IDs -----------------
+# Same format as the keys RTDB's push() creates: 8 chars of millisecond
+# timestamp then 12 random chars, in an alphabet that sorts in ASCII order, so
+# keys sort by creation time. IDs made within the same millisecond increment
+# the random part instead of re-rolling it, keeping them ordered and unique.
+# Generating them locally lets a whole set of new children go out in one
+# multi-path update instead of a push() round trip each.
+
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+
+
+class PushIdGenerator:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._last_rand = []
+
+    def __call__(self) -> str:
+        with self._lock:
+            now = int(time.time() * 1000)
+            if now == self._last_ms and self._last_rand:
+                i = 11
+                while self._last_rand[i] == 63:
+                    self._last_rand[i] = 0
+                    i -= 1
+                self._last_rand[i] += 1
+            else:
+                self._last_rand = [random.randrange(64) for _ in range(12)]
+            self._last_ms = now
+            rand = list(self._last_rand)
+        stamp = []
+        for _ in range(8):
+            stamp.append(PUSH_CHARS[now % 64])
+            now //= 64
+        return "".join(reversed(stamp)) + "".join(PUSH_CHARS[r] for r in rand)
+
+
+new_push_id = PushIdGenerator()
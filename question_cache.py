@@ -0,0 +1,201 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import question_index
+import shared_cache
+from firebase_config import db, increment
+
+# ----------------- Question Set Cache -----------------
+# One copy of each subject's questions per server process, shared by every
+# Streamlit session. Entries are stamped with batches/{b}/{s}/meta/version;
+# the teacher panel bumps that counter on add/edit/delete, so students only
+# re-download a question set after it actually changed. The small meta node
+# (version plus per-subject exam settings) is re-read at most every
+# META_TTL seconds.
+#
+# Sampled papers (K of a large bank) don't need the whole set: subset() reads
+# just the questions asked for, in parallel, and keeps them in a per-question
+# LRU under the same version stamp, so a class drawing from one bank mostly
+# hits questions someone else already fetched.
+#
+# With [shared_cache] on, misses here try the host-wide SQLite tier before
+# RTDB, so the other workers on the host reuse what one of them downloaded.
+
+MAX_SUBJECTS = 64     # LRU bound on cached question sets
+MAX_ITEMS = 20_000    # LRU bound on individually cached questions
+META_TTL = 15         # seconds a looked-up meta node is trusted
+FETCH_WORKERS = 16    # parallel reads when fetching a subset
+
+
+def meta_path(batch: str, subject: str) -> str:
+    return f"batches/{batch}/{subject}/meta"
+
+
+def version_path(batch: str, subject: str) -> str:
+    return f"{meta_path(batch, subject)}/version"
+
+
+def questions_path(batch: str, subject: str) -> str:
+    return f"batches/{batch}/{subject}/questions"
+
+
+class QuestionCache:
+    def __init__(self, max_entries=MAX_SUBJECTS, meta_ttl=META_TTL, max_items=MAX_ITEMS):
+        self.max_entries = max_entries
+        self.max_items = max_items
+        self.meta_ttl = meta_ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (batch, subject) -> (version, questions)
+        self._items = OrderedDict()    # (batch, subject, qid) -> (version, question)
+        self._meta = {}                # (batch, subject) -> (meta, checked_at)
+        self._pool = None
+
+    def meta(self, batch: str, subject: str) -> dict:
+        key = (batch, subject)
+        with self._lock:
+            cached = self._meta.get(key)
+        if cached and time.monotonic() - cached[1] < self.meta_ttl:
+            return cached[0]
+        meta = shared_cache.fetch(meta_path(batch, subject),
+                                  lambda: db.reference(meta_path(batch, subject)).get() or {},
+                                  ttl=self.meta_ttl)
+        with self._lock:
+            self._meta[key] = (meta, time.monotonic())
+        return meta
+
+    def get(self, batch: str, subject: str) -> dict:
+        """Questions for a subject (placeholders removed). Treat as read-only."""
+        key = (batch, subject)
+        version = self.meta(batch, subject).get("version", 0)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        questions = shared_cache.fetch(questions_path(batch, subject),
+                                       lambda: self._download(batch, subject), version)
+        self._store(key, version, questions)
+        return questions
+
+    def _store(self, key, version, questions):
+        with self._lock:
+            self._entries[key] = (version, questions)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _download(batch: str, subject: str) -> dict:
+        questions = db.reference(questions_path(batch, subject)).get() or {}
+        return {k: v for k, v in questions.items() if k != "_placeholder_"}
+
+    def subset(self, batch: str, subject: str, qids) -> dict:
+        """{qid: question} for the given qids, in order; deleted ones are left out."""
+        key = (batch, subject)
+        version = self.meta(batch, subject).get("version", 0)
+        found, missing = {}, []
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == version:
+                self.hits += 1
+                return {qid: entry[1][qid] for qid in qids if qid in entry[1]}
+            for qid in qids:
+                item = self._items.get((batch, subject, qid))
+                if item and item[0] == version:
+                    self._items.move_to_end((batch, subject, qid))
+                    found[qid] = item[1]
+                else:
+                    missing.append(qid)
+            self.hits += len(found)
+            self.misses += len(missing)
+
+        if missing:
+            shared = shared_cache.get(questions_path(batch, subject), version)
+            if shared is not shared_cache.MISS:
+                # another worker on this host already has the whole set
+                self._store(key, version, shared)
+                return {qid: shared[qid] for qid in qids if qid in shared}
+            path = questions_path(batch, subject)
+            fetched = self._fetch_pool().map(lambda qid: db.reference(f"{path}/{qid}").get(), missing)
+            with self._lock:
+                for qid, q in zip(missing, fetched):
+                    if q is None:
+                        continue
+                    found[qid] = q
+                    self._items[(batch, subject, qid)] = (version, q)
+                    self._items.move_to_end((batch, subject, qid))
+                while len(self._items) > self.max_items:
+                    self._items.popitem(last=False)
+        return {qid: found[qid] for qid in qids if qid in found}
+
+    def _fetch_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(FETCH_WORKERS, thread_name_prefix="question-fetch")
+            return self._pool
+
+    def invalidate(self, batch: str, subject: str):
+        with self._lock:
+            self._entries.pop((batch, subject), None)
+            self._meta.pop((batch, subject), None)
+            # per-question entries are dropped lazily by their version stamp
+        # so other workers pick up the new version without waiting out meta_ttl
+        shared_cache.drop(meta_path(batch, subject))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+_cache = QuestionCache()
+
+
+def get_questions(batch: str, subject: str) -> dict:
+    return _cache.get(batch, subject)
+
+
+def get_subset(batch: str, subject: str, qids) -> dict:
+    """Just these questions, from the cached set if present. Read-only."""
+    return _cache.subset(batch, subject, qids)
+
+
+def get_meta(batch: str, subject: str) -> dict:
+    """Cached meta node for a subject (version and exam settings). Read-only."""
+    return _cache.meta(batch, subject)
+
+
+def count_path(batch: str, subject: str) -> str:
+    return f"counts/{batch}/{subject}/questions"
+
+
+def bump_version(batch: str, subject: str, added: int = 0):
+    """Call after any change to a subject's questions.
+
+    `added` is the net number of questions added (negative for deletes); it
+    keeps counts/{b}/{s}/questions current. The draw index for sampled papers
+    is rebuilt from the changed bank and stored under the new version in the
+    same write, so students only ever read it.
+    """
+    version = db.reference(version_path(batch, subject)).transaction(lambda v: (v or 0) + 1)
+    _cache.invalidate(batch, subject)
+    index = question_index.build(_cache.get(batch, subject))
+    index["version"] = version
+    changes = {question_index.index_path(batch, subject): index}
+    if added:
+        changes[count_path(batch, subject)] = increment(added)
+    db.reference().update(changes)
+
+
+def invalidate(batch: str, subject: str):
+    _cache.invalidate(batch, subject)
+
+
+def stats() -> dict:
+    return _cache.stats()
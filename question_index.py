@@ -0,0 +1,125 @@
+import random
+import threading
+
+import papers
+import question_cache
+from firebase_config import db
+
+# ----------------- Question Index (sampled papers) -----------------
+# For "K of N" papers a student needs only the IDs of the bank to draw from,
+# not the bank itself. batches/{b}/{s}/index holds
+#   {"version": v, "qids": [sorted qids],
+#    "strata": {"tag": [{"value": "algebra", "qids": [...]}, ...], "difficulty": [...]}}
+# written by question_cache.bump_version whenever a teacher changes the bank
+# (students only read it) and kept per process under that version. Until the
+# write lands, or for a bank last changed before indexes were stored, a
+# process builds its own copy from the cached bank without storing it. A
+# paper is draw(index, K, seed):
+# the same seed against the same index version gives the same questions in
+# the same order, so results store the seed and index version instead of
+# relying on the shuffle that happened in someone's browser session.
+# A published paper (papers.py) never changes, so its index is built from the
+# bundle in memory and never stored; draws from it reproduce exactly forever.
+
+STRATA = ("tag", "difficulty")
+
+
+def index_path(batch: str, subject: str) -> str:
+    return f"batches/{batch}/{subject}/index"
+
+
+def build(questions: dict) -> dict:
+    strata = {}
+    for dim in STRATA:
+        groups = {}
+        for qid in sorted(questions):
+            value = str(questions[qid].get(dim) or "").strip()
+            if value:
+                groups.setdefault(value, []).append(qid)
+        if groups:
+            strata[dim] = [{"value": v, "qids": q} for v, q in sorted(groups.items())]
+    return {"qids": sorted(questions), "strata": strata}
+
+
+_indexes = {}  # (batch, subject) or (batch, subject, "paper", version) -> index
+_lock = threading.Lock()
+
+
+def get_index(batch: str, subject: str, paper_version=None) -> dict:
+    """The index for a published paper version, or the live bank's current version."""
+    if paper_version is not None:
+        key = (batch, subject, "paper", paper_version)
+        with _lock:
+            cached = _indexes.get(key)
+        if cached is None:
+            cached = build(papers.get_bundle(batch, subject, paper_version))
+            cached["version"] = paper_version
+            with _lock:
+                _indexes[key] = cached
+        return cached
+
+    key = (batch, subject)
+    version = question_cache.get_meta(batch, subject).get("version", 0)
+    with _lock:
+        cached = _indexes.get(key)
+    if cached and cached["version"] == version:
+        return cached
+    stored = db.reference(index_path(batch, subject)).get()
+    if not stored or stored.get("version", 0) != version:
+        # not written for this version (yet): use the bank this process caches anyway
+        stored = build(question_cache.get_questions(batch, subject))
+        stored["version"] = version
+    stored.setdefault("qids", [])
+    stored.setdefault("strata", {})
+    with _lock:
+        _indexes[key] = stored
+    return stored
+
+
+def new_seed() -> int:
+    return random.SystemRandom().randrange(2 ** 31)
+
+
+def draw(index: dict, count: int, seed: int, stratify: str = "") -> list:
+    """K qids for one student, in paper order. count <= 0 means the whole bank."""
+    rng = random.Random(seed)
+    qids = index.get("qids") or []
+    if count <= 0 or count >= len(qids):
+        paper = list(qids)
+    elif stratify and index.get("strata", {}).get(stratify):
+        paper = _stratified(index["strata"][stratify], qids, count, rng)
+    else:
+        paper = rng.sample(qids, count)
+    rng.shuffle(paper)
+    return paper
+
+
+def _stratified(groups: list, qids: list, count: int, rng) -> list:
+    # questions without a value for the dimension form their own group
+    tagged = {q for g in groups for q in g["qids"]}
+    pools = [g["qids"] for g in groups] + [[q for q in qids if q not in tagged]]
+    pools = [p for p in pools if p]
+    # proportional allocation, remainders to the largest fractional parts
+    shares = [count * len(p) / len(qids) for p in pools]
+    take = [int(s) for s in shares]
+    for i in sorted(range(len(pools)), key=lambda i: shares[i] - take[i], reverse=True):
+        if sum(take) >= count:
+            break
+        if take[i] < len(pools[i]):
+            take[i] += 1
+    paper = []
+    for pool, n in zip(pools, take):
+        paper += rng.sample(pool, min(n, len(pool)))
+    return paper
+
+
+def reproduce(batch: str, subject: str, paper: dict) -> list:
+    """The qids a stored paper record ({version?, seed, count, stratify, index_version}) drew.
+
+    Always exact for a published version; for the live bank only while it is
+    still at index_version (None otherwise).
+    """
+    index = get_index(batch, subject, paper.get("version"))
+    if index["version"] != paper.get("index_version"):
+        return None
+    return draw(index, paper["count"], paper["seed"], paper.get("stratify", ""))
@@ -0,0 +1,167 @@
+"""Bulk question import and export.
+
+CSV columns are ``question, option1 .. option6, answer, tag, difficulty``
+(unused option columns left blank; tag and difficulty optional); ``answer``
+is the text of the correct option. JSON is a list of ``{"question",
+"options", "answer", "tag", "difficulty"}`` objects, or the ``{qid: {...}}``
+mapping the exporter writes.
+
+    python question_io.py export BCA2025 Python > python.csv
+    python question_io.py import BCA2026 Python python.csv
+"""
+import csv
+import io
+import json
+import sys
+
+import question_cache
+from firebase_config import db, iter_children
+from push_ids import new_push_id
+
+MIN_OPTIONS = 2
+MAX_OPTIONS = 6
+OPTIONAL_FIELDS = ("tag", "difficulty")  # used to stratify sampled papers
+CSV_HEADER = (["question"] + [f"option{i + 1}" for i in range(MAX_OPTIONS)] + ["answer"]
+              + list(OPTIONAL_FIELDS))
+EXPORT_CHUNK = 100  # questions per read when exporting
+
+
+def questions_path(batch: str, subject: str) -> str:
+    return f"batches/{batch}/{subject}/questions"
+
+
+# ----------------- Parsing -----------------
+def parse_csv(text: str) -> list:
+    """Rows as {"question", "options", "answer"}; trailing blank options dropped."""
+    rows = []
+    for rec in csv.DictReader(io.StringIO(text)):
+        rec = {(k or "").strip().lower(): (v or "").strip() for k, v in rec.items()
+               if not isinstance(v, list)}
+        options = [rec.get(f"option{i + 1}", "") for i in range(MAX_OPTIONS)]
+        while options and not options[-1]:
+            options.pop()
+        row = {"question": rec.get("question", ""), "options": options, "answer": rec.get("answer", "")}
+        row.update({f: rec.get(f, "") for f in OPTIONAL_FIELDS})
+        rows.append(row)
+    return rows
+
+
+def parse_json(text: str) -> list:
+    data = json.loads(text)
+    if isinstance(data, dict):
+        data = list(data.values())
+    if not isinstance(data, list):
+        raise ValueError("Expected a list of questions or a {qid: question} mapping.")
+    rows = []
+    for item in data:
+        item = item if isinstance(item, dict) else {}
+        options = item.get("options")
+        rows.append({
+            "question": str(item.get("question") or "").strip(),
+            "options": [str(o).strip() for o in options] if isinstance(options, list) else [],
+            "answer": str(item.get("answer") or "").strip(),
+            **{f: str(item.get(f) or "").strip() for f in OPTIONAL_FIELDS},
+        })
+    return rows
+
+
+def parse(filename: str, data: bytes) -> list:
+    text = data.decode("utf-8-sig")
+    return parse_json(text) if filename.lower().endswith(".json") else parse_csv(text)
+
+
+# ----------------- Import -----------------
+def validate(rows: list, existing_questions=()) -> tuple:
+    """Split rows into (valid, errors); errors are (row_number, message), 1-based."""
+    seen = {q.strip().lower() for q in existing_questions}
+    valid, errors = [], []
+    for n, row in enumerate(rows, start=1):
+        question, options, answer = row["question"], row["options"], row["answer"]
+        if not question:
+            errors.append((n, "question text is empty"))
+        elif question.lower() in seen:
+            errors.append((n, f"duplicate question: {question[:60]}"))
+        elif len(options) < MIN_OPTIONS or len(options) > MAX_OPTIONS:
+            errors.append((n, f"needs {MIN_OPTIONS}-{MAX_OPTIONS} options, got {len(options)}"))
+        elif not all(options):
+            errors.append((n, "an option is blank"))
+        elif len(set(options)) != len(options):
+            errors.append((n, "two options are identical"))
+        elif answer not in options:
+            errors.append((n, f"answer '{answer}' is not one of the options"))
+        else:
+            seen.add(question.lower())
+            q = {"question": question, "options": options, "answer": answer}
+            q.update({f: row[f] for f in OPTIONAL_FIELDS if row.get(f)})
+            valid.append(q)
+    return valid, errors
+
+
+def import_questions(batch: str, subject: str, rows: list) -> tuple:
+    """Validate against the current bank and write the valid rows in one update.
+
+    Returns (imported_count, errors).
+    """
+    existing = question_cache.get_questions(batch, subject)
+    valid, errors = validate(rows, [q["question"] for q in existing.values()])
+    if valid:
+        db.reference(questions_path(batch, subject)).update(
+            {new_push_id(): q for q in valid})
+        question_cache.bump_version(batch, subject, added=len(valid))
+    return len(valid), errors
+
+
+# ----------------- Export -----------------
+def iter_questions(batch: str, subject: str, chunk: int = EXPORT_CHUNK):
+    """Yield (qid, question) in push (creation) order, `chunk` per read."""
+    for qid, q in iter_children(questions_path(batch, subject), chunk):
+        if qid != "_placeholder_" and isinstance(q, dict):
+            yield qid, q
+
+
+def export_csv(batch: str, subject: str):
+    """CSV text, one chunk per question, header first."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(CSV_HEADER)
+    for _, q in iter_questions(batch, subject):
+        options = list(q.get("options") or [])[:MAX_OPTIONS]
+        writer.writerow([q.get("question", "")] + options + [""] * (MAX_OPTIONS - len(options))
+                        + [q.get("answer", "")] + [q.get(f, "") for f in OPTIONAL_FIELDS])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.getvalue():
+        yield buf.getvalue()
+
+
+def export_json(batch: str, subject: str):
+    """JSON {qid: question} text, one chunk per question."""
+    yield "{"
+    for i, (qid, q) in enumerate(iter_questions(batch, subject)):
+        item = {"question": q.get("question"), "options": q.get("options"), "answer": q.get("answer")}
+        item.update({f: q[f] for f in OPTIONAL_FIELDS if q.get(f)})
+        yield ("," if i else "") + "\n  " + json.dumps(qid) + ": " + json.dumps(item, ensure_ascii=False)
+    yield "\n}\n"
+
+
+def main(argv):
+    if len(argv) < 3 or argv[0] not in ("export", "import"):
+        sys.exit(__doc__)
+    command, batch, subject = argv[:3]
+    if command == "export":
+        fmt = argv[3] if len(argv) > 3 else "csv"
+        for chunk in (export_json if fmt == "json" else export_csv)(batch, subject):
+            sys.stdout.write(chunk)
+        return
+    if len(argv) < 4:
+        sys.exit(__doc__)
+    with open(argv[3], "rb") as f:
+        count, errors = import_questions(batch, subject, parse(argv[3], f.read()))
+    for n, message in errors:
+        print(f"row {n}: {message}", file=sys.stderr)
+    print(f"imported {count} questions, {len(errors)} rows rejected")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
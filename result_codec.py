@@ -0,0 +1,162 @@
+"""Compact result records.
+
+    results/{b}/{s}/{name} = {"name", "subject", "score", "total", "paper"?, "attempt_id"?,
+                              "qids": [qid, ...],    paper order
+                              "picks": "20-1?",      chosen option index per question
+                              "correct": "<base64>"} is-correct bitmap, paper order
+
+``picks`` has one character per question: the option's index ("0".."9",
+"a".."z"), "-" when skipped, "?" when the answer wasn't among the options.
+The human-readable review (question, chosen and correct option text) is
+rebuilt from the paper the student sat (the cached published bundle, else
+the live bank) only when someone opens it, so stored and downloaded results
+no longer grow with question length. Results stored before this keep their
+``details`` list and are read as before until migrated:
+
+    python result_codec.py migrate [BATCH [SUBJECT]]
+"""
+import base64
+import sys
+
+import numpy as np
+
+import papers
+from firebase_config import db, iter_children
+
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+SKIP, OTHER = "-", "?"
+LEGACY_BANK = "questions"  # student.py's questions/{batch}/{subject} list
+MIGRATE_CHUNK = 200  # results per read and per write when migrating
+
+
+def is_compact(record) -> bool:
+    return bool(record) and "picks" in record
+
+
+def pack_bits(flags) -> str:
+    return base64.b64encode(np.packbits(np.asarray(flags, dtype=bool)).tobytes()).decode("ascii")
+
+
+def unpack_bits(text: str, n: int) -> list:
+    raw = np.frombuffer(base64.b64decode(text or ""), dtype=np.uint8)
+    return [bool(b) for b in np.unpackbits(raw)[:n]] + [False] * max(0, n - 8 * len(raw))
+
+
+def pick_char(options: list, chosen) -> str:
+    if not chosen:
+        return SKIP
+    if chosen in options and options.index(chosen) < len(DIGITS):
+        return DIGITS[options.index(chosen)]
+    return OTHER
+
+
+def pick_index(ch: str):
+    """Option index for a picks character; None when skipped, -1 when not an option."""
+    if ch == SKIP:
+        return None
+    return DIGITS.index(ch) if ch in DIGITS else -1
+
+
+def pack(details: list, options: dict) -> dict:
+    """The compact fields for graded `details`; `options` is {qid: option list}."""
+    return {
+        "qids": [d["qid"] for d in details],
+        "picks": "".join(pick_char(options.get(d["qid"]) or [], d.get("your_answer")) for d in details),
+        "correct": pack_bits([d.get("is_correct") for d in details]),
+    }
+
+
+def _paper(batch: str, subject: str, record: dict) -> dict:
+    """{qid: question with answer} for the paper a compact record was graded on."""
+    if record.get("bank") == LEGACY_BANK:
+        questions = db.reference(f"{LEGACY_BANK}/{batch}/{subject}").get() or []
+        if isinstance(questions, dict):
+            return questions
+        return {str(i): q for i, q in enumerate(questions) if q}
+    version = (record.get("paper") or {}).get("version")
+    return papers.load_graded(batch, subject, version, record.get("qids") or [])
+
+
+def details(batch: str, subject: str, record: dict) -> list:
+    """The per-question review of a result, rebuilt from the paper for compact records."""
+    if not is_compact(record):
+        return (record or {}).get("details") or []
+    qids = record.get("qids") or []
+    questions = _paper(batch, subject, record)
+    flags = unpack_bits(record.get("correct"), len(qids))
+    out = []
+    for qid, ch, ok in zip(qids, record["picks"], flags):
+        q = questions.get(qid) or {}
+        options = q.get("options") or []
+        index = pick_index(ch)
+        if index is None:
+            chosen = ""
+        elif 0 <= index < len(options):
+            chosen = options[index]
+        else:
+            chosen = "(not an option)"
+        out.append({
+            "qid": qid,
+            "question": q.get("question", "(question removed)"),
+            "your_answer": chosen,
+            "correct_answer": q.get("answer"),
+            "is_correct": ok
+        })
+    return out
+
+
+# ----------------- Migration -----------------
+def compact(batch: str, subject: str, record: dict, live: dict):
+    """A legacy record in compact form, or None if a question can't be matched."""
+    version = (record.get("paper") or {}).get("version")
+    paper = papers.load_questions(batch, subject, version) if version is not None else live
+    by_text = {q.get("question"): qid for qid, q in paper.items()}
+    old = record.get("details") or []
+    matched = [dict(d, qid=d.get("qid") or by_text.get(d.get("question"))) for d in old]
+    if any(d["qid"] not in paper for d in matched):
+        return None
+    new = {k: v for k, v in record.items() if k != "details"}
+    new.update(pack(matched, {qid: q.get("options") or [] for qid, q in paper.items()}))
+    return new
+
+
+def migrate(batch: str, subject: str, chunk: int = MIGRATE_CHUNK) -> tuple:
+    """Rewrite a subject's legacy results compactly, `chunk` at a time.
+
+    Each chunk is read, converted and written back with one multi-path
+    update, so memory stays flat however many results there are. Returns
+    (converted, left_as_is).
+    """
+    live = papers.load_questions(batch, subject)
+    converted = kept = 0
+    changes = {}
+    for name, record in iter_children(f"results/{batch}/{subject}", chunk):
+        if not isinstance(record, dict) or is_compact(record):
+            continue
+        new = compact(batch, subject, record, live)
+        if new is None:
+            kept += 1
+            continue
+        changes[f"results/{batch}/{subject}/{name}"] = new
+        converted += 1
+        if len(changes) >= chunk:
+            db.reference().update(changes)
+            changes = {}
+    if changes:
+        db.reference().update(changes)
+    return converted, kept
+
+
+def main(argv):
+    if not argv or argv[0] != "migrate":
+        sys.exit(__doc__)
+    batches = argv[1:2] or list(db.reference("results").get(shallow=True) or {})
+    for batch in batches:
+        subjects = argv[2:3] or list(db.reference(f"results/{batch}").get(shallow=True) or {})
+        for subject in subjects:
+            converted, kept = migrate(batch, subject)
+            print(f"{batch}/{subject}: {converted} converted, {kept} left as is")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,203 @@
+import logging
+import math
+import statistics
+import time
+
+import result_codec
+import shared_cache
+from firebase_config import db, increment, iter_children
+
+# ----------------- Score Summary -----------------
+# results/{b}/{s}/{name} holds the full answer review for each student, which
+# is far too much to read just to list who scored what. Every submission also
+# writes a small row and folds it into running aggregates:
+#   scores/{b}/{s}/students/{name} = {"score": 7, "total": 10, "at": epoch_seconds}
+#   scores/{b}/{s}/stats           = {"count": n, "sum": sum_of_scores,
+#                                     "hist": {floor(score): students},
+#                                     "fine": {score in hundredths: students}}
+# The row and the aggregates go in one multi-path update of server-side
+# increments, so a class submitting together never contends on a transaction.
+# `hist` feeds the chart and `fine` the median (exact to 0.01 marks). If the
+# write fails the stats are flagged stale for the teacher to rebuild.
+# The teacher view pages through `students` by key and reads the details of
+# one student only when asked. Workers on one host share stats and page reads
+# for [shared_cache] summary_ttl seconds; writes here drop the shared copy.
+
+PAGE_SIZE = 25
+
+log = logging.getLogger(__name__)
+
+
+def summary_path(batch: str, subject: str) -> str:
+    return f"scores/{batch}/{subject}"
+
+
+def _histogram(hist) -> dict:
+    # RTDB hands back {"0": a, "1": b, ...} as a list when the keys are dense;
+    # buckets a regrade emptied stay behind as 0
+    if isinstance(hist, list):
+        return {str(i): n for i, n in enumerate(hist) if n}
+    return {k: n for k, n in (hist or {}).items() if n}
+
+
+def bucket(score) -> str:
+    """Histogram key for a score; fractional (partial or negative) marks round down."""
+    return str(math.floor(score))
+
+
+def fine_bucket(score) -> str:
+    """Median key for a score: hundredths of a mark (RTDB keys can't hold ".")."""
+    return str(round(score * 100))
+
+
+def add_to_stats(stats: dict, score):
+    """Fold one score into a stats dict being rebuilt in memory."""
+    stats["count"] = stats.get("count", 0) + 1
+    stats["sum"] = stats.get("sum", 0) + score
+    for field, key in (("hist", bucket(score)), ("fine", fine_bucket(score))):
+        counts = stats.setdefault(field, {})
+        counts[key] = counts.get(key, 0) + 1
+
+
+def _ttl() -> float:
+    return shared_cache.config()["summary_ttl"]
+
+
+def invalidate(batch: str, subject: str):
+    shared_cache.drop(summary_path(batch, subject))
+
+
+def record(batch: str, subject: str, name: str, score: int, total: int):
+    """Add one submission to the summary row list and the aggregates, in one write."""
+    base = summary_path(batch, subject)
+    try:
+        db.reference().update({
+            f"{base}/students/{name}": {
+                "score": score,
+                "total": total,
+                "at": int(time.time())
+            },
+            f"{base}/stats/count": increment(1),
+            f"{base}/stats/sum": increment(score),
+            f"{base}/stats/hist/{bucket(score)}": increment(1),
+            f"{base}/stats/fine/{fine_bucket(score)}": increment(1),
+        })
+    except Exception:
+        log.warning("score summary for %s/%s/%s not updated", batch, subject, name, exc_info=True)
+        mark_stale(batch, subject)
+    invalidate(batch, subject)
+
+
+def mark_stale(batch: str, subject: str):
+    """Flag the aggregates as missing a submission, so the teacher view offers a rebuild."""
+    try:
+        db.reference(f"{summary_path(batch, subject)}/stats/stale").set(True)
+    except Exception:
+        log.error("could not flag the score summary of %s/%s as stale", batch, subject,
+                  exc_info=True)
+
+
+def clear(batch: str, subject: str):
+    db.reference(summary_path(batch, subject)).delete()
+    invalidate(batch, subject)
+
+
+def _median(counts: dict, scale=1):
+    expanded = [score / scale for score, n in sorted(counts.items()) for _ in range(n)]
+    return statistics.median(expanded) if expanded else 0
+
+
+def get_stats(batch: str, subject: str):
+    """{"count", "mean", "median", "median_approx", "stale", "hist": {score: students}},
+    or None if empty. The median is approximate (floored buckets) for summaries
+    stored before `fine` existed; `stale` means a submission failed to add itself."""
+    path = f"{summary_path(batch, subject)}/stats"
+    data = shared_cache.fetch(path, lambda: db.reference(path).get(), ttl=_ttl())
+    if not data or not data.get("count"):
+        return None
+    hist = {int(k): n for k, n in _histogram(data.get("hist")).items()}
+    fine = {int(k): n for k, n in _histogram(data.get("fine")).items()}
+    approx = sum(fine.values()) != data["count"]
+    return {
+        "count": data["count"],
+        "mean": data.get("sum", 0) / data["count"],
+        "median": _median(hist) if approx else _median(fine, 100),
+        "median_approx": approx,
+        "stale": bool(data.get("stale")),
+        "hist": hist
+    }
+
+
+def get_page(batch: str, subject: str, after: str = None, page_size: int = PAGE_SIZE):
+    """Rows ordered by student name, starting after `after`.
+
+    Returns ([(name, row), ...], next_cursor); next_cursor is None on the last page.
+    """
+    def load():
+        query = db.reference(f"{summary_path(batch, subject)}/students").order_by_key()
+        if after is not None:
+            # start_at is inclusive, so fetch one extra row and drop the cursor
+            rows = list((query.start_at(after).limit_to_first(page_size + 2).get() or {}).items())
+            return [r for r in rows if r[0] != after]
+        return list((query.limit_to_first(page_size + 1).get() or {}).items())
+
+    key = f"{summary_path(batch, subject)}/pages/{page_size}/{after or ''}"
+    rows = [tuple(r) for r in shared_cache.fetch(key, load, ttl=_ttl())]
+    page = rows[:page_size]
+    next_cursor = page[-1][0] if len(rows) > page_size else None
+    return page, next_cursor
+
+
+def get_details(batch: str, subject: str, name: str) -> list:
+    """The answer review of one student, read only when a teacher opens it."""
+    record = db.reference(f"results/{batch}/{subject}/{name}").get() or {}
+    return result_codec.details(batch, subject, record)
+
+
+def _store_rows(batch: str, subject: str, rows: dict):
+    """Write one page of rebuilt rows and add them to the stats, in one update.
+
+    Rows already present were recorded by a submission since the rebuild began
+    (with their own increments), so they are left alone.
+    """
+    base = summary_path(batch, subject)
+    names = sorted(rows)
+    present = db.reference(f"{base}/students").order_by_key() \
+        .start_at(names[0]).end_at(names[-1]).get() or {}
+    stats = {}
+    changes = {}
+    for name in names:
+        if name in present:
+            continue
+        changes[f"{base}/students/{name}"] = rows[name]
+        add_to_stats(stats, rows[name]["score"])
+    if not changes:
+        return
+    changes[f"{base}/stats/count"] = increment(stats["count"])
+    changes[f"{base}/stats/sum"] = increment(stats["sum"])
+    for field in ("hist", "fine"):
+        for key, n in stats[field].items():
+            changes[f"{base}/stats/{field}/{key}"] = increment(n)
+    db.reference().update(changes)
+
+
+def rebuild(batch: str, subject: str, chunk: int = 200) -> int:
+    """Recreate the summary from results/{b}/{s} (for results stored before it existed).
+
+    The summary is cleared, then the results are read `chunk` at a time and each
+    page goes in as rows plus stats increments, so submissions landing meanwhile
+    keep theirs. Returns the number of results read.
+    """
+    clear(batch, subject)
+    rows = {}
+    n = 0
+    for name, r in iter_children(f"results/{batch}/{subject}", chunk):
+        rows[name] = {"score": r.get("score", 0), "total": r.get("total", 0), "at": 0}
+        n += 1
+        if len(rows) >= chunk:
+            _store_rows(batch, subject, rows)
+            rows = {}
+    if rows:
+        _store_rows(batch, subject, rows)
+    invalidate(batch, subject)
+    return n
@@ -0,0 +1,26 @@
+import os
+import tomllib
+from functools import lru_cache
+
+# ----------------- App Settings -----------------
+# SmartExam's own tables live in config.toml next to Streamlit's [server] and
+# [theme] sections. Missing file or keys fall back to the caller's defaults.
+
+CONFIG_PATH = os.environ.get(
+    "SMARTEXAM_CONFIG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.toml"))
+
+
+@lru_cache(maxsize=1)
+def _load() -> dict:
+    try:
+        with open(CONFIG_PATH, "rb") as f:
+            return tomllib.load(f)
+    except (OSError, tomllib.TOMLDecodeError):
+        return {}
+
+
+def section(name: str, defaults: dict) -> dict:
+    """Settings table `name`, with any missing keys taken from `defaults`."""
+    values = dict(defaults)
+    values.update(_load().get(name, {}))
+    return values
@@ -0,0 +1,178 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import settings
+
+# ----------------- Shared Cache (all workers on a host) -----------------
+# The in-process caches (question_cache, papers, catalog) only help the
+# Streamlit process that filled them; behind a load balancer every worker
+# would download the same question sets, papers and listings again. This tier
+# keeps them in one SQLite file (WAL mode, so readers never wait on the
+# writer) that every worker on the host opens:
+#   cache(key, version, value, stored)
+# An entry is only returned for the version it was stored under: question
+# sets carry batches/{b}/{s}/meta/version, which teacher writes bump, so a
+# change made through any worker retires the old copy everywhere. Entries
+# without a version counter (meta nodes, listings, score summaries) are
+# trusted for a ttl and dropped by key prefix when this app writes them.
+# Published papers never change and are stored for good. Any SQLite error
+# (locked, disk full, unreadable file) counts as a miss: the caller reads
+# RTDB as it would without this tier.
+
+DEFAULTS = {
+    "enabled": False,
+    "path": "shared_cache.sqlite3",  # relative to the app directory
+    "max_entries": 5000,             # oldest entries beyond this are pruned
+    "summary_ttl": 5,                # seconds a score summary read is shared
+}
+
+MISS = object()
+PRUNE_EVERY = 100  # puts between prunes
+
+_SCHEMA = """CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    version TEXT NOT NULL,
+    value TEXT NOT NULL,
+    stored REAL NOT NULL)"""
+
+
+def config() -> dict:
+    return settings.section("shared_cache", DEFAULTS)
+
+
+def enabled() -> bool:
+    return bool(config()["enabled"])
+
+
+class SharedCache:
+    def __init__(self, path: str, max_entries: int = DEFAULTS["max_entries"]):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._local = threading.local()  # one connection per thread
+        self._lock = threading.Lock()
+        self._puts = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key: str, version=None, ttl=None):
+        """The value stored under `key` for `version` (and younger than ttl seconds), else MISS."""
+        try:
+            row = self._conn().execute(
+                "SELECT version, value, stored FROM cache WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error:
+            self._count("errors")
+            return MISS
+        if (row is None or row[0] != _stamp(version)
+                or (ttl is not None and time.time() - row[2] > ttl)):
+            self._count("misses")
+            return MISS
+        self._count("hits")
+        return json.loads(row[1])
+
+    def put(self, key: str, value, version=None):
+        try:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO cache (key, version, value, stored) VALUES (?, ?, ?, ?)",
+                (key, _stamp(version), json.dumps(value, separators=(",", ":")), time.time()))
+        except (sqlite3.Error, TypeError, ValueError):
+            self._count("errors")
+            return
+        with self._lock:
+            self._puts += 1
+            prune = self._puts % PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    def fetch(self, key: str, load, version=None, ttl=None):
+        """Cached value for key/version, else load() and share it."""
+        value = self.get(key, version, ttl)
+        if value is MISS:
+            value = load()
+            self.put(key, value, version)
+        return value
+
+    def drop(self, prefix: str):
+        """Forget `prefix` and every key below it (e.g. "scores/B1/Maths")."""
+        try:
+            self._conn().execute("DELETE FROM cache WHERE key = ? OR key LIKE ? ESCAPE '\\'",
+                                 (prefix, _like(prefix) + "/%"))
+        except sqlite3.Error:
+            self._count("errors")
+
+    def prune(self):
+        try:
+            self._conn().execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY stored DESC "
+                "LIMIT -1 OFFSET ?)", (self.max_entries,))
+        except sqlite3.Error:
+            self._count("errors")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+
+def _stamp(version) -> str:
+    return "" if version is None else str(version)
+
+
+def _like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """The host's SharedCache, or None when [shared_cache] is off."""
+    global _cache
+    if not enabled():
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                cfg = config()
+                path = os.path.join(os.path.dirname(os.path.abspath(__file__)), cfg["path"])
+                _cache = SharedCache(path, cfg["max_entries"])
+    return _cache
+
+
+def fetch(key: str, load, version=None, ttl=None):
+    """load() through the shared cache when it is enabled."""
+    cache = get_cache()
+    return load() if cache is None else cache.fetch(key, load, version, ttl)
+
+
+def get(key: str, version=None, ttl=None):
+    cache = get_cache()
+    return MISS if cache is None else cache.get(key, version, ttl)
+
+
+def drop(prefix: str):
+    cache = get_cache()
+    if cache is not None:
+        cache.drop(prefix)
+
+
+def stats() -> dict:
+    cache = get_cache()
+    return cache.stats() if cache is not None else {}
@@ -1,34 +1,18 @@
 import streamlit as st
-import firebase_admin
-from firebase_admin import credentials, db
 import random
 import uuid  # ✅ for unique keys
 
-# Firebase Init
-if not firebase_admin._apps:
-    cred = credentials.Certificate({
-        "type": st.secrets["firebase"]["type"],
-        "project_id": st.secrets["firebase"]["project_id"],
-        "private_key_id": st.secrets["firebase"]["private_key_id"],
-        "private_key": st.secrets["firebase"]["private_key"],
-        "client_email": st.secrets["firebase"]["client_email"],
-        "client_id": st.secrets["firebase"]["client_id"],
-        "auth_uri": st.secrets["firebase"]["auth_uri"],
-        "token_uri": st.secrets["firebase"]["token_uri"],
-        "auth_provider_x509_cert_url": st.secrets["firebase"]["auth_provider_x509_cert_url"],
-        "client_x509_cert_url": st.secrets["firebase"]["client_x509_cert_url"],
-        "universe_domain": st.secrets["firebase"]["universe_domain"]
-    })
-    firebase_admin.initialize_app(cred, {
-        'databaseURL': "https://cvv-smartexam-v2-default-rtdb.asia-southeast1.firebasedatabase.app"
-    })
+import catalog
+import grading
+import result_codec
+import scores
+from firebase_config import db
 
 # UI
 st.title("🎓 CVV SmartExam - Student Panel")
 
 name = st.text_input("Enter your full name").strip()
-batch_data = db.reference("batches").get()
-batch_options = list(batch_data.keys()) if batch_data else []
+batch_options = catalog.list_batches()
 batch = st.selectbox("Select your batch", ["Select"] + batch_options)
 
 if name and batch != "Select":
@@ -50,37 +34,33 @@ if name and batch != "Select":
         st.subheader(f"📘 {subject} Exam")
         st.markdown("---")
 
-        # Randomize questions
-        random.shuffle(questions)
+        # Randomize questions (ids are positions in the stored list, for the compact result)
+        bank = {str(i): q for i, q in enumerate(questions) if q}
+        order = list(bank)
+        random.shuffle(order)
         user_answers = {}
 
-        for idx, q in enumerate(questions):
+        for idx, qid in enumerate(order):
+            q = bank[qid]
             question_id = str(uuid.uuid4())  # ✅ unique key to avoid reuse
             st.markdown(f"*Q{idx+1}. {q['question']}*")
-            user_choice = st.radio("Choose one:", q['options'], key=question_id)
-            user_answers[str(idx)] = {"question": q['question'], "selected": user_choice, "correct": q['answer']}
+            user_answers[qid] = st.radio("Choose one:", q['options'], key=question_id)
 
         if st.button("✅ Submit Exam"):
-            correct = sum(1 for i in user_answers if user_answers[i]['selected'] == user_answers[i]['correct'])
-            total = len(questions)
-            details = []
-
-            for ans in user_answers.values():
-                details.append({
-                    "question": ans["question"],
-                    "your_answer": ans["selected"],
-                    "correct_answer": ans["correct"],
-                    "is_correct": ans["selected"] == ans["correct"]
-                })
+            key = grading.compile_key(bank)
+            correct, total, details = grading.grade(key, user_answers, order)
 
             # ✅ Save result to Firebase
-            result_ref.set({
+            record = {
                 "name": name,
                 "subject": subject,
                 "score": correct,
                 "total": total,
-                "details": details
-            })
+                "bank": result_codec.LEGACY_BANK
+            }
+            record.update(result_codec.pack(details, {qid: q["options"] for qid, q in bank.items()}))
+            result_ref.set(record)
+            scores.record(batch, subject, name, correct, total)
 
             st.success(f"🎉 Exam submitted! You scored {correct} out of {total}.")
             st.balloons()
@@ -0,0 +1,111 @@
+import logging
+
+import grading
+import item_stats
+import papers
+import result_codec
+import scores
+from firebase_config import db, iter_children
+
+# ----------------- Exam Submission -----------------
+# The retake check reads results/{b}/{s}/{name} together with its ETag. Submit
+# then writes with set_if_unchanged(etag): one conditional PUT that both
+# claims the slot and stores the result, and fails if anything was written
+# there in between (double clicks, a second tab, another device).
+# A result carrying an attempt_id is idempotent per attempt: submitting the
+# same attempt again returns the stored result instead of being refused.
+
+log = logging.getLogger(__name__)
+
+
+def result_ref(batch: str, subject: str, name: str):
+    return db.reference(f"results/{batch}/{subject}/{name}")
+
+
+def check_existing(batch: str, subject: str, name: str):
+    """Return (existing_result, etag) for the retake check."""
+    return result_ref(batch, subject, name).get(etag=True)
+
+
+def iter_results(batch: str, subject: str, chunk: int = 50):
+    """Yield (name, result) for every stored result, `chunk` records per read."""
+    return iter_children(f"results/{batch}/{subject}", chunk)
+
+
+def score_answers(batch: str, subject: str, answers: dict, qids=None, paper_version=None):
+    """Grade answers {qid: chosen option} with the subject's marking rules.
+
+    `qids` is the paper as shown to the student; questions left unanswered
+    count as skipped. Defaults to the answered questions. With `paper_version`
+    the key is that published paper's, otherwise the live bank's.
+    """
+    qids = list(qids if qids is not None else answers)
+    key = grading.answer_key(batch, subject, paper_version, qids)
+    return grading.grade(key, answers, qids)
+
+
+def submit(batch: str, subject: str, name: str, record: dict, etag=None) -> bool:
+    """Store a result if none exists yet. Returns False if already submitted."""
+    ref = result_ref(batch, subject, name)
+    if etag is not None:
+        ok, _, _ = ref.set_if_unchanged(etag, record)
+        return ok
+
+    def claim(current):
+        if current:
+            raise _AlreadySubmitted()
+        return record
+
+    try:
+        ref.transaction(claim)
+    except _AlreadySubmitted:
+        return False
+    return True
+
+
+def submit_exam(batch: str, subject: str, name: str, student_name: str,
+                subject_label: str, answers: dict, etag=None, qids=None, paper=None,
+                attempt_id=None):
+    """Score and store an exam (compactly, see result_codec). Returns the stored
+    record, or None on a retake.
+
+    With `attempt_id`, a result already stored for that same attempt is
+    returned as-is (one extra read, only on a conflict), so retries and
+    replays are no-ops rather than retakes.
+
+    `paper` describes what the student sat: the published version graded
+    against and, for drawn papers, {seed, count, stratify, index_version} so
+    the paper can be re-drawn. It is kept with the result.
+    """
+    version = (paper or {}).get("version")
+    score, total, details = score_answers(batch, subject, answers, qids, version)
+    record = {
+        "name": student_name,
+        "subject": subject_label,
+        "score": score,
+        "total": total
+    }
+    options = papers.load_questions(batch, subject, version, [d["qid"] for d in details])
+    record.update(result_codec.pack(details, {qid: q.get("options") or [] for qid, q in options.items()}))
+    if paper:
+        record["paper"] = paper
+    if attempt_id:
+        record["attempt_id"] = attempt_id
+    if not submit(batch, subject, name, record, etag):
+        if attempt_id:
+            existing = result_ref(batch, subject, name).get()
+            if existing and existing.get("attempt_id") == attempt_id:
+                return existing
+        return None
+    # the result itself is stored; the teacher view can rebuild the summaries
+    scores.record(batch, subject, name, score, total)  # logs and flags its own failures
+    try:
+        item_stats.record(batch, subject, details, version)
+    except Exception:
+        log.warning("item statistics for %s/%s/%s not updated", batch, subject, name,
+                    exc_info=True)
+    return record
+
+
+class _AlreadySubmitted(Exception):
+    pass
@@ -0,0 +1,313 @@
+import collections
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+
+import settings
+import submission
+
+# ----------------- Write-Behind Submission Queue -----------------
+# When a whole class submits at the bell, each result write would otherwise
+# block a Streamlit script thread on RTDB. With [submission_queue] enabled the
+# submit button only appends the job to a local journal and hands it to a
+# worker pool, which writes it with retries and exponential backoff. Jobs
+# still in the journal when the process restarts are replayed on startup;
+# submission.submit_exam refuses to overwrite an existing result, so a
+# replay of an already-written job is harmless (and, with an attempt_id,
+# reports the stored result rather than a rejection).
+# A job that still fails after max_retries is marked FAILED and put back on
+# the queue every retry_failed_seconds, staying the student's pending
+# submission throughout (their draft and exam are already gone, so this is
+# the only copy of the answers besides the journal); after max_failed_rounds
+# it is moved to the dead-letter file ({journal}.dead) for an operator to
+# replay. Finished tickets are forgotten status_ttl_seconds after they finish.
+# The journal path is relative to the app directory, and the file is
+# compacted to the unfinished jobs every compact_every finished ones.
+
+log = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "enabled": False,
+    "workers": 8,
+    "max_retries": 6,
+    "backoff_seconds": 0.5,
+    "journal": "submission_journal.jsonl",
+    "retry_failed_seconds": 60,
+    "max_failed_rounds": 10,
+    "status_ttl_seconds": 600,
+    "compact_every": 1000,
+}
+
+# FAILED is retried later; DEAD went to the dead-letter file
+QUEUED, STORED, REJECTED, FAILED, DEAD = "queued", "stored", "rejected", "failed", "dead"
+
+
+class SubmissionQueue:
+    def __init__(self, workers=8, max_retries=6, backoff_seconds=0.5, journal=None,
+                 retry_failed_seconds=60, max_failed_rounds=10, status_ttl_seconds=600,
+                 compact_every=1000):
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.journal_path = journal
+        self.retry_failed_seconds = retry_failed_seconds
+        self.max_failed_rounds = max_failed_rounds
+        self.status_ttl_seconds = status_ttl_seconds
+        self.compact_every = compact_every
+        self._done_since_compact = 0
+        self._jobs = queue.Queue()
+        self._status = {}   # ticket -> {"state": ..., "result": ..., "job": ..., "rounds": n}
+        self._pending = {}  # (batch, subject, name) -> ticket
+        self._finished = collections.deque()  # (finished_at, ticket), oldest first
+        self._lock = threading.Lock()
+        self._journal_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._journal = None
+        self._written = self._synced = 0
+        self._replay_journal()
+        self._threads = [threading.Thread(target=self._work, daemon=True, name=f"submit-{i}")
+                         for i in range(workers)]
+        for t in self._threads:
+            t.start()
+
+    # -- journal --
+    def _append(self, entry: dict):
+        """Write one journal line and return once it is on disk.
+
+        Writers that arrive while an fsync is running are covered by the next
+        one (group commit), so a burst of submits shares a handful of fsyncs.
+        """
+        if not self.journal_path:
+            return
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._journal_lock:
+            if self._journal is None:
+                self._journal = open(self.journal_path, "a", encoding="utf-8")
+            self._journal.write(line)
+            self._journal.flush()
+            self._written += 1
+            seq = self._written
+        with self._sync_lock:
+            if self._synced >= seq:
+                return
+            with self._journal_lock:
+                upto = self._written
+            os.fsync(self._journal.fileno())
+            self._synced = upto
+
+    def _compact(self):
+        """Rewrite the journal with only the jobs that haven't finished."""
+        with self._lock:
+            unfinished = [(t, e["job"]) for t, e in self._status.items() if e["job"] is not None]
+        with self._sync_lock, self._journal_lock:
+            tmp = self.journal_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                for ticket, job in unfinished:
+                    f.write(json.dumps({"op": "enqueue", "ticket": ticket, "job": job},
+                                       separators=(",", ":")) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            if self._journal is not None:
+                self._journal.close()
+            os.replace(tmp, self.journal_path)
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+            self._synced = self._written
+            self._done_since_compact = 0
+
+    def _replay_journal(self):
+        if not self.journal_path or not os.path.exists(self.journal_path):
+            return
+        pending = {}
+        with open(self.journal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn last line from a crash mid-write
+                if entry.get("op") == "enqueue":
+                    pending[entry["ticket"]] = entry["job"]
+                else:
+                    pending.pop(entry.get("ticket"), None)
+        # rewrite with only the unfinished jobs so the file never grows unbounded
+        tmp = self.journal_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for ticket, job in pending.items():
+                f.write(json.dumps({"op": "enqueue", "ticket": ticket, "job": job},
+                                   separators=(",", ":")) + "\n")
+        os.replace(tmp, self.journal_path)
+        for ticket, job in pending.items():
+            self._track(ticket, job)
+            self._jobs.put((ticket, job))
+
+    def _dead_letter(self, ticket, job):
+        """Move a job that keeps failing out of the journal into {journal}.dead."""
+        log.error("submission %s for %s/%s/%s moved to the dead-letter file",
+                  ticket, job["batch"], job["subject"], job["name"])
+        if self.journal_path:
+            with self._journal_lock, open(self.journal_path + ".dead", "a", encoding="utf-8") as f:
+                f.write(json.dumps({"ticket": ticket, "job": job, "at": time.time()},
+                                   separators=(",", ":")) + "\n")
+        self._append({"op": "done", "ticket": ticket})
+
+    # -- queue --
+    def _track(self, ticket, job, rounds=0):
+        with self._lock:
+            self._status[ticket] = {"state": QUEUED, "result": None, "job": job, "rounds": rounds}
+            self._pending[(job["batch"], job["subject"], job["name"])] = ticket
+
+    def enqueue(self, batch, subject, name, student_name, subject_label, answers,
+                qids=None, paper=None, attempt_id=None) -> str:
+        """Journal a submission and return its ticket; the write happens later."""
+        job = {
+            "batch": batch, "subject": subject, "name": name,
+            "student_name": student_name, "subject_label": subject_label,
+            "answers": answers, "qids": qids, "paper": paper,
+            "attempt_id": attempt_id,
+        }
+        ticket = uuid.uuid4().hex
+        self._track(ticket, job)  # before journaling, so a compaction keeps it
+        self._append({"op": "enqueue", "ticket": ticket, "job": job})
+        self._jobs.put((ticket, job))
+        return ticket
+
+    def status(self, ticket: str) -> dict:
+        """State and result of a ticket; state None once it is unknown or expired."""
+        with self._lock:
+            self._expire()
+            return dict(self._status.get(ticket) or {"state": None, "result": None})
+
+    def _expire(self):
+        # caller holds self._lock
+        cutoff = time.time() - self.status_ttl_seconds
+        while self._finished and self._finished[0][0] <= cutoff:
+            _, ticket = self._finished.popleft()
+            entry = self._status.get(ticket)
+            if entry is not None and entry["job"] is None:  # not waiting for a retry
+                del self._status[ticket]
+
+    def tracked(self) -> int:
+        """Tickets whose status is still held in memory."""
+        with self._lock:
+            self._expire()
+            return len(self._status)
+
+    def pending_ticket(self, batch, subject, name):
+        """Ticket of a not-yet-written submission for this student, if any."""
+        with self._lock:
+            return self._pending.get((batch, subject, name))
+
+    def depth(self) -> int:
+        return self._jobs.qsize()
+
+    def join(self):
+        self._jobs.join()
+
+    def _finish(self, ticket, job, state, result=None):
+        if state == FAILED:
+            with self._lock:
+                entry = self._status[ticket]
+                entry["state"] = FAILED
+                entry["rounds"] += 1
+                rounds = entry["rounds"]
+            if rounds < self.max_failed_rounds:
+                # still the student's pending submission; try again later
+                timer = threading.Timer(self.retry_failed_seconds, self._retry_failed, (ticket, job))
+                timer.daemon = True
+                timer.start()
+                return
+            self._dead_letter(ticket, job)
+            state = DEAD
+        with self._lock:
+            entry = self._status[ticket]
+            entry.update(state=state, result=result)
+            entry["job"] = None  # the answers are no longer needed
+            key = (job["batch"], job["subject"], job["name"])
+            if self._pending.get(key) == ticket:
+                del self._pending[key]
+            self._finished.append((time.time(), ticket))
+            self._expire()
+            self._done_since_compact += 1
+            compact = self.journal_path and self._done_since_compact >= self.compact_every
+        if state != DEAD:
+            # after dropping the job, so a compaction in between can't keep it
+            self._append({"op": "done", "ticket": ticket})
+        if compact:
+            self._compact()
+
+    def _retry_failed(self, ticket, job):
+        """Queue a FAILED job again."""
+        with self._lock:
+            entry = self._status.get(ticket)
+            if entry is None or entry["state"] != FAILED:
+                return
+            entry["state"] = QUEUED
+        self._jobs.put((ticket, job))
+
+    def _work(self):
+        while True:
+            ticket, job = self._jobs.get()
+            try:
+                self._deliver(ticket, job)
+            finally:
+                self._jobs.task_done()
+
+    def _deliver(self, ticket, job):
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = submission.submit_exam(
+                    job["batch"], job["subject"], job["name"],
+                    job["student_name"], job["subject_label"], job["answers"],
+                    qids=job.get("qids"), paper=job.get("paper"),
+                    attempt_id=job.get("attempt_id"))
+            except Exception:
+                if attempt == self.max_retries:
+                    # left in the journal and retried after retry_failed_seconds
+                    log.warning("submission %s for %s/%s/%s failed %d times", ticket,
+                                job["batch"], job["subject"], job["name"], attempt + 1,
+                                exc_info=True)
+                    self._finish(ticket, job, FAILED)
+                    return
+                delay = self.backoff_seconds * (2 ** attempt)
+                time.sleep(delay + random.uniform(0, delay))
+                continue
+            if result is None:
+                self._finish(ticket, job, REJECTED)
+            else:
+                self._finish(ticket, job, STORED, result)
+            return
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def config() -> dict:
+    return settings.section("submission_queue", DEFAULTS)
+
+
+def enabled() -> bool:
+    return bool(config()["enabled"])
+
+
+def get_queue() -> SubmissionQueue:
+    """Process-wide queue, started on first use from [submission_queue]."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                cfg = config()
+                journal = cfg["journal"] and os.path.join(
+                    os.path.dirname(os.path.abspath(__file__)), cfg["journal"])
+                _queue = SubmissionQueue(workers=cfg["workers"],
+                                         max_retries=cfg["max_retries"],
+                                         backoff_seconds=cfg["backoff_seconds"],
+                                         journal=journal,
+                                         retry_failed_seconds=cfg["retry_failed_seconds"],
+                                         max_failed_rounds=cfg["max_failed_rounds"],
+                                         status_ttl_seconds=cfg["status_ttl_seconds"],
+                                         compact_every=cfg["compact_every"])
+    return _queue
@@ -1,121 +1,142 @@
 import streamlit as st
-import firebase_admin
-from firebase_admin import credentials, db
-
-if not firebase_admin._apps:
-    cred = credentials.Certificate({
-        "type": st.secrets["firebase"]["type"],
-        "project_id": st.secrets["firebase"]["project_id"],
-        "private_key_id": st.secrets["firebase"]["private_key_id"],
-        "private_key": st.secrets["firebase"]["private_key"],
-        "client_email": st.secrets["firebase"]["client_email"],
-        "client_id": st.secrets["firebase"]["client_id"],
-        "auth_uri": st.secrets["firebase"]["auth_uri"],
-        "token_uri": st.secrets["firebase"]["token_uri"],
-        "auth_provider_x509_cert_url": st.secrets["firebase"]["auth_provider_x509_cert_url"],
-        "client_x509_cert_url": st.secrets["firebase"]["client_x509_cert_url"],
-        "universe_domain": st.secrets["firebase"]["universe_domain"]
-    })
-    firebase_admin.initialize_app(cred, {
-        'databaseURL': "https://cvv-smartexam-v2-default-rtdb.asia-southeast1.firebasedatabase.app"
-    })
+
+import catalog
+import credentials
+import item_stats
+import question_cache
+import scores
+from firebase_config import db
+
 # 🌸 Streamlit Page Setup
 st.set_page_config(page_title="CVV SmartExam - Teacher Panel", page_icon="👩‍🏫", layout="centered")
 st.title("👩‍🏫 CVV SmartExam - Teacher Panel (Team Teaching Mode)")
 
-# 🔐 Login Section
-teacher_name = st.text_input("Enter your name").strip()
-teacher_pass = st.text_input("Enter your password", type="password")
-
-if teacher_name and teacher_pass:
-    ref = db.reference(f"teachers/{teacher_name}")
-    data = ref.get()
-
-    if data and data.get("password") == teacher_pass:
-        st.success(f"Welcome, {teacher_name}! 🌟")
-
-        # 🏫 Batch Section
-        st.header("🏫 Manage Batches & Subjects")
-        batch_data = db.reference("batches").get()
-        batch_options = list(batch_data.keys()) if batch_data else []
-        selected_batch = st.selectbox("Select Batch or Create New", ["➕ Create New"] + batch_options)
-
-        new_batch = ""
-        if selected_batch == "➕ Create New":
-            new_batch = st.text_input("Enter new batch name (e.g., BCA2025)").strip()
-            if st.button("Create Batch") and new_batch:
-                db.reference(f"batches/{new_batch}").set({})
-                st.success(f"✅ Batch '{new_batch}' created!")
+# 🔐 Login Section (password checked once, then a signed token in session state)
+teacher_name = credentials.check_token(st.session_state.get("teacher_token"))
+if not teacher_name:
+    with st.form("teacher_login"):
+        login_name = st.text_input("Enter your name").strip()
+        login_pass = st.text_input("Enter your password", type="password")
+        submitted = st.form_submit_button("🔑 Login")
+    if submitted and login_name and login_pass:
+        try:
+            if credentials.login(login_name, login_pass):
+                st.session_state["teacher_token"] = credentials.issue_token(login_name)
+                st.rerun()
+            st.error("Invalid name or password ❌")
+        except credentials.LockedOut as e:
+            st.error(f"🔒 {e}")
+
+if teacher_name:
+    st.success(f"Welcome, {teacher_name}! 🌟")
+
+    # 🏫 Batch Section
+    st.header("🏫 Manage Batches & Subjects")
+    batch_options = catalog.list_batches()
+    selected_batch = st.selectbox("Select Batch or Create New", ["➕ Create New"] + batch_options)
+
+    new_batch = ""
+    if selected_batch == "➕ Create New":
+        new_batch = st.text_input("Enter new batch name (e.g., BCA2025)").strip()
+        if st.button("Create Batch") and new_batch:
+            db.reference(f"batches/{new_batch}").set({})
+            catalog.invalidate()
+            st.success(f"✅ Batch '{new_batch}' created!")
+    else:
+        new_batch = selected_batch
+
+    if new_batch:
+        # 📚 Subject Section
+        subject_options = catalog.list_subjects(new_batch)
+        selected_subject = st.selectbox("Select Subject or Create New", ["➕ Create New"] + subject_options)
+
+        new_subject = ""
+        if selected_subject == "➕ Create New":
+            new_subject = st.text_input("Enter new subject name (e.g., Python)").strip()
+            if st.button("Create Subject") and new_subject:
+                db.reference(f"batches/{new_batch}/{new_subject}/questions").set({})
+                catalog.invalidate()
+                st.success(f"✅ Subject '{new_subject}' created!")
         else:
-            new_batch = selected_batch
-
-        if new_batch:
-            # 📚 Subject Section
-            subject_data = db.reference(f"batches/{new_batch}").get()
-            subject_options = list(subject_data.keys()) if subject_data else []
-            selected_subject = st.selectbox("Select Subject or Create New", ["➕ Create New"] + subject_options)
-
-            new_subject = ""
-            if selected_subject == "➕ Create New":
-                new_subject = st.text_input("Enter new subject name (e.g., Python)").strip()
-                if st.button("Create Subject") and new_subject:
-                    db.reference(f"batches/{new_batch}/{new_subject}/questions").set({})
-                    st.success(f"✅ Subject '{new_subject}' created!")
-            else:
-                new_subject = selected_subject
-
-            if new_subject:
-                st.subheader(f"📄 Managing: {new_batch} > {new_subject}")
-
-                # ➕ Add Question
-                st.markdown("### ➕ Add Question")
-                question = st.text_area("Enter Question").strip()
-                options = [st.text_input(f"Option {i+1}", key=f"opt_{i}") for i in range(4)]
-                correct = st.selectbox("Select Correct Answer", options)
-
-                if st.button("Add Question"):
-                    if question and all(options) and correct:
-                        q_ref = db.reference(f"batches/{new_batch}/{new_subject}/questions").push()
-                        q_ref.set({
-                            "question": question,
-                            "options": options,
-                            "answer": correct
-                        })
-                        st.success("✅ Question added!")
-                    else:
-                        st.error("❌ Please fill all fields before adding.")
-
-                # 👁 View Questions
-                st.markdown("### 👁 View & Manage Questions")
-                q_data = db.reference(f"batches/{new_batch}/{new_subject}/questions").get()
-
-                if q_data:
-                    for qid, qinfo in q_data.items():
-                        with st.expander(qinfo['question']):
-                            for i, opt in enumerate(qinfo['options']):
-                                st.write(f"- {opt}")
-                            st.markdown(f"✅ *Correct Answer:* {qinfo['answer']}")
-                            if st.button(f"🗑 Delete this question", key=qid):
-                                db.reference(f"batches/{new_batch}/{new_subject}/questions/{qid}").delete()
-                                st.warning("❌ Question deleted! Please refresh to update.")
-                else:
-                    st.info("No questions yet.")
-
-                # 📊 Results
-                st.markdown("### 📊 View Student Results")
-                result_ref = db.reference(f"results/{new_batch}/{new_subject}")
-                result_data = result_ref.get()
-
-                if result_data:
-                    for student, r in result_data.items():
-                        st.markdown(f"👤 {student} — Score: *{r['score']} / {r['total']}*")
+            new_subject = selected_subject
+
+        if new_subject:
+            st.subheader(f"📄 Managing: {new_batch} > {new_subject}")
+
+            # ➕ Add Question
+            st.markdown("### ➕ Add Question")
+            question = st.text_area("Enter Question").strip()
+            options = [st.text_input(f"Option {i+1}", key=f"opt_{i}") for i in range(4)]
+            correct = st.selectbox("Select Correct Answer", options)
+
+            if st.button("Add Question"):
+                if question and all(options) and correct:
+                    q_ref = db.reference(f"batches/{new_batch}/{new_subject}/questions").push()
+                    q_ref.set({
+                        "question": question,
+                        "options": options,
+                        "answer": correct
+                    })
+                    question_cache.bump_version(new_batch, new_subject, added=1)
+                    st.success("✅ Question added!")
                 else:
-                    st.info("No student results yet.")
-
-                # 🔁 Reset
-                if st.button("🔁 Reset Results for this Subject"):
-                    result_ref.delete()
-                    st.success("✅ Results cleared!")
-
-    else:
-        st.error("Invalid name or password ❌")
\ No newline at end of file
+                    st.error("❌ Please fill all fields before adding.")
+
+            # 👁 View Questions
+            st.markdown("### 👁 View & Manage Questions")
+            q_data = question_cache.get_questions(new_batch, new_subject)
+
+            if q_data:
+                for qid, qinfo in q_data.items():
+                    with st.expander(qinfo['question']):
+                        for i, opt in enumerate(qinfo['options']):
+                            st.write(f"- {opt}")
+                        st.markdown(f"✅ *Correct Answer:* {qinfo['answer']}")
+                        if st.button(f"🗑 Delete this question", key=qid):
+                            db.reference(f"batches/{new_batch}/{new_subject}/questions/{qid}").delete()
+                            question_cache.bump_version(new_batch, new_subject, added=-1)
+                            st.warning("❌ Question deleted! Please refresh to update.")
+            else:
+                st.info("No questions yet.")
+
+            # 📊 Results (summary rows, a page at a time)
+            st.markdown("### 📊 View Student Results")
+            stats = scores.get_stats(new_batch, new_subject)
+
+            if stats:
+                col1, col2, col3 = st.columns(3)
+                col1.metric("Students", stats["count"])
+                col2.metric("Mean", f"{stats['mean']:.1f}")
+                col3.metric("Median", f"{stats['median']:g}")
+                st.bar_chart({"Students": {str(k): n for k, n in sorted(stats["hist"].items())}})
+
+                cursors = st.session_state.setdefault(f"cursors_{new_batch}_{new_subject}", [None])
+                rows, next_cursor = scores.get_page(new_batch, new_subject, after=cursors[-1])
+                for student, r in rows:
+                    st.markdown(f"👤 {student} — Score: *{r['score']} / {r['total']}*")
+                    if st.toggle("Show answers", key=f"details_{student}"):
+                        for i, d in enumerate(scores.get_details(new_batch, new_subject, student)):
+                            mark = "✅" if d["is_correct"] else f"❌ (correct: {d['correct_answer']})"
+                            st.markdown(f"- Q{i+1}: {d['question']} — {d['your_answer']} {mark}")
+
+                col1, col2 = st.columns(2)
+                if col1.button("◀ Prev", disabled=len(cursors) == 1):
+                    cursors.pop()
+                    st.rerun()
+                if col2.button("Next ▶", disabled=next_cursor is None):
+                    cursors.append(next_cursor)
+                    st.rerun()
+            elif db.reference(f"results/{new_batch}/{new_subject}").get(shallow=True):
+                if st.button("🔄 Build Score Summary"):
+                    scores.rebuild(new_batch, new_subject)
+                    st.rerun()
+            else:
+                st.info("No student results yet.")
+
+            # 🔁 Reset
+            if st.button("🔁 Reset Results for this Subject"):
+                db.reference(f"results/{new_batch}/{new_subject}").delete()
+                scores.clear(new_batch, new_subject)
+                item_stats.clear(new_batch, new_subject)
+                st.session_state.pop(f"cursors_{new_batch}_{new_subject}", None)
+                st.success("✅ Results cleared!")